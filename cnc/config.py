@@ -35,9 +35,39 @@ TABLE_SIZE_X_MM = 200
 TABLE_SIZE_Y_MM = 200
 TABLE_SIZE_Z_MM = 220
 
+# Maximum acceleration of each axis, mm per sec^2. Acceleration along the
+# path of each movement is limited so that no axis exceeds its own limit.
+# STEPPER_MAX_ACCELERATION_MM_PER_S2 is the former limit for all axises, it is
+# kept as default, so existing configs work as before.
+STEPPER_MAX_ACCELERATION_MM_PER_S2 = 3000
+MAX_ACCELERATION_MM_PER_S2_X = STEPPER_MAX_ACCELERATION_MM_PER_S2
+MAX_ACCELERATION_MM_PER_S2_Y = STEPPER_MAX_ACCELERATION_MM_PER_S2
+MAX_ACCELERATION_MM_PER_S2_Z = STEPPER_MAX_ACCELERATION_MM_PER_S2
+MAX_ACCELERATION_MM_PER_S2_E = STEPPER_MAX_ACCELERATION_MM_PER_S2
+
+# Default acceleration along the path for printing, travel(G0) and
+# retract(extruder only) movements, mm per sec^2, M204 changes them.
+PRINT_ACCELERATION_MM_PER_S2 = 3000
+TRAVEL_ACCELERATION_MM_PER_S2 = 5000
+RETRACT_ACCELERATION_MM_PER_S2 = 6000
+
+# Time in which acceleration grows or falls linearly at the beginning and at
+# the end of acceleration and braking, as share of their time with constant
+# acceleration, i.e. 7 segments jerk limited S-curve profile. Zero means
+# trapezoid profile, 1 means that acceleration is never constant. Acceleration
+# never exceeds limits above, acceleration and braking take longer by this
+# share instead.
+S_CURVE_JERK_RATIO = 0.0
+
 # Mixed settings.
+# Length of step pulse, it can be fractional, it's rounded to ticks.
 STEPPER_PULSE_LENGTH_US = 2
-STEPPER_MAX_ACCELERATION_MM_PER_S2 = 3000  # for all axis, mm per sec^2
+# Resolution of pulses timing, number of ticks in each microsecond. Raspberry
+# Pi DMA is paced with PWM FIFO and each FIFO word is one tick, so value
+# should be a divider of 400, see DMAGPIO. FIFO is drained faster with higher
+# values and DMA should keep up with it. Control blocks of compiled jobs are
+# in ticks, compile jobs again after changing it.
+STEPPER_TICKS_PER_US = 4
 SPINDLE_MAX_RPM = 10000
 EXTRUDER_MAX_TEMPERATURE = 250
 BED_MAX_TEMPERATURE = 100
@@ -90,5 +120,47 @@ INSTANT_RUN = True
 # velocity.
 AUTO_VELOCITY_ADJUSTMENT = True
 
+# Calculate pulses of linear movements with integer DDA(Bresenham) in ticks
+# of DMA clock. Only the axis with the most pulses is timed with acceleration
+# curve, other axises make pulses together with it, so their pulses are moved
+# in time for less then one pulse interval of that axis. It is faster, mostly
+# when NumPy isn't installed.
+LINEAR_DDA = False
+
 # Automatically turn on fan when extruder is heating, boolean value.
 AUTO_FAN_ON = True
+
+# Number of linear movements which planner keeps in buffer to calculate
+# velocities on junctions between them. Zero disables planner, each movement
+# will start and finish with full stop.
+PLANNER_LOOKAHEAD_MOVES = 16
+# Junction deviation in millimeters, i.e. distance from the corner of path to
+# the arc which is passed with the same centripetal acceleration. Bigger values
+# allow faster cornering.
+PLANNER_JUNCTION_DEVIATION_MM = 0.02
+# Number of planned movements which wait in queue for motion thread, commands
+# are processed while movements are sent to hardware. Zero disables queue,
+# each command waits till its movements are sent.
+MOTION_QUEUE_SIZE = 32
+# Feed hold replaces pulses which DMA runs after this time with braking, it
+# should be enough to calculate braking. Lead time is doubled if DMA has
+# reached replaced pulses before they were replaced.
+FEED_HOLD_LEAD_TIME_MS = 20
+
+# Heating model for job time estimation(pycnc estimate). Heaters are supposed
+# to change temperature linearly with these rates in Celsius per second.
+ESTIMATOR_EXTRUDER_HEATING_C_PER_S = 2.0
+ESTIMATOR_BED_HEATING_C_PER_S = 0.5
+ESTIMATOR_COOLING_C_PER_S = 0.5
+ESTIMATOR_AMBIENT_TEMPERATURE = 25.0
+
+# Network server(pycnc serve) listens on these TCP address and port, and on
+# UNIX socket if path is not empty.
+SERVER_TCP_HOST = '0.0.0.0'
+SERVER_TCP_PORT = 5000
+SERVER_UNIX_SOCKET = '/tmp/pycnc.sock'
+
+# Serial host protocol(pycnc serial). Number of commands which host can send
+# ahead before they are run, and speed of serial port.
+SERIAL_QUEUE_SIZE = 8
+SERIAL_BAUD_RATE = 115200
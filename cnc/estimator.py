@@ -0,0 +1,561 @@
+""" Job time estimation without running machine. Gcode is parsed into
+    arrays, GMachine's state machine is replayed for each line to get
+    movements, and then time of all linear movements is calculated at once
+    with the same math which PulseGeneratorLinear uses in
+    _get_movement_parameters(), velocities on junctions are calculated like
+    in planner, with the same look-ahead window. No pulses are generated.
+    Heaters are modeled with linear heating and cooling, see ESTIMATOR_*
+    settings in config.
+"""
+
+from __future__ import division
+
+import math
+
+from cnc.config import *
+from cnc.coordinates import Coordinates
+from cnc.enums import *
+from cnc.gcode import GCode, SLOTS, MASK_COORDINATES, command_code
+from cnc.gmachine import GMachine, GMachineException
+from cnc.pulses import PulseGenerator, PulseGeneratorLinear, \
+    PulseGeneratorCircular, SECONDS_IN_MINUTE
+
+# NumPy is required for estimation, but not for the rest of project.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+G0, G1, G2, G3, G4, G17, G18, G19, G20, G21, G28, G53, G90, G91, G92 = (
+    command_code(c) for c in ('G0', 'G1', 'G2', 'G3', 'G4', 'G17', 'G18',
+                              'G19', 'G20', 'G21', 'G28', 'G53', 'G90', 'G91',
+                              'G92'))
+M2, M3, M5, M30, M84, M104, M109, M140, M190, M114, M204, M400 = (
+    command_code(c) for c in ('M2', 'M3', 'M5', 'M30', 'M84', 'M104', 'M109',
+                              'M140', 'M190', 'M114', 'M204', 'M400'))
+# commands which don't affect time, but are known for GMachine
+NO_TIME_COMMANDS = frozenset(command_code(c) for c in (
+    'M82', 'M83', 'M105', 'M106', 'M107', 'M111'))
+# commands which flush planner, so the next movement starts from full stop
+FLUSH_COMMANDS = frozenset((M3, M5, M84, M400))
+MASK = dict((c, 1 << SLOTS[c]) for c in 'XYZEFIJKPRST')
+MAX_ACCELERATIONS_MM_PER_S2 = (MAX_ACCELERATION_MM_PER_S2_X,
+                               MAX_ACCELERATION_MM_PER_S2_Y,
+                               MAX_ACCELERATION_MM_PER_S2_Z,
+                               MAX_ACCELERATION_MM_PER_S2_E)
+# the same rounding which GMachine uses for movements
+RESOLUTION = (1.0 / STEPPER_PULSES_PER_MM_X, 1.0 / STEPPER_PULSES_PER_MM_Y,
+              1.0 / STEPPER_PULSES_PER_MM_Z, 1.0 / STEPPER_PULSES_PER_MM_E)
+MAX_VELOCITY_MM_PER_MIN = max(MAX_VELOCITY_MM_PER_MIN_X,
+                              MAX_VELOCITY_MM_PER_MIN_Y,
+                              MAX_VELOCITY_MM_PER_MIN_Z,
+                              MAX_VELOCITY_MM_PER_MIN_E)
+
+
+class Estimation(object):
+    def __init__(self):
+        """ Result of estimation.
+        """
+        self.total_time_s = 0.0
+        # time for each command, like {"G1": 100.0, "M109": 20.0}
+        self.commands_time_s = dict()
+        self.lines = 0
+        self.movements = 0
+        self.bounding_box = None  # tuple of two Coordinates, min and max
+        self.filament_mm = 0.0
+
+    def add(self, command, time_s):
+        self.commands_time_s[command] = (self.commands_time_s.get(command, 0.0)
+                                         + time_s)
+        self.total_time_s += time_s
+
+    def report(self):
+        """ Get human readable report.
+        :return: string with report.
+        """
+        t = int(round(self.total_time_s))
+        lines = ["Total time: {}:{:02d}:{:02d} ({:.1f} s)".format(
+                 t // 3600, t // 60 % 60, t % 60, self.total_time_s)]
+        for c in sorted(self.commands_time_s):
+            lines.append("  {}: {:.1f} s".format(c, self.commands_time_s[c]))
+        lines.append("Lines: {}, movements: {}".format(self.lines,
+                                                       self.movements))
+        if self.bounding_box is not None:
+            lo, hi = self.bounding_box
+            lines.append("Bounding box: X {:.3f}..{:.3f} Y {:.3f}..{:.3f} "
+                         "Z {:.3f}..{:.3f}".format(lo.x, hi.x, lo.y, hi.y,
+                                                   lo.z, hi.z))
+        lines.append("Filament: {:.1f} mm".format(self.filament_mm))
+        return '\n'.join(lines)
+
+
+def _approach(temperature, target, time_s, heating_rate):
+    # temperature of heater after time_s since target was set
+    if temperature < target:
+        return min(target, temperature + heating_rate * time_s)
+    return max(target, temperature - ESTIMATOR_COOLING_C_PER_S * time_s)
+
+
+def _arc_extremes(start, end, center, radius, direction, full):
+    # angles which are multiple of 90 degrees and crossed by arc give
+    # extreme points of circle
+    a0 = math.atan2(start[1] - center[1], start[0] - center[0])
+    a1 = math.atan2(end[1] - center[1], end[0] - center[0])
+    if direction == CW:
+        a0, a1 = a1, a0
+    sweep = (a1 - a0) % (2 * math.pi)
+    if full or sweep == 0:
+        sweep = 2 * math.pi
+    points = []
+    for k in range(0, 4):
+        a = k * math.pi / 2
+        if (a - a0) % (2 * math.pi) <= sweep:
+            points.append((center[0] + radius * math.cos(a),
+                           center[1] + radius * math.sin(a)))
+    return points
+
+
+class Estimator(object):
+    def __init__(self,
+                 extruder_heating_c_per_s=ESTIMATOR_EXTRUDER_HEATING_C_PER_S,
+                 bed_heating_c_per_s=ESTIMATOR_BED_HEATING_C_PER_S,
+                 ambient_temperature=ESTIMATOR_AMBIENT_TEMPERATURE):
+        """ Estimate job time without running it.
+        :param extruder_heating_c_per_s: extruder heating rate.
+        :param bed_heating_c_per_s: bed heating rate.
+        :param ambient_temperature: temperature of heaters at job start.
+        """
+        self._heating_rate = {HEATER_EXTRUDER: extruder_heating_c_per_s,
+                              HEATER_BED: bed_heating_c_per_s}
+        self._ambient_temperature = ambient_temperature
+
+    def estimate_lines(self, lines):
+        """ Estimate job time for gcode lines.
+        :param lines: iterable with gcode lines.
+        :return: Estimation object.
+        """
+        return self.estimate(GCode.parse_lines(lines))
+
+    def estimate(self, rows):
+        """ Estimate job time for parsed lines.
+        :param rows: NumPy structured array, see GCode.parse_lines().
+        :return: Estimation object.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for estimation")
+        result = Estimation()
+        result.lines = len(rows)
+        self._moves = ([], [], [], [], [], [], [], [])
+        self._events = []
+        self._points = [(0.0, 0.0, 0.0)]
+        self._replay(rows)
+        self._calculate(result)
+        points = numpy.array(self._points)
+        result.bounding_box = (Coordinates(*(points.min(axis=0).tolist()
+                                             + [0])),
+                               Coordinates(*(points.max(axis=0).tolist()
+                                             + [0])))
+        return result
+
+    def _move(self, command, dx, dy, dz, de, velocity, travel=False):
+        # save linear movement, the same as GMachine._move_linear()
+        dx = round(round(dx / RESOLUTION[0]) * RESOLUTION[0], 10)
+        dy = round(round(dy / RESOLUTION[1]) * RESOLUTION[1], 10)
+        dz = round(round(dz / RESOLUTION[2]) * RESOLUTION[2], 10)
+        de = round(round(de / RESOLUTION[3]) * RESOLUTION[3], 10)
+        if dx == 0 and dy == 0 and dz == 0 and de == 0:
+            return False
+        x, y, z = (round(self._x + dx, 10), round(self._y + dy, 10),
+                   round(self._z + dz, 10))
+        if not (0 <= x <= TABLE_SIZE_X_MM and 0 <= y <= TABLE_SIZE_Y_MM
+                and 0 <= z <= TABLE_SIZE_Z_MM):
+            raise GMachineException("out of effective area")
+        moves = self._moves
+        moves[0].append(dx)
+        moves[1].append(dy)
+        moves[2].append(dz)
+        moves[3].append(de)
+        moves[4].append(velocity)
+        moves[5].append(command)
+        moves[6].append(self._stop)
+        if dx == 0 and dy == 0 and dz == 0:
+            moves[7].append(self._retract_acceleration)
+        elif travel:
+            moves[7].append(self._travel_acceleration)
+        else:
+            moves[7].append(self._print_acceleration)
+        self._stop = False
+        self._x, self._y, self._z = x, y, z
+        self._e = round(self._e + de, 10)
+        self._points.append((x, y, z))
+        return True
+
+    def _flush(self):
+        self._stop = True
+
+    def _event(self, *event):
+        # events are bound to the number of movements before them
+        self._events.append((len(self._moves[0]),) + event)
+
+    def _arc(self, command, delta, radius, velocity, direction):
+        # circular movement, the same as GMachine._move_circular(), arcs are
+        # rare, so pulse generator is used to calculate time
+        delta = delta.round(*RESOLUTION)
+        radius = radius.round(*RESOLUTION)
+        start = (self._x, self._y, self._z)
+        position = Coordinates(self._x, self._y, self._z, self._e)
+        if not (position + delta).is_in_aabb(
+                Coordinates(0.0, 0.0, 0.0, 0.0),
+                Coordinates(TABLE_SIZE_X_MM, TABLE_SIZE_Y_MM,
+                            TABLE_SIZE_Z_MM, 0)):
+            raise GMachineException("out of effective area")
+        end = GMachine.circle_end(position, delta, radius, self._plane,
+                                  direction)
+        time_s = PulseGeneratorCircular(
+            end, radius, self._plane, direction, velocity,
+            self._print_acceleration).total_time_s()
+        # if finish coords is not on circle, machine moves linearly
+        linear_delta = delta - end
+        if not linear_delta.is_zero():
+            time_s += PulseGeneratorLinear(
+                linear_delta, velocity,
+                acceleration_mm_per_s2=self._print_acceleration
+            ).total_time_s()
+        # GMachine flushes planner before arc
+        self._flush()
+        self._event(command, time_s)
+        a, b = {PLANE_XY: (0, 1), PLANE_YZ: (1, 2),
+                PLANE_ZX: (2, 0)}[self._plane]
+        d = (end.x, end.y, end.z)
+        r = (radius.x, radius.y, radius.z)
+        for pa, pb in _arc_extremes((start[a], start[b]),
+                                    (start[a] + d[a], start[b] + d[b]),
+                                    (start[a] + r[a], start[b] + r[b]),
+                                    math.hypot(r[a], r[b]), direction,
+                                    d[a] == 0 and d[b] == 0):
+            p = list(start)
+            p[a], p[b] = pa, pb
+            self._points.append(tuple(p))
+        position = position + delta
+        self._x, self._y, self._z, self._e = (position.x, position.y,
+                                              position.z, position.e)
+        self._points.append((start[0] + d[0], start[1] + d[1],
+                             start[2] + d[2]))
+        self._points.append((self._x, self._y, self._z))
+
+    def _reset(self):
+        self._velocity = min(MAX_VELOCITY_MM_PER_MIN_X,
+                             MAX_VELOCITY_MM_PER_MIN_Y,
+                             MAX_VELOCITY_MM_PER_MIN_Z,
+                             MAX_VELOCITY_MM_PER_MIN_E)
+        self._print_acceleration = PRINT_ACCELERATION_MM_PER_S2
+        self._travel_acceleration = TRAVEL_ACCELERATION_MM_PER_S2
+        self._retract_acceleration = RETRACT_ACCELERATION_MM_PER_S2
+        self._local = [0.0, 0.0, 0.0, 0.0]
+        self._convert = 1.0
+        self._absolute = True
+        self._plane = PLANE_XY
+
+    def _replay(self, rows):
+        # replay GMachine.do_command() for each line
+        self._x = self._y = self._z = self._e = 0.0
+        self._stop = True
+        self._reset()
+        columns = dict((c, rows[c].tolist()) for c in 'XYZEFIJKPRST')
+        commands = rows['command'].tolist()
+        flags = rows['flags'].tolist()
+        mx, my, mz, me = MASK['X'], MASK['Y'], MASK['Z'], MASK['E']
+        cx, cy, cz, ce = (columns[c] for c in 'XYZE')
+        for i in range(0, len(commands)):
+            f = flags[i]
+            if f == 0:
+                continue
+            c = commands[i]
+            if c == 0 and f & MASK_COORDINATES:
+                c = G1
+            try:
+                velocity = columns['F'][i] if f & MASK['F'] \
+                    else self._velocity
+                if velocity < MIN_VELOCITY_MM_PER_MIN:
+                    raise GMachineException("feed speed too low")
+                if c == G1 or c == G0 or c == G2 or c == G3:
+                    k = self._convert
+                    lx, ly, lz, le = self._local
+                    if self._absolute:
+                        dx = cx[i] * k + lx - self._x if f & mx else 0.0
+                        dy = cy[i] * k + ly - self._y if f & my else 0.0
+                        dz = cz[i] * k + lz - self._z if f & mz else 0.0
+                        de = ce[i] * k + le - self._e if f & me else 0.0
+                    else:
+                        dx = cx[i] * k if f & mx else 0.0
+                        dy = cy[i] * k if f & my else 0.0
+                        dz = cz[i] * k if f & mz else 0.0
+                        de = ce[i] * k if f & me else 0.0
+                    if c == G1:
+                        self._move(c, dx, dy, dz, de, velocity)
+                    elif c == G0:
+                        self._move(c, dx, dy, dz, de,
+                                   self._rapid_velocity(dx, dy, dz, de),
+                                   True)
+                    else:
+                        radius = Coordinates(
+                            *(columns[r][i] * k if f & MASK[r] else 0.0
+                              for r in 'IJK'), e=0)
+                        self._arc(c, Coordinates(dx, dy, dz, de), radius,
+                                  velocity, CW if c == G2 else CCW)
+                elif c != 0:
+                    self._command(c, f, columns, i)
+                # otherwise there is no command, i.e. just F was passed,
+                # the same as GMachine does
+            except GMachineException as e:
+                raise GMachineException("line {}: {}".format(i + 1, e))
+            self._velocity = velocity
+
+    @staticmethod
+    def _rapid_velocity(dx, dy, dz, de):
+        # the same as G0 in GMachine
+        vl = MAX_VELOCITY_MM_PER_MIN
+        length = math.sqrt(dx * dx + dy * dy + dz * dz + de * de)
+        if length > 0:
+            for d, v in ((dx, MAX_VELOCITY_MM_PER_MIN_X),
+                         (dy, MAX_VELOCITY_MM_PER_MIN_Y),
+                         (dz, MAX_VELOCITY_MM_PER_MIN_Z),
+                         (de, MAX_VELOCITY_MM_PER_MIN_E)):
+                p = abs(d) / length
+                if p > 0:
+                    vl = min(vl, int(v / p))
+        return vl
+
+    def _command(self, c, f, columns, i):
+        # non movement commands
+        k = self._convert
+        if c == G4:
+            if not f & MASK['P']:
+                raise GMachineException("P is not specified")
+            pause = columns['P'][i]
+            if pause < 0:
+                raise GMachineException("bad delay")
+            self._flush()
+            self._event(c, pause)
+        elif c == G17:
+            self._plane = PLANE_XY
+        elif c == G18:
+            self._plane = PLANE_ZX
+        elif c == G19:
+            self._plane = PLANE_YZ
+        elif c == G20:
+            self._convert = 25.4
+        elif c == G21:
+            self._convert = 1.0
+        elif c == G28:
+            x, y, z = f & MASK['X'], f & MASK['Y'], f & MASK['Z']
+            if not (x or y or z):
+                x = y = z = True
+            # the same as GMachine.safe_zero()
+            if x and not y:
+                self._move(c, -self._x, 0, 0, 0, MAX_VELOCITY_MM_PER_MIN_X,
+                           True)
+            elif y and not x:
+                self._move(c, 0, -self._y, 0, 0, MAX_VELOCITY_MM_PER_MIN_X,
+                           True)
+            elif x and y:
+                self._move(c, -self._x, -self._y, 0, 0,
+                           min(MAX_VELOCITY_MM_PER_MIN_X,
+                               MAX_VELOCITY_MM_PER_MIN_Y), True)
+            if z:
+                self._move(c, 0, 0, -self._z, 0, MAX_VELOCITY_MM_PER_MIN_Z,
+                           True)
+            self._flush()
+        elif c == G53:
+            self._local = [0.0, 0.0, 0.0, 0.0]
+        elif c == G90:
+            self._absolute = True
+        elif c == G91:
+            self._absolute = False
+        elif c == G92:
+            position = (self._x, self._y, self._z, self._e)
+            if f & MASK_COORDINATES:
+                self._local = list(
+                    p - (columns[a][i] * k if f & MASK[a] else p - l)
+                    for p, l, a in zip(position, self._local, 'XYZE'))
+            else:
+                self._local = list(position)
+        elif c in (M104, M109, M140, M190):
+            heater = HEATER_EXTRUDER if c in (M104, M109) else HEATER_BED
+            if not f & MASK['S']:
+                raise GMachineException("temperature is not specified")
+            t = columns['S'][i]
+            if ((heater == HEATER_EXTRUDER and t > EXTRUDER_MAX_TEMPERATURE)
+                    or (heater == HEATER_BED and t > BED_MAX_TEMPERATURE)
+                    or t < MIN_TEMPERATURE) and t != 0:
+                raise GMachineException("bad temperature")
+            self._event(c, heater, t, c in (M109, M190) and t != 0)
+        elif c == M204:
+            values = dict((a, columns[a][i]) for a in 'PRST'
+                          if f & MASK[a])
+            for v in values.values():
+                if v <= 0:
+                    raise GMachineException("bad acceleration")
+            if 'S' in values:
+                self._print_acceleration = values['S']
+                self._travel_acceleration = values['S']
+            self._print_acceleration = values.get('P',
+                                                  self._print_acceleration)
+            self._retract_acceleration = values.get(
+                'R', self._retract_acceleration)
+            self._travel_acceleration = values.get('T',
+                                                   self._travel_acceleration)
+        elif c == M2 or c == M30:
+            self._flush()
+            self._reset()
+        elif c == M114:
+            # current position of motors doesn't wait for movements
+            if not f & MASK['R']:
+                self._flush()
+        elif c in FLUSH_COMMANDS:
+            self._flush()
+        elif c not in NO_TIME_COMMANDS:
+            raise GMachineException("unknown command")
+
+    def _calculate(self, result):
+        dx, dy, dz, de, velocity, commands, stops, accelerations = \
+            self._moves
+        times = self._linear_times(numpy.array(dx), numpy.array(dy),
+                                   numpy.array(dz), numpy.array(de),
+                                   numpy.array(velocity, dtype=float),
+                                   numpy.array(stops, dtype=bool),
+                                   numpy.array(accelerations, dtype=float))
+        result.movements = len(times)
+        result.filament_mm = max(0.0, float(numpy.sum(de)))
+        names = dict()
+        codes = numpy.array(commands, dtype=numpy.int64)
+        for code in numpy.unique(codes):
+            names[code] = "{}{}".format(chr(code // 100000),
+                                        code % 100000 // 100)
+            result.add(names[code], float(numpy.sum(times[codes == code])))
+        # events, time which is elapsed before each event is needed for
+        # heaters model
+        elapsed = numpy.concatenate(([0.0], numpy.cumsum(times))).tolist()
+        events_time = 0.0
+        heaters = dict((h, (self._ambient_temperature,
+                            self._ambient_temperature, 0.0))
+                       for h in (HEATER_EXTRUDER, HEATER_BED))
+        for event in self._events:
+            index, code = event[0], event[1]
+            name = "{}{}".format(chr(code // 100000), code % 100000 // 100)
+            now = elapsed[index] + events_time
+            if len(event) == 3:  # fixed time
+                time_s = event[2]
+            else:
+                heater, target, wait = event[2:]
+                rate = self._heating_rate[heater]
+                temperature, previous, since = heaters[heater]
+                temperature = _approach(temperature, previous, now - since,
+                                        rate)
+                if target == 0:
+                    target = self._ambient_temperature
+                time_s = 0.0
+                if wait:
+                    if temperature < target:
+                        time_s = (target - temperature) / rate
+                    else:
+                        time_s = ((temperature - target)
+                                  / ESTIMATOR_COOLING_C_PER_S)
+                    heaters[heater] = (target, target, now + time_s)
+                else:
+                    heaters[heater] = (temperature, target, now)
+            events_time += time_s
+            result.add(name, time_s)
+
+    @staticmethod
+    def _linear_times(dx, dy, dz, de, velocity, stops, accelerations):
+        # velocities on junctions, the same as Planner does
+        n = len(dx)
+        if n == 0:
+            return numpy.zeros(0)
+        length = numpy.sqrt(dx * dx + dy * dy + dz * dz + de * de)
+        proportion = numpy.abs(numpy.stack((dx, dy, dz, de))) / length
+        unit = numpy.stack((dx, dy, dz, de)) / length
+        # acceleration along the path, see path_acceleration()
+        with numpy.errstate(divide='ignore'):
+            limits = (numpy.array(MAX_ACCELERATIONS_MM_PER_S2,
+                                  dtype=float)[:, None] / proportion)
+        acceleration = numpy.minimum(accelerations, limits.min(axis=0))
+        max_velocities = numpy.array((MAX_VELOCITY_MM_PER_MIN_X,
+                                      MAX_VELOCITY_MM_PER_MIN_Y,
+                                      MAX_VELOCITY_MM_PER_MIN_Z,
+                                      MAX_VELOCITY_MM_PER_MIN_E),
+                                     dtype=float)[:, None]
+        nominal = velocity / SECONDS_IN_MINUTE
+        if PulseGenerator.AUTO_VELOCITY_ADJUSTMENT:
+            with numpy.errstate(divide='ignore'):
+                limits = max_velocities / SECONDS_IN_MINUTE / proportion
+            nominal = numpy.minimum(nominal, limits.min(axis=0))
+        max_entry = numpy.zeros(n)
+        if PLANNER_LOOKAHEAD_MOVES > 0 and n > 1:
+            cos_theta = -(unit[:, :-1] * unit[:, 1:]).sum(axis=0)
+            cos_theta = numpy.clip(cos_theta, -1.0, 1.0)
+            sin_theta_d2 = numpy.sqrt(0.5 * (1.0 - cos_theta))
+            a = numpy.minimum(acceleration[:-1], acceleration[1:])
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                v = numpy.sqrt(a * PLANNER_JUNCTION_DEVIATION_MM
+                               * sin_theta_d2 / (1.0 - sin_theta_d2))
+            nominal_min = numpy.minimum(nominal[:-1], nominal[1:])
+            v = numpy.minimum(v, nominal_min)
+            v = numpy.where(cos_theta > 0.999999, 0.0, v)
+            v = numpy.where(cos_theta < -0.999999, nominal_min, v)
+            max_entry[1:] = v
+        max_entry[stops] = 0.0
+        # S-curve makes average acceleration lower then the peak one
+        acceleration = acceleration / (1.0 + PulseGenerator.S_CURVE_JERK_RATIO)
+        reach = 2.0 * acceleration * length
+        # backward pass, planner sends movement to hal when the next
+        # PLANNER_LOOKAHEAD_MOVES movements are in buffer, and the last of
+        # them stops completely, so exit velocity of each movement is
+        # limited with this window only
+        window = numpy.zeros(n)
+        for k in range(min(PLANNER_LOOKAHEAD_MOVES, n - 1), 0, -1):
+            window[:-k] = numpy.minimum(max_entry[k:],
+                                        numpy.sqrt(window[:-k] ** 2
+                                                   + reach[k:]))
+        # forward pass can't be vectorized
+        reach = reach.tolist()
+        window = window.tolist()
+        stops = stops.tolist()
+        entry = [0.0] * n
+        exit = [0.0] * n
+        v = 0.0
+        for i in range(0, n):
+            if stops[i]:
+                v = 0.0
+            entry[i] = v
+            v = min(window[i], math.sqrt(v * v + reach[i]))
+            exit[i] = v
+        # time of each movement, see PulseGeneratorLinear
+        distance = numpy.abs(numpy.stack((dx, dy, dz, de)))
+        axis_velocity = distance * (velocity / SECONDS_IN_MINUTE / length)
+        if PulseGenerator.AUTO_VELOCITY_ADJUSTMENT:
+            with numpy.errstate(divide='ignore'):
+                k = numpy.minimum(1.0, (max_velocities / SECONDS_IN_MINUTE
+                                        / axis_velocity).min(axis=0))
+            axis_velocity = axis_velocity * k
+        distance_max = distance.max(axis=0)
+        velocity_max = axis_velocity.max(axis=0)
+        v0 = numpy.minimum(numpy.array(entry) * distance_max / length,
+                           velocity_max)
+        v1 = numpy.minimum(numpy.array(exit) * distance_max / length,
+                           velocity_max)
+        # acceleration of the fastest axis
+        a = acceleration * proportion.max(axis=0)
+        short = (2.0 * velocity_max ** 2 - v0 ** 2 - v1 ** 2
+                 > 2.0 * a * distance_max)
+        peak = numpy.maximum(numpy.sqrt(a * distance_max
+                                        + (v0 ** 2 + v1 ** 2) / 2.0),
+                             numpy.maximum(v0, v1))
+        acceleration_time = numpy.where(short, peak - v0,
+                                        velocity_max - v0) / a
+        linear_time = numpy.where(
+            short, 0.0, (distance_max - (2.0 * velocity_max ** 2 - v0 ** 2
+                                         - v1 ** 2) / (2.0 * a))
+            / velocity_max)
+        return 2.0 * acceleration_time + linear_time + (v0 - v1) / a
@@ -1,11 +1,38 @@
-import re
+import array
 
 from cnc.coordinates import Coordinates
 
-# extract letter-digit pairs
-g_pattern = re.compile('([A-Z])([-+]?[0-9.]+)')
-# white spaces and comments start with ';' and in '()'
-clean_pattern = re.compile('\s+|\(.*?\)|;.*')
+try:  # python3 compatibility
+    from sys import intern
+except ImportError:
+    pass
+
+# NumPy is optional, it is needed only for GCode.parse_lines()
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# each letter has its own slot in GCode values, lower case letters share
+# slots with upper case
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SLOTS = dict((c, i) for i, c in enumerate(LETTERS))
+SLOTS.update((c.lower(), i) for i, c in enumerate(LETTERS))
+# presence bitmask for coordinates letters
+MASK_COORDINATES = ((1 << SLOTS['X']) | (1 << SLOTS['Y']) | (1 << SLOTS['Z'])
+                    | (1 << SLOTS['E']))
+MASK_G = 1 << SLOTS['G']
+MASK_M = 1 << SLOTS['M']
+WHITESPACES = frozenset(' \t\r\n\v\f')
+NUMBER_CHARS = frozenset('0123456789.+-')
+# float columns of structured array which is created by GCode.parse_lines(),
+# array also has 'command' column with command_code() value or zero, and
+# 'flags' column with presence bitmask
+ARRAY_COLUMNS = 'XYZEFIJKPRST'
+# interned command names for (letter, value), so lines with the same command
+# share one string object and dict lookups by command are fast
+COMMANDS = dict()
+MAX_COMMANDS = 1000
 
 
 class GCodeException(Exception):
@@ -14,15 +41,114 @@ class GCodeException(Exception):
     pass
 
 
+def tokenize(line):
+    """ Scan gcode line once, skip comments and white spaces, convert numbers
+        to floats.
+    :param line: String with gcode line.
+    :return: tuple (values, mask), values is list with float value or None
+             for each letter slot, mask is presence bitmask, zero if there is
+             no gcode in line.
+    """
+    values = [None] * len(LETTERS)
+    mask = 0
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if c in WHITESPACES:
+            i += 1
+            continue
+        if c == ';':
+            break
+        if c == '(':
+            i = line.find(')', i) + 1
+            if i == 0:
+                raise GCodeException('comment is not closed')
+            continue
+        if c == '%' and mask == 0:
+            return values, 0
+        slot = SLOTS.get(c)
+        if slot is None:
+            raise GCodeException('extra characters in line')
+        bit = 1 << slot
+        if mask & bit:
+            raise GCodeException('duplicated gcode entries')
+        mask |= bit
+        i += 1
+        # white spaces and comments are allowed before number
+        while i < n:
+            c = line[i]
+            if c in WHITESPACES:
+                i += 1
+            elif c == '(':
+                i = line.find(')', i) + 1
+                if i == 0:
+                    raise GCodeException('comment is not closed')
+            else:
+                break
+        begin = i
+        while i < n and line[i] in NUMBER_CHARS:
+            i += 1
+        try:
+            values[slot] = float(line[begin:i])
+        except ValueError:
+            raise GCodeException('bad number')
+    if mask & MASK_G and mask & MASK_M:
+        raise GCodeException('g and m command found')
+    return values, mask
+
+
 class GCode(object):
     """ This object represent single line of gcode.
         Do not create it manually, use parse_line() instead.
+        Values are stored as floats in slots, one slot for each letter, and
+        mask has bit (1 << slot) set for each letter which is present in line.
     """
+    __slots__ = ('values', 'mask', '_command')
+
     def __init__(self, params):
         """ Create object.
         :param params: dict with gcode key-values.
         """
-        self.params = params
+        self.values = [None] * len(LETTERS)
+        self.mask = 0
+        for k, v in params.items():
+            slot = SLOTS[k]
+            self.values[slot] = float(v)
+            self.mask |= 1 << slot
+        self._command = GCode.__command(self.values, self.mask)
+
+    @staticmethod
+    def __command(values, mask):
+        if mask & MASK_G:
+            letter, value = 'G', values[SLOTS['G']]
+        elif mask & MASK_M:
+            letter, value = 'M', values[SLOTS['M']]
+        else:
+            return None
+        command = COMMANDS.get((letter, value))
+        if command is not None:
+            return command
+        if value == int(value):
+            command = letter + str(int(value))
+        else:
+            command = letter + repr(value)
+        command = intern(command)
+        if len(COMMANDS) < MAX_COMMANDS:
+            COMMANDS[(letter, value)] = command
+        return command
+
+    def __str__(self):
+        # command goes first
+        return ' '.join("{}{:g}".format(k, v) for k, v in sorted(
+            self.params.items(), key=lambda p: (p[0] not in 'GM', p[0])))
+
+    @property
+    def params(self):
+        """ Dict with all values, for debug purpose.
+        """
+        return dict((c, self.values[i]) for i, c in enumerate(LETTERS)
+                    if self.mask & (1 << i))
 
     def has(self, arg_name):
         """
@@ -30,7 +156,7 @@ class GCode(object):
         :param arg_name: Value name.
         :return: boolean value.
         """
-        return arg_name in self.params
+        return (self.mask >> SLOTS[arg_name]) & 1 == 1
 
     def get(self, arg_name, default=None, multiply=1.0):
         """ Get value from gcode line.
@@ -39,9 +165,10 @@ class GCode(object):
         :param multiply: if value exist, multiply it by this value.
         :return: Value if exists or default otherwise.
         """
-        if arg_name not in self.params:
+        value = self.values[SLOTS[arg_name]]
+        if value is None:
             return default
-        return float(self.params[arg_name]) * multiply
+        return value * multiply
 
     def coordinates(self, default, multiply):
         """ Get X, Y and Z values as Coord object.
@@ -59,8 +186,7 @@ class GCode(object):
         """ Check if at least one of the coordinates is present.
         :return: Boolean value.
         """
-        return 'X' in self.params or 'Y' in self.params or 'Z' in self.params \
-               or 'E' in self.params
+        return self.mask & MASK_COORDINATES != 0
 
     def radius(self, default, multiply):
         """ Get radius for circular interpolation(I, J, K or R).
@@ -77,33 +203,101 @@ class GCode(object):
         """ Get value from gcode line.
         :return: String with command or None if no command specified.
         """
-        if 'G' in self.params:
-            return 'G' + self.params['G']
-        if 'M' in self.params:
-            return 'M' + self.params['M']
-        return None
+        return self._command
 
     @staticmethod
     def parse_line(line):
-        """ Parse line.
+        """ Parse line. Line is scanned once, comments and white spaces are
+            skipped, numbers are converted to floats right away.
         :param line: String with gcode line.
         :return: gcode objects.
         """
-        line = line.upper()
-        line = re.sub(clean_pattern, '', line)
-        if len(line) == 0:
+        values, mask = tokenize(line)
+        if mask == 0:
             return None
-        if line[0] == '%':
-            return None
-        m = g_pattern.findall(line)
-        if not m:
-            raise GCodeException('gcode not found')
-        if len(''.join(["%s%s" % i for i in m])) != len(line):
-            raise GCodeException('extra characters in line')
-        # noinspection PyTypeChecker
-        params = dict(m)
-        if len(params) != len(m):
-            raise GCodeException('duplicated gcode entries')
-        if 'G' in params and 'M' in params:
-            raise GCodeException('g and m command found')
-        return GCode(params)
+        return GCode.from_slots(values, mask)
+
+    @staticmethod
+    def parse_lines(lines):
+        """ Parse many lines at once into NumPy structured array with row for
+            each line. Array has 'command' column with command_code() value
+            or zero if there is no command, float column for each letter
+            from ARRAY_COLUMNS with NaN for missing values and 'flags' column
+            with presence bitmask, bit (1 << SLOTS[letter]) for each letter.
+            NumPy is required.
+        :param lines: iterable with gcode lines.
+        :return: NumPy structured array.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required to parse lines to array")
+        masks = array.array('L')
+        values = array.array('d')
+        for number, line in enumerate(lines, 1):
+            try:
+                v, mask = tokenize(line)
+            except GCodeException as e:
+                raise GCodeException("line {}: {}".format(number, e))
+            masks.append(mask)
+            if mask:
+                values.extend(x for x in v if x is not None)
+        return slots_to_array(masks, values)
+
+    @staticmethod
+    def from_slots(values, mask):
+        """ Create object from values which were parsed already.
+        :param values: list with float value or None for each letter slot.
+        :param mask: presence bitmask.
+        :return: gcode object.
+        """
+        gcode = GCode.__new__(GCode)
+        gcode.values = values
+        gcode.mask = mask
+        gcode._command = GCode.__command(values, mask)
+        return gcode
+
+
+def command_code(command):
+    """ Get integer code for command, codes are used in arrays which are
+        created by GCode.parse_lines().
+    :param command: command string like 'G1' or 'M104'.
+    :return: integer code.
+    """
+    return ord(command[0]) * 100000 + int(round(float(command[1:]) * 100))
+
+
+def slots_to_array(masks, values):
+    """ Convert parsed lines to NumPy structured array, see
+        GCode.parse_lines().
+    :param masks: array or list with presence bitmask for each line.
+    :param values: array or list with values of present letters, line by
+                   line in slots order.
+    :return: NumPy structured array.
+    """
+    dtype = ([('command', numpy.int32)]
+             + [(c, numpy.float64) for c in ARRAY_COLUMNS]
+             + [('flags', numpy.uint32)])
+    masks = numpy.frombuffer(masks, dtype=masks.typecode) \
+        if isinstance(masks, array.array) else numpy.asarray(masks)
+    masks = masks.astype(numpy.uint32)
+    values = numpy.asarray(values, dtype=numpy.float64)
+    result = numpy.zeros(len(masks), dtype=dtype)
+    result['flags'] = masks
+    # values of each line start at position of line, and the value of each
+    # letter is shifted by number of present letters with lower slots
+    counts = numpy.zeros(len(masks), dtype=numpy.int64)
+    position = numpy.zeros(len(masks), dtype=numpy.int64)
+    for slot in range(0, len(LETTERS)):
+        counts += (masks >> slot) & 1
+    position[1:] = numpy.cumsum(counts)[:-1]
+    for slot, letter in enumerate(LETTERS):
+        present = ((masks >> slot) & 1).astype(bool)
+        if letter in ARRAY_COLUMNS:
+            column = numpy.full(len(masks), numpy.nan)
+            column[present] = values[position[present]]
+            result[letter] = column
+        elif letter in 'GM':
+            result['command'][present] = (
+                ord(letter) * 100000
+                + numpy.round(values[position[present]] * 100))
+        position += present
+    return result
@@ -3,6 +3,8 @@ from __future__ import division
 import cnc.logging_config as logging_config
 from cnc import hal
 from cnc.pulses import *
+from cnc.planner import *
+from cnc.motion import *
 from cnc.coordinates import *
 from cnc.heater import *
 from cnc.enums import *
@@ -20,13 +22,21 @@ class GMachine(object):
         spindle, extruder etc
     """
     AUTO_FAN_ON = AUTO_FAN_ON
+    # commands which can be run with do_realtime()
+    REALTIME_COMMANDS = frozenset(('?', '!', '~', 'M105', 'M112'))
 
-    def __init__(self):
+    def __init__(self, motion_queue_size=MOTION_QUEUE_SIZE):
         """ Initialization.
+        :param motion_queue_size: maximum number of movements which wait to
+                                  be sent to hal, zero means each command
+                                  waits till its movements are sent.
         """
         self._position = Coordinates(0.0, 0.0, 0.0, 0.0)
         # init variables
         self._velocity = 0
+        self._print_acceleration = 0
+        self._travel_acceleration = 0
+        self._retract_acceleration = 0
         self._spindle_rpm = 0
         self._local = None
         self._convertCoordinates = 0
@@ -34,19 +44,46 @@ class GMachine(object):
         self._plane = None
         self._fan_state = False
         self._heaters = dict()
+        self._alarm = False
+        self._motion = MotionQueue(motion_queue_size)
+        self._planner = Planner(self._motion.put)
         self.reset()
         hal.init()
+        self._hal_origin = None
+        self._sync_position()
         self.watchdog = HardwareWatchdog()
 
     def release(self):
         """ Free all resources.
         """
+        self._planner.flush()
+        self._motion.stop()
         self._spindle(0)
         for h in self._heaters:
             self._heaters[h].stop()
         self._fan(False)
         hal.deinit()
 
+    def flush(self):
+        """ Send all movements which are buffered in planner to hal and wait
+            till motion queue is empty. Normally planner is flushed
+            automatically when it is needed, but should be called explicitly
+            when there are no more commands expected soon, for example in
+            interactive mode.
+        """
+        self._planner.flush()
+        self._motion.join()
+
+    def _wait_motors(self):
+        # wait till all movements are done
+        self.flush()
+        hal.join()
+        self._sync_position()
+
+    def _sync_position(self):
+        # motors are at planned position, keep offset of hal position
+        self._hal_origin = self._position - hal.get_position()
+
     def reset(self):
         """ Reinitialize all program configurable thing.
         """
@@ -54,6 +91,9 @@ class GMachine(object):
                              MAX_VELOCITY_MM_PER_MIN_Y,
                              MAX_VELOCITY_MM_PER_MIN_Z,
                              MAX_VELOCITY_MM_PER_MIN_E)
+        self._print_acceleration = PRINT_ACCELERATION_MM_PER_S2
+        self._travel_acceleration = TRAVEL_ACCELERATION_MM_PER_S2
+        self._retract_acceleration = RETRACT_ACCELERATION_MM_PER_S2
         self._spindle_rpm = 1000
         self._local = Coordinates(0.0, 0.0, 0.0, 0.0)
         self._convertCoordinates = 1.0
@@ -62,7 +102,7 @@ class GMachine(object):
 
     # noinspection PyMethodMayBeStatic
     def _spindle(self, spindle_speed):
-        hal.join()
+        self._wait_motors()
         hal.spindle_control(100.0 * spindle_speed / SPINDLE_MAX_RPM)
 
     def _fan(self, state):
@@ -111,7 +151,7 @@ class GMachine(object):
                 or max_velocity.e > MAX_VELOCITY_MM_PER_MIN_E:
             raise GMachineException("out of maximum speed")
 
-    def _move_linear(self, delta, velocity):
+    def _move_linear(self, delta, velocity, travel=False):
         delta = delta.round(1.0 / STEPPER_PULSES_PER_MM_X,
                             1.0 / STEPPER_PULSES_PER_MM_Y,
                             1.0 / STEPPER_PULSES_PER_MM_Z,
@@ -121,9 +161,17 @@ class GMachine(object):
         self.__check_delta(delta)
 
         logging.info("Moving linearly {}".format(delta))
-        gen = PulseGeneratorLinear(delta, velocity)
-        self.__check_velocity(gen.max_velocity())
-        hal.move(gen)
+        # velocity of each axis, planner decreases it itself if auto
+        # adjustment is enabled
+        if not PulseGenerator.AUTO_VELOCITY_ADJUSTMENT:
+            self.__check_velocity(abs(delta) * (velocity / delta.length()))
+        if delta.x == 0 and delta.y == 0 and delta.z == 0:
+            acceleration = self._retract_acceleration
+        elif travel:
+            acceleration = self._travel_acceleration
+        else:
+            acceleration = self._print_acceleration
+        self._planner.add(delta, velocity, acceleration)
         # save position
         self._position = self._position + delta
 
@@ -138,11 +186,12 @@ class GMachine(object):
         if pa >= 0 and pb < 0:
             return 4
 
-    def __adjust_circle(self, da, db, ra, rb, direction, pa, pb, ma, mb):
+    @staticmethod
+    def __adjust_circle(da, db, ra, rb, direction, pa, pb, ma, mb):
         r = math.sqrt(ra * ra + rb * rb)
         if r == 0:
             raise GMachineException("circle radius is zero")
-        sq = self.__quarter(-ra, -rb)
+        sq = GMachine.__quarter(-ra, -rb)
         if da == 0 and db == 0:  # full circle
             ea = da
             eb = db
@@ -154,7 +203,7 @@ class GMachine(object):
                 b = (db - rb) / (da - ra)
                 ea = math.copysign(math.sqrt(r * r / (1.0 + abs(b))), da - ra)
             eb = math.copysign(math.sqrt(r * r - ea * ea), db - rb)
-            eq = self.__quarter(ea, eb)
+            eq = GMachine.__quarter(ea, eb)
             ea += ra
             eb += rb
         # iterate coordinates quarters and check if we fit table
@@ -185,6 +234,42 @@ class GMachine(object):
             pq = q
         return ea, eb
 
+    @staticmethod
+    def circle_end(position, delta, radius, plane, direction):
+        """ Put end point of circular movement on circle and check that
+            circle fits table.
+        :param position: current position.
+        :param delta: rounded movement delta.
+        :param radius: rounded radius.
+        :param plane: plane of circle.
+        :param direction: CW or CCW.
+        :return: movement delta which ends on circle.
+        """
+        circle_end = Coordinates(0, 0, 0, 0)
+        if plane == PLANE_XY:
+            circle_end.x, circle_end.y = \
+                GMachine.__adjust_circle(delta.x, delta.y, radius.x, radius.y,
+                                         direction, position.x, position.y,
+                                         TABLE_SIZE_X_MM, TABLE_SIZE_Y_MM)
+            circle_end.z = delta.z
+        elif plane == PLANE_YZ:
+            circle_end.y, circle_end.z = \
+                GMachine.__adjust_circle(delta.y, delta.z, radius.y, radius.z,
+                                         direction, position.y, position.z,
+                                         TABLE_SIZE_Y_MM, TABLE_SIZE_Z_MM)
+            circle_end.x = delta.x
+        elif plane == PLANE_ZX:
+            circle_end.z, circle_end.x = \
+                GMachine.__adjust_circle(delta.z, delta.x, radius.z, radius.x,
+                                         direction, position.z, position.x,
+                                         TABLE_SIZE_Z_MM, TABLE_SIZE_X_MM)
+            circle_end.y = delta.y
+        circle_end.e = delta.e
+        return circle_end.round(1.0 / STEPPER_PULSES_PER_MM_X,
+                                1.0 / STEPPER_PULSES_PER_MM_Y,
+                                1.0 / STEPPER_PULSES_PER_MM_Z,
+                                1.0 / STEPPER_PULSES_PER_MM_E)
+
     def _move_circular(self, delta, radius, velocity, direction):
         delta = delta.round(1.0 / STEPPER_PULSES_PER_MM_X,
                             1.0 / STEPPER_PULSES_PER_MM_Y,
@@ -196,38 +281,14 @@ class GMachine(object):
                               1.0 / STEPPER_PULSES_PER_MM_E)
         self.__check_delta(delta)
         # get delta vector and put it on circle
-        circle_end = Coordinates(0, 0, 0, 0)
-        if self._plane == PLANE_XY:
-            circle_end.x, circle_end.y = \
-                self.__adjust_circle(delta.x, delta.y, radius.x, radius.y,
-                                     direction, self._position.x,
-                                     self._position.y, TABLE_SIZE_X_MM,
-                                     TABLE_SIZE_Y_MM)
-            circle_end.z = delta.z
-        elif self._plane == PLANE_YZ:
-            circle_end.y, circle_end.z = \
-                self.__adjust_circle(delta.y, delta.z, radius.y, radius.z,
-                                     direction, self._position.y,
-                                     self._position.z, TABLE_SIZE_Y_MM,
-                                     TABLE_SIZE_Z_MM)
-            circle_end.x = delta.x
-        elif self._plane == PLANE_ZX:
-            circle_end.z, circle_end.x = \
-                self.__adjust_circle(delta.z, delta.x, radius.z, radius.x,
-                                     direction, self._position.z,
-                                     self._position.x, TABLE_SIZE_Z_MM,
-                                     TABLE_SIZE_X_MM)
-            circle_end.y = delta.y
-        circle_end.e = delta.e
-        circle_end = circle_end.round(1.0 / STEPPER_PULSES_PER_MM_X,
-                                      1.0 / STEPPER_PULSES_PER_MM_Y,
-                                      1.0 / STEPPER_PULSES_PER_MM_Z,
-                                      1.0 / STEPPER_PULSES_PER_MM_E)
+        circle_end = self.circle_end(self._position, delta, radius,
+                                     self._plane, direction)
         logging.info("Moving circularly {} {} {} with radius {}"
                      " and velocity {}".format(self._plane, circle_end,
                                                direction, radius, velocity))
         gen = PulseGeneratorCircular(circle_end, radius, self._plane,
-                                     direction, velocity)
+                                     direction, velocity,
+                                     self._print_acceleration)
         self.__check_velocity(gen.max_velocity())
         # if finish coords is not on circle, move some distance linearly
         linear_delta = delta - circle_end
@@ -235,12 +296,15 @@ class GMachine(object):
         if not linear_delta.is_zero():
             logging.info("Moving additionally {} to finish circle command".
                          format(linear_delta))
-            linear_gen = PulseGeneratorLinear(linear_delta, velocity)
+            linear_gen = PulseGeneratorLinear(
+                linear_delta, velocity,
+                acceleration_mm_per_s2=self._print_acceleration)
             self.__check_velocity(linear_gen.max_velocity())
         # do movements
-        hal.move(gen)
+        self._planner.flush()
+        self._motion.put(gen)
         if linear_gen is not None:
-            hal.move(linear_gen)
+            self._motion.put(linear_gen)
         # save position
         self._position = self._position + circle_end + linear_delta
 
@@ -252,17 +316,17 @@ class GMachine(object):
         """
         if x and not y:
             self._move_linear(Coordinates(-self._position.x, 0, 0, 0),
-                              MAX_VELOCITY_MM_PER_MIN_X)
+                              MAX_VELOCITY_MM_PER_MIN_X, True)
         elif y and not x:
             self._move_linear(Coordinates(0, -self._position.y, 0, 0),
-                              MAX_VELOCITY_MM_PER_MIN_X)
+                              MAX_VELOCITY_MM_PER_MIN_X, True)
         elif x and y:
             d = Coordinates(-self._position.x, -self._position.y, 0, 0)
             self._move_linear(d, min(MAX_VELOCITY_MM_PER_MIN_X,
-                                     MAX_VELOCITY_MM_PER_MIN_Y))
+                                     MAX_VELOCITY_MM_PER_MIN_Y), True)
         if z:
             d = Coordinates(0, 0, -self._position.z, 0)
-            self._move_linear(d, MAX_VELOCITY_MM_PER_MIN_Z)
+            self._move_linear(d, MAX_VELOCITY_MM_PER_MIN_Z, True)
 
     def position(self):
         """ Return current machine position (after the latest command)
@@ -271,9 +335,17 @@ class GMachine(object):
             This function for tests only.
             :return current position.
         """
-        hal.join()
+        self._wait_motors()
         return self._position
 
+    def current_position(self):
+        """ Get position of motors right now, it is behind position of the
+            latest command while movements are in progress. It doesn't wait
+            for motors and can be called from any thread.
+        :return: Coordinates object.
+        """
+        return self._hal_origin + hal.get_position()
+
     def plane(self):
         """ Return current plane for circular interpolation. This function for
             tests only.
@@ -304,6 +376,316 @@ class GMachine(object):
         """
         return self.__get_target_temperature(HEATER_BED)
 
+    def _delta(self, gcode):
+        # movement delta for coordinates in gcode
+        if self._absoluteCoordinates:
+            coord = gcode.coordinates(self._position - self._local,
+                                      self._convertCoordinates)
+            return coord + self._local - self._position
+        return gcode.coordinates(Coordinates(0.0, 0.0, 0.0, 0.0),
+                                 self._convertCoordinates)
+
+    def _radius(self, gcode):
+        return gcode.radius(Coordinates(0.0, 0.0, 0.0, 0.0),
+                            self._convertCoordinates)
+
+    def _g0(self, gcode, velocity):  # rapid move
+        delta = self._delta(gcode)
+        vl = max(MAX_VELOCITY_MM_PER_MIN_X,
+                 MAX_VELOCITY_MM_PER_MIN_Y,
+                 MAX_VELOCITY_MM_PER_MIN_Z,
+                 MAX_VELOCITY_MM_PER_MIN_E)
+        l = delta.length()
+        if l > 0:
+            proportion = abs(delta) / l
+            if proportion.x > 0:
+                v = int(MAX_VELOCITY_MM_PER_MIN_X / proportion.x)
+                if v < vl:
+                    vl = v
+            if proportion.y > 0:
+                v = int(MAX_VELOCITY_MM_PER_MIN_Y / proportion.y)
+                if v < vl:
+                    vl = v
+            if proportion.z > 0:
+                v = int(MAX_VELOCITY_MM_PER_MIN_Z / proportion.z)
+                if v < vl:
+                    vl = v
+            if proportion.e > 0:
+                v = int(MAX_VELOCITY_MM_PER_MIN_E / proportion.e)
+                if v < vl:
+                    vl = v
+        self._move_linear(delta, vl, True)
+
+    def _g1(self, gcode, velocity):  # linear interpolation
+        self._move_linear(self._delta(gcode), velocity)
+
+    def _g2(self, gcode, velocity):  # circular interpolation, clockwise
+        self._move_circular(self._delta(gcode), self._radius(gcode),
+                            velocity, CW)
+
+    def _g3(self, gcode, velocity):  # circular interpolation, counterclockwise
+        self._move_circular(self._delta(gcode), self._radius(gcode),
+                            velocity, CCW)
+
+    def _g4(self, gcode, velocity):  # delay in s
+        if not gcode.has('P'):
+            raise GMachineException("P is not specified")
+        pause = gcode.get('P', 0)
+        if pause < 0:
+            raise GMachineException("bad delay")
+        self._wait_motors()
+        time.sleep(pause)
+
+    def _g17(self, gcode, velocity):  # XY plane select
+        self._plane = PLANE_XY
+
+    def _g18(self, gcode, velocity):  # ZX plane select
+        self._plane = PLANE_ZX
+
+    def _g19(self, gcode, velocity):  # YZ plane select
+        self._plane = PLANE_YZ
+
+    def _g20(self, gcode, velocity):  # switch to inches
+        self._convertCoordinates = 25.4
+
+    def _g21(self, gcode, velocity):  # switch to mm
+        self._convertCoordinates = 1.0
+
+    def _g28(self, gcode, velocity):  # home
+        axises = gcode.has('X'), gcode.has('Y'), gcode.has('Z')
+        if axises == (False, False, False):
+            axises = True, True, True
+        self.safe_zero(*axises)
+        self._wait_motors()
+        if not hal.calibrate(*axises):
+            raise GMachineException("failed to calibrate")
+        self._sync_position()
+
+    def _g53(self, gcode, velocity):  # switch to machine coords
+        self._local = Coordinates(0.0, 0.0, 0.0, 0.0)
+
+    def _g90(self, gcode, velocity):  # switch to absolute coords
+        self._absoluteCoordinates = True
+
+    def _g91(self, gcode, velocity):  # switch to relative coords
+        self._absoluteCoordinates = False
+
+    def _g92(self, gcode, velocity):  # switch to local coords
+        if gcode.has_coordinates():
+            self._local = self._position - gcode.coordinates(
+                Coordinates(self._position.x - self._local.x,
+                            self._position.y - self._local.y,
+                            self._position.z - self._local.z,
+                            self._position.e - self._local.e),
+                self._convertCoordinates)
+        else:
+            self._local = self._position
+
+    def _m3(self, gcode, velocity):  # spindle on
+        spindle_rpm = gcode.get('S', self._spindle_rpm)
+        if spindle_rpm < 0 or spindle_rpm > SPINDLE_MAX_RPM:
+            raise GMachineException("bad spindle speed")
+        self._spindle(spindle_rpm)
+        self._spindle_rpm = spindle_rpm
+
+    def _m5(self, gcode, velocity):  # spindle off
+        self._spindle(0)
+
+    def _m2(self, gcode, velocity):  # program finish, reset everything.
+        self._planner.flush()
+        self.reset()
+
+    def _m84(self, gcode, velocity):  # disable motors
+        self.flush()
+        hal.disable_steppers()
+
+    def __temperature(self, gcode, heater, wait):
+        if not gcode.has("S"):
+            raise GMachineException("temperature is not specified")
+        t = gcode.get('S', 0)
+        if ((heater == HEATER_EXTRUDER and t > EXTRUDER_MAX_TEMPERATURE) or
+                (heater == HEATER_BED and t > BED_MAX_TEMPERATURE) or
+                t < MIN_TEMPERATURE) and t != 0:
+            raise GMachineException("bad temperature")
+        self._heat(heater, t, wait)
+
+    def _m104(self, gcode, velocity):  # set extruder temperature
+        self.__temperature(gcode, HEATER_EXTRUDER, False)
+
+    def _m109(self, gcode, velocity):  # set extruder temperature and wait
+        self.__temperature(gcode, HEATER_EXTRUDER, True)
+
+    def _m140(self, gcode, velocity):  # set bed temperature
+        self.__temperature(gcode, HEATER_BED, False)
+
+    def _m190(self, gcode, velocity):  # set bed temperature and wait
+        self.__temperature(gcode, HEATER_BED, True)
+
+    def __measured_temperature(self, heater, measure):
+        # temperature which heater has measured already or measure it now
+        h = self._heaters.get(heater)
+        if h is not None and h.current_temperature() is not None:
+            return h.current_temperature()
+        try:
+            return measure()
+        except (IOError, OSError):
+            return None
+
+    def _m105(self, gcode, velocity):  # get temperature
+        et = self.__measured_temperature(HEATER_EXTRUDER,
+                                         hal.get_extruder_temperature)
+        bt = self.__measured_temperature(HEATER_BED, hal.get_bed_temperature)
+        if et is None and bt is None:
+            raise GMachineException("can not measure temperature")
+        return "E:{} B:{}".format(et, bt)
+
+    def _m106(self, gcode, velocity):  # fan control
+        if gcode.get('S', 1) != 0:
+            self._fan(True)
+        else:
+            self._fan(False)
+
+    def _m107(self, gcode, velocity):  # turn off fan
+        self._fan(False)
+
+    def _m111(self, gcode, velocity):  # enable debug
+        logging_config.debug_enable()
+
+    def _m114(self, gcode, velocity):  # get current position
+        if gcode.has('R'):  # position of motors right now
+            p = self.current_position()
+        else:
+            self.flush()
+            p = self._position
+        return "X:{} Y:{} Z:{} E:{}".format(p.x, p.y, p.z, p.e)
+
+    def _m112(self, gcode, velocity):  # emergency stop
+        self.emergency_stop()
+
+    def _m204(self, gcode, velocity):  # set accelerations
+        values = dict((c, gcode.get(c)) for c in 'PRST' if gcode.has(c))
+        if not values:
+            return "P:{} R:{} T:{}".format(self._print_acceleration,
+                                           self._retract_acceleration,
+                                           self._travel_acceleration)
+        for v in values.values():
+            if v <= 0:
+                raise GMachineException("bad acceleration")
+        if 'S' in values:  # legacy, printing and travel
+            self._print_acceleration = values['S']
+            self._travel_acceleration = values['S']
+        self._print_acceleration = values.get('P', self._print_acceleration)
+        self._retract_acceleration = values.get('R',
+                                                self._retract_acceleration)
+        self._travel_acceleration = values.get('T', self._travel_acceleration)
+
+    def _m400(self, gcode, velocity):  # wait till movements are done
+        self._wait_motors()
+
+    def _no_command(self, gcode, velocity):
+        # command not specified(ie just F was passed)
+        pass
+
+    # commands below are added just for compatibility
+    def _m82(self, gcode, velocity):  # absolute mode for extruder
+        if not self._absoluteCoordinates:
+            raise GMachineException("Not supported, use G90/G91")
+
+    def _m83(self, gcode, velocity):  # relative mode for extruder
+        if self._absoluteCoordinates:
+            raise GMachineException("Not supported, use G90/G91")
+
+    # Handler for each command, handler is called as
+    # handler(machine, gcode, velocity) and returns answer or None.
+    HANDLERS = {
+        'G0': _g0, 'G1': _g1, 'G2': _g2, 'G3': _g3, 'G4': _g4,
+        'G17': _g17, 'G18': _g18, 'G19': _g19, 'G20': _g20, 'G21': _g21,
+        'G28': _g28, 'G53': _g53, 'G90': _g90, 'G91': _g91, 'G92': _g92,
+        'M2': _m2, 'M3': _m3, 'M5': _m5, 'M30': _m2, 'M82': _m82,
+        'M83': _m83, 'M84': _m84, 'M104': _m104, 'M105': _m105,
+        'M106': _m106, 'M107': _m107, 'M109': _m109, 'M111': _m111,
+        'M112': _m112, 'M114': _m114, 'M140': _m140, 'M190': _m190,
+        'M204': _m204, 'M400': _m400,
+        None: _no_command,
+    }
+
+    @classmethod
+    def register_command(cls, command, handler):
+        """ Add new command or replace existing one. Subclasses get their own
+            copy of handlers, so base class is not affected.
+        :param command: command name, like 'M42'.
+        :param handler: function handler(machine, gcode, velocity) which
+                        returns answer string or None, velocity is F value
+                        or current velocity.
+        """
+        if 'HANDLERS' not in cls.__dict__:
+            cls.HANDLERS = dict(cls.HANDLERS)
+        cls.HANDLERS[command] = handler
+
+    def status(self):
+        """ Get machine status in GRBL like format with position of motors
+            right now. It doesn't wait for anything, so it is fast and can be
+            called from any thread.
+        :return: string like '<Idle|MPos:0.000,0.000,0.000,0.000|Q:0>'.
+        """
+        if self._alarm:
+            state = "Alarm"
+        elif self._motion.is_held():
+            state = "Hold"
+        elif self._motion.depth() > 0 or not self._planner.is_empty():
+            state = "Run"
+        else:
+            state = "Idle"
+        p = self.current_position()
+        return "<{}|MPos:{:.3f},{:.3f},{:.3f},{:.3f}|Q:{}>".format(
+            state, p.x, p.y, p.z, p.e, self._motion.depth())
+
+    def emergency_stop(self):
+        """ Stop motors, spindle and heaters immediately. Position is lost,
+            so machine doesn't accept commands anymore and should be
+            restarted. It can be called from any thread.
+        """
+        self._alarm = True
+        self._motion.abort()
+        hal.emergency_stop()
+        for h in list(self._heaters.values()):
+            h.stop()
+
+    @staticmethod
+    def realtime_command(line):
+        """ Check if line is a command for do_realtime().
+        :param line: string with line.
+        :return: command or None if line should be run with do_command().
+        """
+        line = line.split(';')[0].strip().upper()
+        if line in GMachine.REALTIME_COMMANDS:
+            return line
+        return None
+
+    def do_realtime(self, command):
+        """ Run command immediately, ahead of queued commands and movements.
+            It can be called from any thread while do_command() is running.
+        :param command: one of REALTIME_COMMANDS: '?' status, '!' feed hold,
+                        '~' resume, 'M105' temperatures, 'M112' emergency
+                        stop.
+        :return: String if any answer require, None otherwise.
+        """
+        if command == '?':
+            return self.status()
+        elif command == '!':
+            self._motion.hold()
+            hal.hold()
+        elif command == '~':
+            hal.resume()
+            self._motion.resume()
+        elif command == 'M105':
+            return self._m105(None, None)
+        elif command == 'M112':
+            self.emergency_stop()
+        else:
+            raise GMachineException("unknown realtime command")
+        return None
+
     def do_command(self, gcode):
         """ Perform action.
         :param gcode: GCode object which represent one gcode line
@@ -311,168 +693,25 @@ class GMachine(object):
         """
         if gcode is None:
             return None
-        answer = None
-        logging.debug("got command " + str(gcode.params))
+        if self._alarm:
+            raise GMachineException("emergency stop, restart is required")
+        logging.debug("got command %s", gcode)
         # read command
         c = gcode.command()
         if c is None and gcode.has_coordinates():
             c = 'G1'
-        # read parameters
-        if self._absoluteCoordinates:
-            coord = gcode.coordinates(self._position - self._local,
-                                      self._convertCoordinates)
-            coord = coord + self._local
-            delta = coord - self._position
-        else:
-            delta = gcode.coordinates(Coordinates(0.0, 0.0, 0.0, 0.0),
-                                      self._convertCoordinates)
-            # coord = self._position + delta
-        velocity = gcode.get('F', self._velocity)
-        radius = gcode.radius(Coordinates(0.0, 0.0, 0.0, 0.0),
-                              self._convertCoordinates)
-        # check parameters
-        if velocity < MIN_VELOCITY_MM_PER_MIN:
-            raise GMachineException("feed speed too low")
-        # select command and run it
-        if c == 'G0':  # rapid move
-            vl = max(MAX_VELOCITY_MM_PER_MIN_X,
-                     MAX_VELOCITY_MM_PER_MIN_Y,
-                     MAX_VELOCITY_MM_PER_MIN_Z,
-                     MAX_VELOCITY_MM_PER_MIN_E)
-            l = delta.length()
-            if l > 0:
-                proportion = abs(delta) / l
-                if proportion.x > 0:
-                    v = int(MAX_VELOCITY_MM_PER_MIN_X / proportion.x)
-                    if v < vl:
-                        vl = v
-                if proportion.y > 0:
-                    v = int(MAX_VELOCITY_MM_PER_MIN_Y / proportion.y)
-                    if v < vl:
-                        vl = v
-                if proportion.z > 0:
-                    v = int(MAX_VELOCITY_MM_PER_MIN_Z / proportion.z)
-                    if v < vl:
-                        vl = v
-                if proportion.e > 0:
-                    v = int(MAX_VELOCITY_MM_PER_MIN_E / proportion.e)
-                    if v < vl:
-                        vl = v
-            self._move_linear(delta, vl)
-        elif c == 'G1':  # linear interpolation
-            self._move_linear(delta, velocity)
-        elif c == 'G2':  # circular interpolation, clockwise
-            self._move_circular(delta, radius, velocity, CW)
-        elif c == 'G3':  # circular interpolation, counterclockwise
-            self._move_circular(delta, radius, velocity, CCW)
-        elif c == 'G4':  # delay in s
-            if not gcode.has('P'):
-                raise GMachineException("P is not specified")
-            pause = gcode.get('P', 0)
-            if pause < 0:
-                raise GMachineException("bad delay")
-            hal.join()
-            time.sleep(pause)
-        elif c == 'G17':  # XY plane select
-            self._plane = PLANE_XY
-        elif c == 'G18':  # ZX plane select
-            self._plane = PLANE_ZX
-        elif c == 'G19':  # YZ plane select
-            self._plane = PLANE_YZ
-        elif c == 'G20':  # switch to inches
-            self._convertCoordinates = 25.4
-        elif c == 'G21':  # switch to mm
-            self._convertCoordinates = 1.0
-        elif c == 'G28':  # home
-            axises = gcode.has('X'), gcode.has('Y'), gcode.has('Z')
-            if axises == (False, False, False):
-                axises = True, True, True
-            self.safe_zero(*axises)
-            hal.join()
-            if not hal.calibrate(*axises):
-                raise GMachineException("failed to calibrate")
-        elif c == 'G53':  # switch to machine coords
-            self._local = Coordinates(0.0, 0.0, 0.0, 0.0)
-        elif c == 'G90':  # switch to absolute coords
-            self._absoluteCoordinates = True
-        elif c == 'G91':  # switch to relative coords
-            self._absoluteCoordinates = False
-        elif c == 'G92':  # switch to local coords
-            if gcode.has_coordinates():
-                self._local = self._position - gcode.coordinates(
-                    Coordinates(self._position.x - self._local.x,
-                                self._position.y - self._local.y,
-                                self._position.z - self._local.z,
-                                self._position.e - self._local.e),
-                    self._convertCoordinates)
-            else:
-                self._local = self._position
-        elif c == 'M3':  # spindle on
-            spindle_rpm = gcode.get('S', self._spindle_rpm)
-            if spindle_rpm < 0 or spindle_rpm > SPINDLE_MAX_RPM:
-                raise GMachineException("bad spindle speed")
-            self._spindle(spindle_rpm)
-            self._spindle_rpm = spindle_rpm
-        elif c == 'M5':  # spindle off
-            self._spindle(0)
-        elif c == 'M2' or c == 'M30':  # program finish, reset everything.
-            self.reset()
-        elif c == 'M84':  # disable motors
-            hal.disable_steppers()
-        # extruder and bed heaters control
-        elif c == 'M104' or c == 'M109' or c == 'M140' or c == 'M190':
-            if c == 'M104' or c == 'M109':
-                heater = HEATER_EXTRUDER
-            elif c == 'M140' or c == 'M190':
-                heater = HEATER_BED
-            else:
-                raise Exception("Unexpected heater command")
-            wait = c == 'M109' or c == 'M190'
-            if not gcode.has("S"):
-                raise GMachineException("temperature is not specified")
-            t = gcode.get('S', 0)
-            if ((heater == HEATER_EXTRUDER and t > EXTRUDER_MAX_TEMPERATURE) or
-                    (heater == HEATER_BED and t > BED_MAX_TEMPERATURE) or
-                    t < MIN_TEMPERATURE) and t != 0:
-                raise GMachineException("bad temperature")
-            self._heat(heater, t, wait)
-        elif c == 'M105':  # get temperature
-            try:
-                et = hal.get_extruder_temperature()
-            except (IOError, OSError):
-                et = None
-            try:
-                bt = hal.get_bed_temperature()
-            except (IOError, OSError):
-                bt = None
-            if et is None and bt is None:
-                raise GMachineException("can not measure temperature")
-            answer = "E:{} B:{}".format(et, bt)
-        elif c == 'M106':  # fan control
-            if gcode.get('S', 1) != 0:
-                self._fan(True)
-            else:
-                self._fan(False)
-        elif c == 'M107':  # turn off fan
-            self._fan(False)
-        elif c == 'M111':  # enable debug
-            logging_config.debug_enable()
-        elif c == 'M114':  # get current position
-            hal.join()
-            p = self.position()
-            answer = "X:{} Y:{} Z:{} E:{}".format(p.x, p.y, p.z, p.e)
-        elif c is None:  # command not specified(ie just F was passed)
-            pass
-        # commands below are added just for compatibility
-        elif c == 'M82':  # absolute mode for extruder
-            if not self._absoluteCoordinates:
-                raise GMachineException("Not supported, use G90/G91")
-        elif c == 'M83':  # relative mode for extruder
-            if self._absoluteCoordinates:
-                raise GMachineException("Not supported, use G90/G91")
-        else:
+        # velocity is the only parameter which is common for all commands,
+        # others are read by handlers
+        velocity = self._velocity
+        if gcode.has('F'):
+            velocity = gcode.get('F')
+            if velocity < MIN_VELOCITY_MM_PER_MIN:
+                raise GMachineException("feed speed too low")
+        handler = self.HANDLERS.get(c)
+        if handler is None:
             raise GMachineException("unknown command")
+        answer = handler(self, gcode, velocity)
         # save parameters on success
         self._velocity = velocity
-        logging.debug("position {}".format(self._position))
+        logging.debug("position %s", self._position)
         return answer
@@ -76,18 +76,49 @@
 #        do_something()
 #
 #
+#    def hold():
+#        """ Feed hold, brake in the middle of movement and stop. Movements
+#        which are not finished are kept and run after resume(). It can be
+#        called from any thread.
+#        """
+#        do_something()
+#
+#
+#    def resume():
+#        """ Resume movements after hold(). It can be called from any thread.
+#        """
+#        do_something()
+#
+#
 #    def join():
 #        """ Wait till motors work.
 #        """
 #        do_something()
 #
 #
+#    def get_position():
+#        """ Get position of motors right now, it can be in the middle of
+#        movement. It can be called from any thread.
+#        :return: Coordinates object with position in millimeters relative
+#                 to position where hal has started.
+#        """
+#        return do_something()
+#
+#
 #    def deinit():
 #        """ De-initialise hal, stop any hardware.
 #        """
 #        do_something()
 #
 #
+#    def emergency_stop():
+#        """ Stop motors, spindle and heaters immediately. It can be called
+#        from any thread, movement which is being prepared is aborted and
+#        hal doesn't move anymore, machine should be restarted.
+#        """
+#        do_something()
+#
+#
 #    def watchdog_feed():
 #        """ Feed hardware watchdog. This method should be called at least
 #        once in 15 seconds. Also, this method can do no operation in hal
@@ -125,9 +156,17 @@ if 'calibrate' not in locals():
     raise NotImplementedError("hal.calibrate() not implemented")
 if 'move' not in locals():
     raise NotImplementedError("hal.move() not implemented")
+if 'hold' not in locals():
+    raise NotImplementedError("hal.hold() not implemented")
+if 'resume' not in locals():
+    raise NotImplementedError("hal.resume() not implemented")
 if 'join' not in locals():
     raise NotImplementedError("hal.join() not implemented")
+if 'get_position' not in locals():
+    raise NotImplementedError("hal.get_position() not implemented")
 if 'deinit' not in locals():
     raise NotImplementedError("hal.deinit() not implemented")
+if 'emergency_stop' not in locals():
+    raise NotImplementedError("hal.emergency_stop() not implemented")
 if 'watchdog_feed' not in locals():
     raise NotImplementedError("hal.watchdog_feed() not implemented")
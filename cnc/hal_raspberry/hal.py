@@ -1,21 +1,55 @@
 import time
+import bisect
+import threading
 
 from cnc.hal_raspberry import rpgpio
 from cnc.pulses import *
 from cnc.config import *
 from cnc.sensors import thermistor
 
-US_IN_SECONDS = 1000000
-
 gpio = rpgpio.GPIO()
-dma = rpgpio.DMAGPIO()
+dma = rpgpio.DMAGPIO(STEPPER_TICKS_PER_US)
 pwm = rpgpio.DMAPWM()
 watchdog = rpgpio.DMAWatchdog()
 
+# step pulse length, pulses and delays are in ticks, see TICKS_IN_SECONDS
+PULSE_LENGTH_TICKS = max(1, int(round(STEPPER_PULSE_LENGTH_US
+                                      * STEPPER_TICKS_PER_US)))
 STEP_PIN_MASK_X = 1 << STEPPER_STEP_PIN_X
 STEP_PIN_MASK_Y = 1 << STEPPER_STEP_PIN_Y
 STEP_PIN_MASK_Z = 1 << STEPPER_STEP_PIN_Z
 STEP_PIN_MASK_E = 1 << STEPPER_STEP_PIN_E
+# step pins for each combination of PulseGenerator's axises masks
+STEP_PINS_MASKS = list((STEP_PIN_MASK_X if m & AXIS_MASK_X else 0)
+                       | (STEP_PIN_MASK_Y if m & AXIS_MASK_Y else 0)
+                       | (STEP_PIN_MASK_Z if m & AXIS_MASK_Z else 0)
+                       | (STEP_PIN_MASK_E if m & AXIS_MASK_E else 0)
+                       for m in range(0, 16))
+# PulseGenerator's directions are inverted for inverted motors, so they are
+# multiplied by these signs to get direction of axis
+AXIS_MASKS = (AXIS_MASK_X, AXIS_MASK_Y, AXIS_MASK_Z, AXIS_MASK_E)
+DIRECTION_SIGNS = tuple(-1 if inverted else 1 for inverted in (
+    STEPPER_INVERTED_X, STEPPER_INVERTED_Y, STEPPER_INVERTED_Z,
+    STEPPER_INVERTED_E))
+# the last pulse of movement can finish after movement end, this time is
+# taken from the next movement
+__move_overtime_ticks = 0
+# hal doesn't move anymore after emergency stop
+__stopped = False
+# Feed hold state. Movements which have pulses in DMA buffer are kept, so
+# pulses after the point where machine stops can be uploaded again on resume.
+__lock = threading.RLock()
+__resumed = threading.Condition(__lock)
+__held = False
+__hold_point = None
+__movements = []
+# steps of each axis which were made by movements that are already forgotten
+__steps = [0, 0, 0, 0]
+# retiming after resume which continues into the next movement
+__retiming = None
+__recorder = None
+if numpy is not None:
+    STEP_PINS_MASKS_ARRAY = numpy.array(STEP_PINS_MASKS, dtype=numpy.uint32)
 
 
 def init():
@@ -152,7 +186,7 @@ def __calibrate_private(x, y, z, invert):
                          + STEPPER_PULSES_PER_MM_Z) / 3.0
     pulses_per_sec = CALIBRATION_VELOCITY_MM_PER_MIN / 60.0 * pulses_per_mm_avg
     end_time = time.time() + 1.2 * max_size / pulses_per_sec
-    delay = int(1000000 / pulses_per_sec)
+    delay = int(TICKS_IN_SECONDS / pulses_per_sec)
     last_pins = ~pins
     while time.time() < end_time:
         # check each axis end stop twice
@@ -182,12 +216,11 @@ def __calibrate_private(x, y, z, invert):
             # that if program unexpectedly stops, dma will continue work not
             # long then this buffer time.
             dma.clear()
-            generate = 1000000
+            generate = TICKS_IN_SECONDS
             while generate > 0:
-                dma.add_pulse(pins, STEPPER_PULSE_LENGTH_US)
+                dma.add_pulse(pins, PULSE_LENGTH_TICKS)
                 dma.add_delay(delay)
-                generate -= delay + STEPPER_PULSE_LENGTH_US
-            dma.finalize_stream()
+                generate -= delay + PULSE_LENGTH_TICKS
         if not dma.is_active():
             dma.run(False)
     return False
@@ -209,117 +242,572 @@ def calibrate(x, y, z):
     return __calibrate_private(x, y, z, False)  # move to endstop switch
 
 
+class _Movement(object):
+    def __init__(self, generator):
+        """ Pulses of movement which are kept while they are in DMA buffer,
+            so they can be retimed on feed hold.
+        :param generator: PulseGenerator object.
+        """
+        self.generator = generator
+        # tuples of index of the first pulse, directions, times and masks
+        self.chunks = []
+        self.count = 0
+        # steps of each axis and direction before each chunk, so position
+        # in the middle of movement is counted within a single chunk
+        self.starts = []
+        self.total = [0, 0, 0, 0]
+        # pulses in DMA buffer, tuples of buffer offset, index of the first
+        # pulse and number of control blocks till the end of each pulse
+        self.segments = []
+        # the number of pulses which were sent to DMA and the end of the last
+        # one, pulses are retimed if movement was resumed after feed hold
+        self.uploaded = 0
+        self.prev_ticks = 0
+        self.retiming = None
+        # all pulses were calculated
+        self.done = False
+
+    def add(self, directions, ticks, masks):
+        direction = self.direction(self.count)
+        self.starts.append((list(self.total), direction))
+        self.chunks.append((self.count, directions, ticks, masks))
+        self.count += len(ticks)
+        self.__count(directions, masks, direction, len(ticks),
+                     self.total)
+
+    @staticmethod
+    def __count(directions, masks, direction, end, steps):
+        # add steps of pulses before end of chunk to steps of each axis
+        begin = 0
+        for i, d in list((i, d) for i, d in directions if i < end) \
+                + [(end, None)]:
+            if i > begin:
+                part = masks[begin:i]
+                for axis, mask in enumerate(AXIS_MASKS):
+                    if numpy is not None and isinstance(part, numpy.ndarray):
+                        n = int(numpy.count_nonzero(part & mask))
+                    else:
+                        n = sum(1 for m in part if m & mask)
+                    steps[axis] += int(n * direction[axis]
+                                       * DIRECTION_SIGNS[axis])
+            begin = i
+            if d is not None:
+                direction = d
+
+    def steps(self, index):
+        """ Count steps which are made before pulse.
+        :param index: index of pulse, can be the number of pulses.
+        :return: list with signed number of steps for each axis.
+        """
+        for (first, directions, ticks, masks), (steps, direction) \
+                in zip(self.chunks, self.starts):
+            if index < first + len(ticks):
+                result = list(steps)
+                self.__count(directions, masks, direction, index - first,
+                             result)
+                return result
+        return list(self.total)
+
+    def time_ticks(self, index):
+        """ Get time of pulse in original timing.
+        :param index: index of pulse.
+        :return: time in ticks.
+        """
+        for first, _, ticks, _ in self.chunks:
+            if index < first + len(ticks):
+                return int(ticks[index - first])
+        return int(round(self.generator.total_time_s() * TICKS_IN_SECONDS))
+
+    def find(self, time_ticks, index):
+        """ Find the first pulse which isn't earlier then specified time.
+        :param time_ticks: time in original timing.
+        :param index: start search from this pulse.
+        :return: index of pulse or None if there is no such pulse.
+        """
+        for first, _, ticks, _ in self.chunks:
+            if (index >= first + len(ticks) or len(ticks) == 0
+                    or time_ticks > ticks[-1]):
+                continue
+            i = max(bisect.bisect_left(ticks, time_ticks), index - first)
+            return first + i
+        return None
+
+    def direction(self, index):
+        """ Get directions before pulse.
+        :param index: index of pulse.
+        :return: tuple with direction for each axis.
+        """
+        result = None
+        for first, directions, _, _ in self.chunks:
+            if first > index:
+                break
+            for i, d in directions:
+                if first + i <= index:
+                    result = d
+        return result
+
+    def pulses(self, index):
+        """ Iterate pulses which were calculated, in the same format as
+            PulseGenerator.chunks() does.
+        :param index: index of the first pulse.
+        :return: generator object.
+        """
+        for first, directions, ticks, masks in self.chunks:
+            if first + len(ticks) <= index:
+                continue
+            if index >= first:
+                offset = index - first
+                directions = [(0, self.direction(index))] + list(
+                    (i - offset, d) for i, d in directions if i > offset)
+                ticks = ticks[offset:]
+                masks = masks[offset:]
+            yield directions, ticks, masks
+
+
+def __set_directions(target, tx, ty, tz, te):
+    pins_to_set = 0
+    pins_to_clear = 0
+    if tx > 0:
+        pins_to_clear |= 1 << STEPPER_DIR_PIN_X
+    elif tx < 0:
+        pins_to_set |= 1 << STEPPER_DIR_PIN_X
+    if ty > 0:
+        pins_to_clear |= 1 << STEPPER_DIR_PIN_Y
+    elif ty < 0:
+        pins_to_set |= 1 << STEPPER_DIR_PIN_Y
+    if tz > 0:
+        pins_to_clear |= 1 << STEPPER_DIR_PIN_Z
+    elif tz < 0:
+        pins_to_set |= 1 << STEPPER_DIR_PIN_Z
+    if te > 0:
+        pins_to_clear |= 1 << STEPPER_DIR_PIN_E
+    elif te < 0:
+        pins_to_set |= 1 << STEPPER_DIR_PIN_E
+    target.add_set_clear(pins_to_set, pins_to_clear)
+
+
+def __delays_and_pins(ticks, masks, prev):
+    # delay before each pulse and step pins for each pulse
+    # TODO not a precise way! pulses will set in queue, instead of crossing
+    # if next pulse start during pulse length. Though it almost doesn't
+    # matter for pulses with 1-2us length.
+    if numpy is not None and isinstance(ticks, numpy.ndarray):
+        starts = numpy.empty_like(ticks)
+        starts[0] = prev
+        starts[1:] = ticks[:-1] + PULSE_LENGTH_TICKS
+        return ticks - starts, STEP_PINS_MASKS_ARRAY[masks]
+    delays = [k - p for k, p in zip(ticks, [prev] + [
+              t + PULSE_LENGTH_TICKS for t in ticks[:-1]])]
+    return delays, [STEP_PINS_MASKS[m] for m in masks]
+
+
+def __blocks(delays):
+    # number of control blocks till the end of each pulse, see add_pulses()
+    if numpy is not None and isinstance(delays, numpy.ndarray):
+        return numpy.cumsum(3 + (delays > 0).astype(numpy.int64))
+    ends = []
+    total = 0
+    for d in delays:
+        total += 4 if d > 0 else 3
+        ends.append(total)
+    return ends
+
+
+def __upload(target, movement, directions, ticks, masks):
+    # add pulses to DMA, pulses between directions changes are added at once
+    if movement.retiming is not None:
+        ticks = movement.retiming.retime(ticks)
+        masks = masks[:len(ticks)]
+        directions = list((i, d) for i, d in directions
+                          if i <= len(ticks))
+    prev = movement.prev_ticks
+    borders = list(i for i, _ in directions) + [len(ticks)]
+    begin = 0
+    for end, direction in zip(borders, [None] + directions):
+        if direction is not None:
+            __set_directions(target, *direction[1])
+        if end == begin:
+            continue
+        delays, pins = __delays_and_pins(ticks[begin:end], masks[begin:end],
+                                         prev)
+        address = target.add_pulses(delays, pins, PULSE_LENGTH_TICKS)
+        movement.segments.append((address, movement.uploaded + begin,
+                                  __blocks(delays)))
+        prev = int(ticks[end - 1]) + PULSE_LENGTH_TICKS
+        begin = end
+    movement.prev_ticks = prev
+    movement.uploaded += len(ticks)
+    return ticks
+
+
+def __finish(target, movement):
+    # keep the whole movement time, so the next movement starts in time,
+    # return time which the last pulse takes from the next movement
+    k = int(round(movement.generator.total_time_s() * TICKS_IN_SECONDS))
+    if movement.retiming is not None:
+        k = movement.retiming.finish()
+        if k is None:
+            return None
+    if k - movement.prev_ticks > 0:
+        target.add_delay(k - movement.prev_ticks)
+    return max(0, movement.prev_ticks - k)
+
+
+def __locate(cb):
+    # find movement and pulse which DMA runs, pulses before it are finished
+    if cb is None:
+        return None
+    size = dma.control_block_size()
+    ring = dma.buffer_size()
+    # buffer wraps around and blocks which DMA has run are overwritten, so
+    # the latest segment at the address is the one which is in buffer
+    found = None
+    nearest = None
+    for m, movement in enumerate(__movements):
+        for address, first, ends in movement.segments:
+            end = address + int(ends[-1]) * size
+            if address <= cb < end:
+                block = (cb - address) // size
+                if numpy is not None and isinstance(ends, numpy.ndarray):
+                    found = m, first + int(numpy.searchsorted(ends, block,
+                                                              'right'))
+                else:
+                    found = m, first + bisect.bisect_right(ends, block)
+                continue
+            # DMA runs direction or delay block, take the closest pulses
+            # segment before or after it
+            for distance, index in (((address - cb) % ring, first),
+                                    ((cb - end) % ring, first + len(ends))):
+                if nearest is None or distance <= nearest[0]:
+                    nearest = (distance, m, index)
+    if found is not None:
+        return found
+    if nearest is None:
+        return None
+    return nearest[1:]
+
+
+def __forget(count):
+    # forget movements which DMA has finished, their steps are kept
+    for movement in __movements[:count]:
+        for axis, steps in enumerate(movement.steps(movement.count)):
+            __steps[axis] += steps
+    del __movements[:count]
+
+
+def __wait_resume():
+    while __held and not __stopped:
+        __resumed.wait()
+
+
+def __wait_buffer(size):
+    # Wait till blocks can be added to DMA buffer without waiting inside
+    # DMAGPIO, call it with lock held. Lock is released while DMA frees
+    # space, so feed hold and position aren't blocked by DMA progress.
+    # Return False if hal has stopped.
+    while True:
+        __wait_resume()
+        if __stopped:
+            return False
+        if dma.is_free(size):
+            return True
+        if not dma.is_active():
+            # buffer is full with blocks which wait for run
+            dma.run_stream()
+        __resumed.wait(0.001)
+
+
 def move(generator):
     """ Move head to specified position
     :param generator: PulseGenerator object.
     """
-    # Fill buffer right before currently running(previous sequence) dma
-    # this mode implements kind of round buffer, but protects if CPU is not
-    # powerful enough to calculate buffer in advance, faster then machine
-    # moving. In this case machine would safely paused between commands until
-    # calculation is done.
-
+    # DMA buffer is a ring buffer and pulses are linked to the previous
+    # movement, so machine doesn't stop between movements if DMA is still
+    # running. Otherwise DMA starts when there are enough pulses in buffer,
+    # or when the whole movement is prepared if CPU is not powerful enough
+    # to calculate buffer faster then machine moves. In this case machine
+    # would safely paused between commands until calculation is done.
+
+    global __move_overtime_ticks, __retiming
     # enable steppers
     gpio.clear(STEPPERS_ENABLE_PIN)
-    # 4 control blocks per 32 bytes
-    bytes_per_iter = 4 * dma.control_block_size()
-    # prepare and run dma
-    dma.clear()  # should just clear current address, but not stop current DMA
-    prev = 0
-    is_ran = False
+    movement = _Movement(generator)
+    with __lock:
+        __wait_resume()
+        if __stopped:
+            return
+        # forget movements which DMA has finished
+        point = None
+        if dma.is_active():
+            point = __locate(dma.current_control_block())
+        __forget(len(__movements) if point is None else point[0])
+        __movements.append(movement)
+        movement.prev_ticks = __move_overtime_ticks
     instant = INSTANT_RUN
     st = time.time()
-    current_cb = 0
-    k = 0
-    k0 = 0
-    for direction, tx, ty, tz, te in generator:
-        if current_cb is not None:
-            while dma.current_address() + bytes_per_iter >= current_cb:
-                time.sleep(0.001)
-                current_cb = dma.current_control_block()
-                if current_cb is None:
-                    k0 = k
-                    st = time.time()
-                    break  # previous dma sequence has stopped
-        if direction:  # set up directions
-            pins_to_set = 0
-            pins_to_clear = 0
-            if tx > 0:
-                pins_to_clear |= 1 << STEPPER_DIR_PIN_X
-            elif tx < 0:
-                pins_to_set |= 1 << STEPPER_DIR_PIN_X
-            if ty > 0:
-                pins_to_clear |= 1 << STEPPER_DIR_PIN_Y
-            elif ty < 0:
-                pins_to_set |= 1 << STEPPER_DIR_PIN_Y
-            if tz > 0:
-                pins_to_clear |= 1 << STEPPER_DIR_PIN_Z
-            elif tz < 0:
-                pins_to_set |= 1 << STEPPER_DIR_PIN_Z
-            if te > 0:
-                pins_to_clear |= 1 << STEPPER_DIR_PIN_E
-            elif te < 0:
-                pins_to_set |= 1 << STEPPER_DIR_PIN_E
-            dma.add_set_clear(pins_to_set, pins_to_clear)
+    k0 = None
+    for directions, ticks, masks in generator.chunks():
+        with __lock:
+            if not __wait_buffer((4 * len(ticks) + len(directions))
+                                 * dma.control_block_size()):
+                return
+            if movement.count == 0 and __retiming is not None:
+                movement.retiming = __retiming.following(generator)
+                __retiming = None
+            movement.add(directions, ticks, masks)
+            ticks = __upload(dma, movement, directions, ticks, masks)
+            active = dma.is_active()
+        if len(ticks) == 0:
             continue
-        pins = 0
-        m = None
-        for i in (tx, ty, tz, te):
-            if i is not None and (m is None or i < m):
-                m = i
-        k = int(round(m * US_IN_SECONDS))
-        if tx is not None:
-            pins |= STEP_PIN_MASK_X
-        if ty is not None:
-            pins |= STEP_PIN_MASK_Y
-        if tz is not None:
-            pins |= STEP_PIN_MASK_Z
-        if te is not None:
-            pins |= STEP_PIN_MASK_E
-        if k - prev > 0:
-            dma.add_delay(k - prev)
-        dma.add_pulse(pins, STEPPER_PULSE_LENGTH_US)
-        # TODO not a precise way! pulses will set in queue, instead of crossing
-        # if next pulse start during pulse length. Though it almost doesn't
-        # matter for pulses with 1-2us length.
-        prev = k + STEPPER_PULSE_LENGTH_US
-        # instant run handling
-        if not is_ran and instant and current_cb is None:
-            if k - k0 > 100000:  # wait at least 100 ms is uploaded
-                nt = time.time() - st
-                ng = (k - k0) / 1000000.0
-                if nt > ng:
-                    logging.warn("Buffer preparing for instant run took more "
-                                 "time then buffer time"
-                                 " {}/{}".format(nt, ng))
-                    instant = False
-                else:
-                    dma.run_stream()
-                    is_ran = True
-    pt = time.time()
-    if not is_ran:
-        # after long command, we can fill short buffer, that why we may need to
-        #  wait until long command finishes
-        while dma.is_active():
-            time.sleep(0.01)
-        dma.run(False)
-    else:
-        # stream mode can be activated only if previous command was finished.
-        dma.finalize_stream()
+        if active:
+            k0 = None
+            continue
+        # instant run handling, DMA has stopped or hasn't started yet
+        k = int(ticks[-1])
+        if k0 is None:
+            k0 = int(ticks[0])
+            kt = time.time()
+        elif instant and k - k0 > TICKS_IN_SECONDS // 10:
+            # wait at least 100 ms uploaded
+            nt = time.time() - kt
+            ng = (k - k0) / float(TICKS_IN_SECONDS)
+            if nt > ng:
+                logging.warn("Buffer preparing for instant run took more "
+                             "time then buffer time"
+                             " {}/{}".format(nt, ng))
+                instant = False
+            else:
+                with __lock:
+                    if not __held:
+                        dma.run_stream()
+                k0 = None
+    with __lock:
+        if not __wait_buffer(dma.control_block_size()):
+            return
+        movement.done = True
+        __move_overtime_ticks = __finish(dma, movement)
+        __retiming = movement.retiming
+        pt = time.time()
+        dma.run_stream()
 
     logging.info("prepared in " + str(round(pt - st, 2)) + "s, estimated in "
                  + str(round(generator.total_time_s(), 2)) + "s")
 
 
+def __cut_address(movement, index):
+    # the last control block of pulse
+    for address, first, ends in movement.segments:
+        if first <= index < first + len(ends):
+            return address + ((int(ends[index - first]) - 1)
+                              * dma.control_block_size())
+    return None
+
+
+def __find_cut(lead_ticks):
+    # find pulse which DMA runs in lead time, pulses after it can be replaced
+    point = __locate(dma.current_control_block())
+    if point is None:
+        return None
+    m, index = point
+    target_ticks = __movements[m].time_ticks(index) + lead_ticks
+    while m < len(__movements):
+        movement = __movements[m]
+        cut = movement.find(target_ticks, max(index, 1))
+        if cut is not None and cut < movement.uploaded:
+            return m, cut
+        if not movement.done:
+            return None
+        target_ticks -= movement.time_ticks(movement.count)
+        index = 0
+        m += 1
+    return None
+
+
+def __brake(m, index, lead_ticks):
+    # Replace pulses of movement m from index with braking. Braking is
+    # recorded as relocatable control blocks and spliced into running
+    # sequence, it passes through the next movements if they are joined
+    # without full stop. If there are not enough pulses in buffer, machine
+    # stops at the end of them, as it would do without feed hold.
+    global __recorder, __hold_point
+    if __recorder is None:
+        __recorder = rpgpio.DMAGPIORecorder(dma.ticks_per_us())
+    movement = __movements[m]
+    address = __cut_address(movement, index - 1)
+    time_ticks = movement.time_ticks(index - 1)
+    point = (movement, index, time_ticks)
+    braking = _Movement(movement.generator)
+    braking.uploaded = index
+    braking.prev_ticks = time_ticks + PULSE_LENGTH_TICKS
+    braking.retiming = Retiming(movement.generator, time_ticks, time_ticks,
+                                True)
+    brakings = []
+    for following in __movements[m:]:
+        brakings.append((following, braking))
+        for chunk in following.pulses(index):
+            __upload(__recorder, braking, *chunk)
+        if braking.uploaded > index:
+            point = (following, braking.uploaded,
+                     following.time_ticks(braking.uploaded - 1))
+        if (braking.retiming.stopped or not following.done
+                or following is __movements[-1]):
+            break
+        prev = __finish(__recorder, braking)
+        if prev is None:
+            break
+        retiming = braking.retiming
+        braking = _Movement(__movements[__movements.index(following)
+                                        + 1].generator)
+        braking.prev_ticks = prev
+        braking.retiming = retiming.following(braking.generator)
+        if braking.retiming is None:
+            break
+        index = 0
+    # keep DMA busy after braking, so finished braking can't be confused
+    # with the end of replaced blocks
+    __recorder.add_delay(lead_ticks)
+    chunks = __recorder.pop_chunks()
+    new = dma.splice(address, chunks[0])
+    if new is None:
+        return False
+    for chunk in chunks[1:]:
+        dma.add_control_blocks(chunk)
+    # DMA runs braking instead of pulses after the cut, so it's located
+    # with pulses of movements, see __locate()
+    size = dma.control_block_size()
+    for following, braking in brakings:
+        for address, first, ends in braking.segments:
+            if address + int(ends[-1]) * size <= len(chunks[0]):
+                following.segments.append((new + address, first, ends))
+    __hold_point = point
+    return True
+
+
+def move_control_blocks(data):
+    """ Move head with DMA control blocks which were prepared in advance,
+    see cnc/job.py. Blocks are just copied into DMA buffer, there is no
+    pulses calculation, so DMA is started right away. Pulses of these blocks
+    are unknown, so feed hold doesn't brake in the middle of them.
+    :param data: bytes-like object with relocatable control blocks.
+    """
+    with __lock:
+        __wait_resume()
+        if __stopped:
+            return
+        # enable steppers
+        gpio.clear(STEPPERS_ENABLE_PIN)
+        __forget(len(__movements))
+        dma.add_control_blocks(data)
+        dma.run_stream()
+
+
+def hold():
+    """ Feed hold, brake with the maximum acceleration in the middle of
+    movement and stop. Pulses after the point where machine stops are kept
+    and run after resume(). It can be called from any thread.
+    """
+    global __held, __hold_point
+    with __lock:
+        if __held or __stopped:
+            return
+        __held = True
+        __hold_point = None
+        # DMA shouldn't reach replaced blocks while braking is calculated,
+        # try again further if it did
+        lead_ticks = FEED_HOLD_LEAD_TIME_MS * TICKS_IN_SECONDS // 1000
+        for _ in range(0, 5):
+            cut = __find_cut(lead_ticks)
+            if cut is None or __brake(cut[0], cut[1], lead_ticks):
+                break
+            lead_ticks *= 2
+        logging.info("hal feed hold")
+
+
+def resume():
+    """ Resume movements after hold(), machine accelerates with the maximum
+    acceleration till velocity of movements. It can be called from any
+    thread.
+    """
+    global __held, __hold_point, __move_overtime_ticks, __retiming
+    with __lock:
+        if not __held or __stopped:
+            return
+        # wait till braking is finished, lock is released while waiting, so
+        # position, movements and emergency stop aren't blocked by braking
+        while __hold_point is not None and dma.is_active():
+            __resumed.wait(0.001)
+            if not __held or __stopped:
+                return
+        if __hold_point is not None:
+            movement, index, time_ticks = __hold_point
+            __hold_point = None
+            __forget(__movements.index(movement))
+            retiming = Retiming(movement.generator, time_ticks, 0, False, 0.0)
+            prev = 0
+            for movement in __movements:
+                movement.segments = []
+                movement.uploaded = index
+                movement.prev_ticks = prev
+                movement.retiming = retiming
+                for chunk in movement.pulses(index):
+                    __upload(dma, movement, *chunk)
+                index = 0
+                if not movement.done:
+                    break
+                prev = __finish(dma, movement)
+                retiming = None
+                if movement is not __movements[-1]:
+                    if movement.retiming is not None:
+                        n = __movements[__movements.index(movement) + 1]
+                        retiming = movement.retiming.following(n.generator)
+                else:
+                    __move_overtime_ticks = prev
+                    __retiming = movement.retiming
+            dma.run_stream()
+        __held = False
+        __resumed.notify_all()
+        logging.info("hal resume")
+
+
 def join():
     """ Wait till motors work.
     """
     logging.info("hal join()")
-    # wait till dma works
-    while dma.is_active():
+    # wait till dma works, movements which are held aren't finished
+    while dma.is_active() or (__held and not __stopped):
         time.sleep(0.01)
 
 
+def get_position():
+    """ Get position of motors right now. Steps are counted up to the pulse
+    which DMA runs, so position is valid in the middle of movement. Pulses
+    of move_control_blocks() are unknown and are not counted. It can be
+    called from any thread.
+    :return: Coordinates object with position in millimeters relative to
+             position where hal has started.
+    """
+    with __lock:
+        steps = list(__steps)
+        if __hold_point is not None and not dma.is_active():
+            movement, index, _ = __hold_point
+            point = (__movements.index(movement), index)
+        else:
+            point = __locate(dma.pending_control_block())
+        for m, movement in enumerate(__movements):
+            if point is not None and m == point[0]:
+                done = movement.steps(point[1])
+            else:
+                done = movement.steps(movement.uploaded)
+            for axis in range(0, len(steps)):
+                steps[axis] += done[axis]
+            if point is not None and m == point[0]:
+                break
+    return Coordinates(float(steps[0]) / STEPPER_PULSES_PER_MM_X,
+                       float(steps[1]) / STEPPER_PULSES_PER_MM_Y,
+                       float(steps[2]) / STEPPER_PULSES_PER_MM_Z,
+                       float(steps[3]) / STEPPER_PULSES_PER_MM_E)
+
+
 def deinit():
     """ De-initialize hardware.
     """
@@ -333,6 +821,23 @@ def deinit():
     watchdog.stop()
 
 
+def emergency_stop():
+    """ Stop motors, spindle and heaters immediately. It can be called from
+    any thread, movement which is being prepared is aborted.
+    """
+    global __stopped
+    __stopped = True
+    dma.stop()
+    with __lock:
+        __resumed.notify_all()
+    disable_steppers()
+    pwm.remove_all()
+    gpio.clear(SPINDLE_PWM_PIN)
+    gpio.clear(EXTRUDER_HEATER_PIN)
+    gpio.clear(BED_HEATER_PIN)
+    logging.critical("Emergency stop")
+
+
 def watchdog_feed():
     """ Feed hardware watchdog.
     """
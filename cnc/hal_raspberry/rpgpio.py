@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
+import os
+
 from .rpgpio_private import *
+if SIMULATOR_ENV in os.environ:
+    from .rpgpio_simulator import *
 
 import time
 import logging
 import sys
 
+# NumPy is optional, it is used to encode a lot of control blocks at once.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class GPIO(object):
     MODE_OUTPUT = 1
@@ -83,19 +93,47 @@ class GPIO(object):
 class DMAGPIO(DMAProto):
     _DMA_CONTROL_BLOCK_SIZE = 32
     _DMA_CHANNEL = 4
+    _DMA_MEMORY_SIZE = 30 * 1024 * 1024
+    # PWM clock, FIFO is drained by 4 words per PWM period
+    _PWM_CLOCK_MHZ = 100
+    _PWM_WORDS_PER_PERIOD = 4
 
-    def __init__(self):
+    def __init__(self, ticks_per_us=4):
         """ Create object which control GPIO pins via DMA(Direct Memory
             Access).
             This object allows to add arbitrary sequence of pulses to any GPIO
             outputs and run this sequence in background without using CPU since
             DMA is a separated hardware module.
+            Pulses and delays are timed in ticks. DMA is paced with PWM FIFO,
+            each word which is written to FIFO takes one tick, and PWM range
+            is set for the specified resolution.
+            Buffer for control blocks is used as a ring buffer. Blocks can be
+            added while DMA is running, they are linked to the end of running
+            sequence and buffer wraps around when DMA runs ahead. If there is
+            no free space in buffer, methods which add blocks wait for DMA,
+            DMA is started if it isn't running yet.
             Note: keep this object out of garbage collector until it stops,
             otherwise memory will be unlocked and it could be overwritten by
             operating system.
+        :param ticks_per_us: number of ticks in microsecond, divider of 400.
         """
-        super(DMAGPIO, self).__init__(30 * 1024 * 1024, self._DMA_CHANNEL)
+        # FIFO words in microsecond if PWM period were one clock cycle
+        words_per_us = self._PWM_CLOCK_MHZ * self._PWM_WORDS_PER_PERIOD
+        if ticks_per_us <= 0 or words_per_us % ticks_per_us != 0:
+            raise ValueError("Wrong number of ticks in microsecond.")
+        super(DMAGPIO, self).__init__(self._DMA_MEMORY_SIZE,
+                                      self._DMA_CHANNEL)
+        self._ticks_per_us = ticks_per_us
+        self._pwm_range = words_per_us // ticks_per_us
         self.__current_address = 0
+        # the last added control block, its next field is always zero
+        self.__tail = None
+        # the first control block which wasn't passed to DMA yet
+        self.__pending = None
+        # the first control block since clear()
+        self.__start = 0
+        # channel is paused while blocks are linked, it's still active
+        self.__paused = False
 
         # get helpers registers, this class uses PWM module to create precise
         # delays
@@ -118,23 +156,116 @@ class DMAGPIO(DMAProto):
         self._pulse_stride = (DMA_TI_STRIDE_D_STRIDE(12)
                               | DMA_TI_STRIDE_S_STRIDE(4))
 
-    def add_pulse(self, pins_mask, length_us):
+    def __is_free(self, address, size):
+        # check if memory can be written without damaging blocks which are
+        # running or waiting to run
+        if self.is_active():
+            used = self.current_control_block()
+        else:
+            used = self.__pending
+        if used is None:  # DMA has just stopped
+            return True
+        # keep a gap between written and used blocks, otherwise they would
+        # be at the same address when buffer is full and empty
+        if used <= self.__current_address:
+            return address >= self.__current_address or address + size < used
+        # free space is between the last written and used blocks only, blocks
+        # at the buffer beginning are not run yet
+        return self.__current_address <= address and address + size < used
+
+    def __address(self, size):
+        # place for control blocks, they are written after the last ones
+        address = self.__current_address
+        if address + size > self._phys_memory.get_size():
+            address = 0  # wrap around
+        return address
+
+    def __allocate(self, size):
+        # find place for control blocks, wait for DMA if there is no free
+        # space in buffer
+        if size > self._phys_memory.get_size():
+            raise MemoryError("Out of allocated memory.")
+        address = self.__address(size)
+        while not self.__is_free(address, size):
+            if not self.is_active():
+                # buffer is full with blocks which wait for run
+                self.run_stream()
+            time.sleep(0.001)
+        return address
+
+    def __pause(self):
+        # pause channel after the current transfer, return False if it has
+        # already finished, END flag is cleared by writing 1, so it's kept.
+        # Flag is set ahead, so channel never looks idle to other threads.
+        self.__paused = True
+        cs = self._dma.read_int(self._DMA_CHANNEL_ADDRESS + DMA_CS)
+        if cs & DMA_CS_ACTIVE:
+            self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_CS,
+                                cs & ~(DMA_CS_ACTIVE | DMA_CS_END))
+            while True:
+                cs = self._dma.read_int(self._DMA_CHANNEL_ADDRESS + DMA_CS)
+                if cs & DMA_CS_PAUSED:
+                    return True
+                if self.current_control_block() is None:
+                    break
+        self.__paused = False
+        return False
+
+    def __resume(self):
+        cs = self._dma.read_int(self._DMA_CHANNEL_ADDRESS + DMA_CS)
+        self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_CS,
+                            (cs | DMA_CS_ACTIVE) & ~DMA_CS_END)
+        self.__paused = False
+
+    def __append(self, address, size):
+        # link just written blocks to the end of sequence
+        tail = address + size - self._DMA_CONTROL_BLOCK_SIZE
+        self._phys_memory.write_int(tail + 20, 0)
+        if self.__tail is None:
+            self.__pending = address
+            self.__start = address
+        elif address <= self.__tail < address + size:
+            # the last block is overwritten, blocks which DMA runs are never
+            # overwritten, so it has finished, linking would make a loop
+            if self.__pending is None:
+                self.__pending = address
+        else:
+            next_cb = self._phys_memory.get_bus_address() + address
+            if self.__pending is None and self.__pause():
+                # DMA could have loaded the last block already, with zero
+                # next address in its register, so the register is fixed
+                # too. Channel is paused before linking, so it can't load
+                # the next block or finish meanwhile.
+                self._phys_memory.write_int(self.__tail + 20, next_cb)
+                if self.current_control_block() == self.__tail:
+                    self._dma.write_int(self._DMA_CHANNEL_ADDRESS
+                                        + DMA_NEXTCONBK, next_cb)
+                self.__resume()
+            else:
+                # channel has finished before linking, so it hasn't run new
+                # blocks, they are run by run_stream()
+                self._phys_memory.write_int(self.__tail + 20, next_cb)
+                if self.__pending is None:
+                    self.__pending = address
+        self.__tail = tail
+        self.__current_address = address + size
+
+    def add_pulse(self, pins_mask, length):
         """ Add single pulse at the current position.
             Note: GPIO pins are not initialized in this method and should be
             initialized in advance before running.
             :param pins_mask: bitwise mask of GPIO pins to trigger. Only for
                               first 32 pins.
-            :param length_us: length in us.
+            :param length: length in ticks.
         """
-        next_cb = self.__current_address + 3 * self._DMA_CONTROL_BLOCK_SIZE
-        if next_cb > self._phys_memory.get_size():
-            raise MemoryError("Out of allocated memory.")
-        next3 = next_cb + self._phys_memory.get_bus_address()
+        size = 3 * self._DMA_CONTROL_BLOCK_SIZE
+        address = self.__allocate(size)
+        next3 = address + size + self._phys_memory.get_bus_address()
         next2 = next3 - self._DMA_CONTROL_BLOCK_SIZE
         next1 = next2 - self._DMA_CONTROL_BLOCK_SIZE
 
         source1 = next1 - 8  # last 8 bytes are padding, use it to store data
-        length2 = length_us << 4  # * 16
+        length2 = length << 2  # * 4, one word per tick
         source3 = next3 - 8
 
         data = (
@@ -148,113 +279,381 @@ class DMAGPIO(DMAProto):
             self._pulse_info, source3, self._pulse_destination,
             self._pulse_length, self._pulse_stride, next3, 0, pins_mask
                 )
-        self._phys_memory.write(self.__current_address, "24I", data)
-        self.__current_address = next_cb
+        self._phys_memory.write(address, "24I", data)
+        self.__append(address, size)
 
-    def add_delay(self, delay_us):
+    def add_delay(self, delay):
         """ Add delay at the current position.
-            :param delay_us: delay in us.
+            :param delay: delay in ticks.
         """
-        next_cb = self.__current_address + self._DMA_CONTROL_BLOCK_SIZE
-        if next_cb > self._phys_memory.get_size():
-            raise MemoryError("Out of allocated memory.")
-        next1 = self._phys_memory.get_bus_address() + next_cb
+        address = self.__allocate(self._DMA_CONTROL_BLOCK_SIZE)
+        next1 = (self._phys_memory.get_bus_address() + address
+                 + self._DMA_CONTROL_BLOCK_SIZE)
         source = next1 - 8  # last 8 bytes are padding, use it to store data
-        length = delay_us << 4  # * 16
+        length = delay << 2  # * 4, one word per tick
         data = (
                 self._delay_info, source, self._delay_destination, length,
                 self._delay_stride, next1, 0, 0
                )
-        self._phys_memory.write(self.__current_address, "8I", data)
-        self.__current_address = next_cb
+        self._phys_memory.write(address, "8I", data)
+        self.__append(address, self._DMA_CONTROL_BLOCK_SIZE)
+
+    def add_pulses(self, delays, pins_masks, length):
+        """ Add sequence of pulses at the current position. Each pulse is
+            preceded by delay, delay is skipped if it is not positive. This
+            is the same as calling add_delay() and add_pulse() for each pulse,
+            but all control blocks are encoded at once and written in a row,
+            with NumPy they are written directly into DMA memory.
+            :param delays: list or array with delay in ticks before each
+                           pulse.
+            :param pins_masks: list or array with bitwise mask of GPIO pins
+                               for each pulse.
+            :param length: length of each pulse in ticks.
+            :return: buffer offset of the first control block, or None if
+                     there are no pulses.
+        """
+        if numpy is None:
+            return self.__add_pulses_list(list(int(d) for d in delays),
+                                          list(int(m) for m in pins_masks),
+                                          length)
+        delays = numpy.asarray(delays, dtype=numpy.int64)
+        pins_masks = numpy.asarray(pins_masks, dtype=numpy.uint32)
+        if len(delays) == 0:
+            return None
+        with_delay = delays > 0
+        # each pulse takes 3 control blocks plus one for optional delay
+        ends = numpy.cumsum(3 + with_delay.astype(numpy.int64))
+        total = int(ends[-1])
+        size = total * self._DMA_CONTROL_BLOCK_SIZE
+        address = self.__allocate(size)
+        data = numpy.zeros((total, self._DMA_CONTROL_BLOCK_SIZE // 4),
+                           dtype=numpy.uint32)
+        # each block points to the next one and keeps data in its padding
+        next_cb = (numpy.arange(1, total + 1, dtype=numpy.uint32)
+                   * self._DMA_CONTROL_BLOCK_SIZE
+                   + numpy.uint32(self._phys_memory.get_bus_address()
+                                  + address))
+        data[:, 5] = next_cb
+        data[:, 1] = next_cb - 8
+        # delays
+        delay = ends[with_delay] - 4
+        data[delay, 0] = self._delay_info
+        data[delay, 2] = self._delay_destination
+        data[delay, 3] = delays[with_delay].astype(numpy.uint32) << 2
+        data[delay, 4] = self._delay_stride
+        # pulses, set, delay and clear blocks
+        pulse = ends - 3
+        data[pulse, 0] = self._pulse_info
+        data[pulse, 6] = pins_masks
+        data[pulse + 1, 0] = self._delay_info
+        data[pulse + 1, 1] = 0
+        data[pulse + 1, 2] = self._delay_destination
+        data[pulse + 1, 3] = length << 2  # * 4
+        data[pulse + 1, 4] = self._delay_stride
+        data[pulse + 2, 0] = self._pulse_info
+        data[pulse + 2, 7] = pins_masks
+        for i in (pulse, pulse + 2):
+            data[i, 2] = self._pulse_destination
+            data[i, 3] = self._pulse_length
+            data[i, 4] = self._pulse_stride
+        memory = numpy.frombuffer(self._phys_memory.get_buffer(),
+                                  dtype=numpy.uint32, count=data.size,
+                                  offset=address)
+        memory[:] = data.ravel()
+        del memory  # release buffer, mmap can't be closed while it exists
+        self.__append(address, size)
+        return address
+
+    def __add_pulses_list(self, delays, pins_masks, length):
+        # the same blocks as add_delay() and add_pulse() make, but in a row
+        total = sum(4 if d > 0 else 3 for d in delays)
+        if total == 0:
+            return None
+        size = total * self._DMA_CONTROL_BLOCK_SIZE
+        address = self.__allocate(size)
+        next_cb = self._phys_memory.get_bus_address() + address
+        data = []
+        for delay, pins_mask in zip(delays, pins_masks):
+            if delay > 0:
+                next_cb += self._DMA_CONTROL_BLOCK_SIZE
+                data += (self._delay_info, next_cb - 8,
+                         self._delay_destination, delay << 2,
+                         self._delay_stride, next_cb, 0, 0)
+            next_cb += 3 * self._DMA_CONTROL_BLOCK_SIZE
+            data += (
+                # set
+                self._pulse_info, next_cb - 72, self._pulse_destination,
+                self._pulse_length, self._pulse_stride, next_cb - 64,
+                pins_mask, 0,
+                # delay
+                self._delay_info, 0, self._delay_destination,
+                length << 2, self._delay_stride, next_cb - 32, 0, 0,
+                # clear
+                self._pulse_info, next_cb - 8, self._pulse_destination,
+                self._pulse_length, self._pulse_stride, next_cb, 0, pins_mask
+                )
+        self._phys_memory.write(address, "{}I".format(len(data)), data)
+        self.__append(address, size)
+        return address
 
     def add_set_clear(self, pins_to_set, pins_to_clear):
         """ Change state of gpio pins.
         :param pins_to_set: bitwise mask which pins should be set.
         :param pins_to_clear: bitwise mask which pins should be clear.
         """
-        next_cb = self.__current_address + self._DMA_CONTROL_BLOCK_SIZE
-        if next_cb > self._phys_memory.get_size():
-            raise MemoryError("Out of allocated memory.")
-        next1 = self._phys_memory.get_bus_address() + next_cb
+        address = self.__allocate(self._DMA_CONTROL_BLOCK_SIZE)
+        next1 = (self._phys_memory.get_bus_address() + address
+                 + self._DMA_CONTROL_BLOCK_SIZE)
         source = next1 - 8  # last 8 bytes are padding, use it to store data
         data = (
                 self._pulse_info, source, self._pulse_destination,
                 self._pulse_length, self._pulse_stride, next1,
                 pins_to_set, pins_to_clear
                )
-        self._phys_memory.write(self.__current_address, "8I", data)
-        self.__current_address = next_cb
+        self._phys_memory.write(address, "8I", data)
+        self.__append(address, self._DMA_CONTROL_BLOCK_SIZE)
 
-    def finalize_stream(self):
-        """ Mark last added block as the last one.
+    def add_control_blocks(self, data):
+        """ Add control blocks which were prepared in advance, for example
+            with DMAGPIORecorder. Blocks are copied to buffer as is, only
+            addresses in them are relocated, so there is no any encoding.
+        :param data: bytes-like object with relocatable control blocks.
+        """
+        size = len(data)
+        if size == 0 or size % self._DMA_CONTROL_BLOCK_SIZE != 0:
+            raise ValueError("Wrong size of control blocks.")
+        address = self.__allocate(size)
+        self._phys_memory.get_buffer()[address:address + size] = data
+        self._relocate(address, size, self._phys_memory.get_bus_address()
+                       + address)
+        self.__append(address, size)
+
+    def splice(self, address, data):
+        """ Replace control blocks which follow the block at specified offset
+            with blocks which were prepared in advance, while DMA is running.
+            Blocks which are added after this call are linked to the new
+            ones. Replaced blocks are just dropped, DMA doesn't run them.
+        :param address: buffer offset of the block after which new blocks
+                        run, DMA shouldn't have reached it yet.
+        :param data: bytes-like object with relocatable control blocks.
+        :return: buffer offset of new blocks or None if DMA has already run
+                 the block or isn't running, nothing is changed in this case.
         """
-        self._phys_memory.write_int(self.__current_address + 20
-                                    - self._DMA_CONTROL_BLOCK_SIZE, 0)
-        logging.info("DMA took {}MB of memory".
-                     format(round(self.__current_address / 1048576.0, 2)))
+        size = len(data)
+        if size == 0 or size % self._DMA_CONTROL_BLOCK_SIZE != 0:
+            raise ValueError("Wrong size of control blocks.")
+        start = self.current_control_block()
+        if start is None or self.__tail is None:
+            return None
+        # DMA runs blocks in order of buffer, which wraps around
+        ring = self._phys_memory.get_size()
+        if (address - start) % ring > (self.__tail - start) % ring:
+            return None  # block is behind DMA
+        new = self.__allocate(size)
+        self._phys_memory.get_buffer()[new:new + size] = data
+        bus_address = self._phys_memory.get_bus_address()
+        self._relocate(new, size, bus_address + new)
+        tail = new + size - self._DMA_CONTROL_BLOCK_SIZE
+        self._phys_memory.write_int(tail + 20, 0)
+        old_cb = self._phys_memory.read_int(address + 20)
+        self._phys_memory.write_int(address + 20, bus_address + new)
+        current = self.current_control_block()
+        if current == address:
+            # DMA could have loaded the block before it was changed, so it
+            # isn't known where it goes, make it go the old way
+            self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_NEXTCONBK,
+                                old_cb)
+            current = self.current_control_block()
+            if current == address:
+                current = None
+        if current is None or not (
+                new <= current < new + size
+                or (current - start) % ring < (address - start) % ring):
+            self._phys_memory.write_int(address + 20, old_cb)
+            return None
+        self.__tail = tail
+        self.__current_address = new + size
+        self.__pending = None
+        return new
+
+    def _relocate(self, address, size, offset):
+        # add offset to non zero source and next addresses of blocks, zero
+        # source is ignored and zero next is the end of sequence
+        offset &= 0xffffffff
+        if numpy is None:
+            for cb in range(address, address + size,
+                            self._DMA_CONTROL_BLOCK_SIZE):
+                for field in (cb + 4, cb + 20):
+                    value = self._phys_memory.read_int(field)
+                    if value != 0:
+                        self._phys_memory.write_int(
+                            field, (value + offset) & 0xffffffff)
+            return
+        memory = numpy.frombuffer(self._phys_memory.get_buffer(),
+                                  dtype=numpy.uint32, count=size // 4,
+                                  offset=address)
+        blocks = memory.reshape(-1, self._DMA_CONTROL_BLOCK_SIZE // 4)
+        for field in (1, 5):
+            column = blocks[:, field]
+            column[column != 0] += numpy.uint32(offset)
+        del column, blocks, memory  # release buffer
 
     def run_stream(self):
-        """ Run DMA module in stream mode, i.e. does'n finalize last block
-            and do not check if there is anything to do.
+        """ Run DMA module in stream mode, i.e. DMA runs all added blocks
+            which it hasn't run yet and blocks which are added while it is
+            running. Does nothing if DMA is already running all added blocks.
         """
+        if self.__pending is None:
+            return
         # configure PWM hardware module which will clocks DMA
         self._pwm.write_int(PWM_CTL, 0)
         # disable
         self._clock.write_int(CM_PWM_CNTL, CM_PASSWORD | CM_SRC_PLLD)
         while (self._clock.read_int(CM_PWM_CNTL) & CM_CNTL_BUSY) != 0:
             time.sleep(0.00001)  # 10 us, wait until BUSY bit is clear
-        # configure, 100 MHz
+        # configure, 100 MHz, range is set for one tick per FIFO word
         self._clock.write_int(CM_PWM_DIV, CM_PASSWORD | CM_DIV_VALUE(5))
         self._clock.write_int(CM_PWM_CNTL,
                               CM_PASSWORD | CM_SRC_PLLD | CM_CNTL_ENABLE)
-        self._pwm.write_int(PWM_RNG1, 100)
+        self._pwm.write_int(PWM_RNG1, self._pwm_range)
         self._pwm.write_int(PWM_DMAC, PWM_DMAC_ENAB | PWM_DMAC_PANIC(15)
                             | PWM_DMAC_DREQ(15))
         self._pwm.write_int(PWM_CTL, PWM_CTL_CLRF)
         # enable
         self._pwm.write_int(PWM_CTL, PWM_CTL_USEF1 | PWM_CTL_PWEN1)
-        super(DMAGPIO, self)._run_dma()
+        super(DMAGPIO, self)._run_dma(self.__pending)
+        self.__pending = None
 
     def run(self, loop=False):
-        """ Run DMA module and start sending specified pulses.
+        """ Run DMA module and start sending all pulses which were added
+            since clear().
         :param loop: If true, run pulse sequence in infinite loop. Otherwise
+                     run it once.
         """
-        if self.__current_address == 0:
+        if self.__tail is None:
             raise RuntimeError("Nothing was added.")
-        # fix 'next' field in previous control block
+        # fix 'next' field in the last control block
         if loop:
-            self._phys_memory.write_int(self.__current_address + 20
-                                        - self._DMA_CONTROL_BLOCK_SIZE,
-                                        self._phys_memory.get_bus_address())
-        else:
-            self.finalize_stream()
+            self._phys_memory.write_int(self.__tail + 20,
+                                        self._phys_memory.get_bus_address()
+                                        + self.__start)
+        self.__pending = self.__start
         self.run_stream()
 
     def stop(self):
-        """ Stop any DMA activities.
+        """ Stop any DMA activities. Blocks which weren't run are dropped.
         """
         self._pwm.write_int(PWM_CTL, 0)
         super(DMAGPIO, self)._stop_dma()
+        self.__pending = None
+        self.__tail = None
+        self.__paused = False
 
     def clear(self):
-        """ Remove any specified pulses. Doesn't affect currently running
-            sequence.
+        """ Remove any specified pulses and start new sequence, which is not
+            linked to the currently running one. Doesn't affect currently
+            running sequence.
         """
         self.__current_address = 0
+        self.__pending = None
+        self.__tail = None
+        self.__start = 0
+
+    def is_active(self):
+        """ Check if DMA is working. Channel which is paused while blocks are
+            linked to the running sequence is active too.
+        :return: boolean value
+        """
+        return self.__paused or super(DMAGPIO, self).is_active()
 
     def current_address(self):
-        """ Get current buffer offset.
+        """ Get current buffer offset, i.e. where the next control block is
+            going to be written unless buffer wraps around.
         :return: current buffer offset in bytes.
         """
         return self.__current_address
 
+    def pending_control_block(self):
+        """ Get the first control block which DMA hasn't finished yet.
+        :return: buffer offset of block which DMA runs, or which
+                 run_stream() starts from if DMA is stopped, None if all
+                 blocks were run.
+        """
+        cb = self.current_control_block()
+        if cb is not None and self.is_active():
+            return cb
+        return self.__pending
+
     def control_block_size(self):
         """ Get control block size.
         :return: control block size in bytes.
         """
         return self._DMA_CONTROL_BLOCK_SIZE
 
+    def buffer_size(self):
+        """ Get size of buffer for control blocks.
+        :return: size in bytes.
+        """
+        return self._phys_memory.get_size()
+
+    def is_free(self, size):
+        """ Check if control blocks can be added without waiting for DMA,
+            i.e. methods which add blocks wouldn't block.
+        :param size: size of blocks in bytes.
+        :return: boolean value.
+        """
+        if size > self._phys_memory.get_size():
+            return True  # adding raises error right away
+        return self.__is_free(self.__address(size), size)
+
+    def ticks_per_us(self):
+        """ Get resolution of pulses and delays.
+        :return: number of ticks in microsecond.
+        """
+        return self._ticks_per_us
+
+
+class DMAGPIORecorder(DMAGPIO):
+    _DMA_MEMORY_SIZE = 2 * 1024 * 1024
+
+    def __init__(self, ticks_per_us=4):
+        """ Create DMAGPIO object which never runs DMA. Instead, blocks which
+            would be run are collected as relocatable chunks, i.e. addresses
+            in them are offsets from the chunk beginning. Chunks can be
+            saved and added later with DMAGPIO.add_control_blocks().
+        :param ticks_per_us: number of ticks in microsecond, it should be the
+                             same as DMAGPIO which runs chunks has.
+        """
+        super(DMAGPIORecorder, self).__init__(ticks_per_us)
+        self.__chunks = []
+
+    def is_active(self):
+        return False
+
+    def run_stream(self):
+        """ Collect all added blocks to chunk and start new sequence.
+        """
+        size = self.current_address()
+        if size == 0:
+            return
+        # there is no running DMA, so blocks are always written from the
+        # buffer beginning
+        self._relocate(0, size, -self._phys_memory.get_bus_address())
+        self.__chunks.append(bytes(self._phys_memory.get_buffer()[0:size]))
+        self.clear()
+
+    def run(self, loop=False):
+        raise RuntimeError("Recorder can't run DMA.")
+
+    def pop_chunks(self):
+        """ Get chunks which were collected since the previous call.
+        :return: list of bytes objects with relocatable control blocks.
+        """
+        self.run_stream()
+        chunks = self.__chunks
+        self.__chunks = []
+        return chunks
+
 
 class DMAPWM(DMAProto):
     _DMA_CONTROL_BLOCK_SIZE = 32
@@ -439,8 +838,8 @@ def main():
     print("now " + hex(a))
     del cma
     dg = DMAGPIO()
-    dg.add_pulse(1 << pin, 200000)
-    dg.add_delay(600000)
+    dg.add_pulse(1 << pin, 200000 * dg.ticks_per_us())
+    dg.add_delay(600000 * dg.ticks_per_us())
     dg.run(True)
     print("dmagpio is started")
     try:
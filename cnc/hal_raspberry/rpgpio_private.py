@@ -11,26 +11,32 @@ import ctypes
 # https://www.raspberrypi.org/wp-content/uploads/2012/02/BCM2835-ARM-Peripherals.pdf
 RPI1_PERI_BASE = 0x20000000
 RPI2_3_PERI_BASE = 0x3F000000
+# Software simulation of hardware is used instead of real registers if this
+# environment variable is set, see rpgpio_simulator.py
+SIMULATOR_ENV = "PYCNC_RPGPIO_SIMULATOR"
 # detect board version
-try:
-    with open("/proc/cpuinfo", "r") as f:
-        d = f.read()
-        r = re.search("^Revision\s+:\s+(.+)$", d, flags=re.MULTILINE)
-        h = re.search("^Hardware\s+:\s+(.+)$", d, flags=re.MULTILINE)
-        RPI_1_REVISIONS = ['0002', '0003', '0004', '0005', '0006', '0007',
-                           '0008', '0009', '000d', '000e', '000f', '0010',
-                           '0011', '0012', '0013', '0014', '0015', '900021',
-                           '900032']
-        if h is None:
-            raise ImportError("This is not raspberry pi board.")
-        elif r.group(1) in RPI_1_REVISIONS:
-            PERI_BASE = RPI1_PERI_BASE
-        elif "BCM2" in h.group(1):
-            PERI_BASE = RPI2_3_PERI_BASE
-        else:
-            raise ImportError("Unknown board.")
-except IOError:
-    raise ImportError("/proc/cpuinfo not found. Not Linux device?")
+if SIMULATOR_ENV in os.environ:
+    PERI_BASE = RPI2_3_PERI_BASE
+else:
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            d = f.read()
+            r = re.search("^Revision\s+:\s+(.+)$", d, flags=re.MULTILINE)
+            h = re.search("^Hardware\s+:\s+(.+)$", d, flags=re.MULTILINE)
+            RPI_1_REVISIONS = ['0002', '0003', '0004', '0005', '0006',
+                               '0007', '0008', '0009', '000d', '000e',
+                               '000f', '0010', '0011', '0012', '0013',
+                               '0014', '0015', '900021', '900032']
+            if h is None:
+                raise ImportError("This is not raspberry pi board.")
+            elif r.group(1) in RPI_1_REVISIONS:
+                PERI_BASE = RPI1_PERI_BASE
+            elif "BCM2" in h.group(1):
+                PERI_BASE = RPI2_3_PERI_BASE
+            else:
+                raise ImportError("Unknown board.")
+    except IOError:
+        raise ImportError("/proc/cpuinfo not found. Not Linux device?")
 PAGE_SIZE = 4096
 GPIO_REGISTER_BASE = 0x200000
 GPIO_INPUT_OFFSET = 0x34
@@ -58,6 +64,7 @@ DMA_TI_DEST_DREQ = 1 << 6
 DMA_CS_RESET = 1 << 31
 DMA_CS_ABORT = 1 << 30
 DMA_CS_DISDEBUG = 1 << 28
+DMA_CS_PAUSED = 1 << 4
 DMA_CS_END = 1 << 1
 DMA_CS_ACTIVE = 1 << 0
 DMA_TI_PER_MAP_PWM = 5
@@ -144,6 +151,12 @@ class PhysicalMemory(object):
     def read_int(self, address):
         return ctypes.c_uint32.from_buffer(self._memmap, address).value
 
+    def get_buffer(self):
+        """ Get writable object with buffer interface for the whole memory,
+            it can be used to create memoryview or NumPy array over memory.
+        """
+        return self._memmap
+
     def get_size(self):
         return self._size
 
@@ -210,12 +223,13 @@ class DMAProto(object):
         # prepare dma registers memory map
         self._dma = PhysicalMemory(PERI_BASE + DMA_BASE)
 
-    def _run_dma(self):
+    def _run_dma(self, address=0):
         """ Run DMA module from created buffer.
+        :param address: offset of the first control block in buffer.
         """
         self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_CS, DMA_CS_END)
         self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_CONBLK_AD,
-                            self._phys_memory.get_bus_address())
+                            self._phys_memory.get_bus_address() + address)
         cs = DMA_CS_PRIORITY(7) | DMA_CS_PANIC_PRIORITY(7) | DMA_CS_DISDEBUG
         self._dma.write_int(self._DMA_CHANNEL_ADDRESS + DMA_CS, cs)
         cs |= DMA_CS_ACTIVE
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# Software simulation of Raspberry Pi memory, GPIO and DMA modules. It allows
+# to run rpgpio and hal_raspberry on any computer, for testing and profiling
+# purpose. To use it, set PYCNC_RPGPIO_SIMULATOR environment variable before
+# importing any module of this package. The value of variable is simulation
+# speed, i.e. how many simulated seconds pass in one real second, or 'instant'
+# to run DMA sequences as fast as possible, for example:
+#     PYCNC_RPGPIO_SIMULATOR=instant ./pycnc file.gcode
+
+from .rpgpio_private import *
+from .rpgpio_private import DMAProto as _DMAProto
+
+import os
+import mmap
+import struct
+import ctypes
+import time
+import threading
+
+PHYSICAL_PERI_BUS = 0x7E000000
+# There is no real pacing clock for transfers which are not paced with PWM,
+# each control block takes some time and each transfer waits for wait cycles
+# of DMA clock. Values are chosen to be close to real hardware, i.e. DMAPWM
+# loop takes ~11.5 KHz and DMAWatchdog fires in ~15 seconds.
+CONTROL_BLOCK_TIME_US = 0.34
+DMA_CLOCK_MHZ = 70.0
+# PWM FIFO size in words
+PWM_FIFO_WORDS = 16
+# PWM clock sources
+CM_SOURCES_MHZ = {CM_SRC_OSC: 19.2, CM_SRC_PLLC: 1000.0, CM_SRC_PLLD: 500.0,
+                  CM_SRC_HDMI: 216.0}
+# DMA control blocks fields
+DMA_TI_PER_MAP_MASK = 0x1f << 16
+DMA_TI_WAITS_MASK = 0x1f << 21
+DMA_CHANNELS = 15
+DMA_CHANNEL_SIZE = 0x100
+# limit number of control blocks which are executed at once
+MAX_BLOCKS_PER_ADVANCE = 100000
+# speed for 'instant' mode, simulated time just runs very fast
+INSTANT_SPEED = 1000000.0
+
+
+def _signed16(v):
+    v &= 0xffff
+    if v & 0x8000:
+        return v - 0x10000
+    return v
+
+
+class _Channel(object):
+    def __init__(self, number):
+        self.number = number
+        self.active = False
+        self.time_us = 0.0
+        # address of running control block and time when it ends
+        self.control_block = 0
+        self.end_time_us = 0.0
+        # remaining time of control block when channel is paused
+        self.paused_us = None
+
+
+class DMAEngine(object):
+    def __init__(self, speed):
+        """ Simulated DMA engine. DMA sequences are executed lazily, every
+            access to DMA or GPIO registers runs all DMA channels up to the
+            current simulated time. If the same control block is reached
+            twice while channels are running, sequence is a loop and its
+            full iterations are skipped, i.e. they are not traced.
+        :param speed: simulated time speed, i.e. how many simulated seconds
+                      pass in one real second.
+        """
+        self.speed = speed
+        # list of GPIO changes made by DMA, tuples of channel number, time in
+        # us, mask of set pins and mask of cleared pins. None to disable.
+        self.gpio_trace = None
+        self._lock = threading.RLock()
+        self._start_time = time.time()
+        self._time_offset_us = 0.0
+        self._channels = [_Channel(i) for i in range(0, DMA_CHANNELS)]
+        # peripheral registers, physical address and mmap
+        self._peripherals = dict()
+        # CMA memory, list of tuples of bus address, size and mmap
+        self._cma = []
+        self._cma_next = 0x10000000
+        # time when PWM FIFO becomes empty
+        self._fifo_time_us = 0.0
+
+    def set_speed(self, speed):
+        """ Change simulated time speed.
+        :param speed: new speed, see __init__().
+        """
+        with self._lock:
+            self._time_offset_us = self.now_us()
+            self._start_time = time.time()
+            self.speed = speed
+
+    def now_us(self):
+        """ Get current simulated time.
+        :return: time in us.
+        """
+        return (self._time_offset_us + (time.time() - self._start_time)
+                * self.speed * 1000000.0)
+
+    def peripheral(self, phys_address, size):
+        """ Get memory for peripheral registers. All objects which map the
+            same address get the same memory.
+        :param phys_address: physical address, aligned to page size.
+        :param size: size of memory.
+        :return: mmap object.
+        """
+        with self._lock:
+            memory = self._peripherals.get(phys_address)
+            if memory is None or len(memory) < size:
+                memory = mmap.mmap(-1, size)
+                self._peripherals[phys_address] = memory
+            return memory
+
+    def allocate(self, size):
+        """ Allocate memory which is accessible by DMA.
+        :param size: size in bytes.
+        :return: tuple of bus address and mmap object.
+        """
+        with self._lock:
+            bus_address = 0xC0000000 | self._cma_next
+            self._cma_next += size
+            memory = mmap.mmap(-1, size)
+            self._cma.append((bus_address, size, memory))
+            return bus_address, memory
+
+    def free(self, bus_address):
+        """ Free memory which was allocated with allocate().
+        :param bus_address: bus address of memory.
+        """
+        with self._lock:
+            self._cma = list(m for m in self._cma if m[0] != bus_address)
+
+    def __find(self, bus_address):
+        # find memory and offset in it for bus address
+        if PHYSICAL_PERI_BUS <= bus_address < PHYSICAL_PERI_BUS + 0x1000000:
+            return self.__find_peripheral(bus_address - PHYSICAL_PERI_BUS
+                                          + PERI_BASE)
+        else:
+            for base, size, memory in self._cma:
+                if base <= bus_address < base + size:
+                    return memory, bus_address - base
+        raise MemoryError("DMA accessed unknown memory at "
+                          + hex(bus_address))
+
+    def __find_peripheral(self, phys_address):
+        for base, memory in self._peripherals.items():
+            if base <= phys_address < base + len(memory):
+                return memory, phys_address - base
+        raise MemoryError("Unknown peripheral at " + hex(phys_address))
+
+    def __read(self, bus_address):
+        memory, offset = self.__find(bus_address)
+        return struct.unpack_from("I", memory, offset)[0]
+
+    def __register(self, base, offset):
+        memory = self._peripherals.get(base)
+        if memory is None:
+            return 0
+        return struct.unpack_from("I", memory, offset)[0]
+
+    def __set_register(self, base, offset, value):
+        memory = self.peripheral(base, PAGE_SIZE)
+        struct.pack_into("I", memory, offset, value & 0xffffffff)
+
+    def __gpio(self, offset, value, channel):
+        # handle write to GPIO set and clear registers, trace DMA writes
+        base = PERI_BASE + GPIO_REGISTER_BASE
+        level = self.__register(base, GPIO_INPUT_OFFSET)
+        if offset == GPIO_SET_OFFSET:
+            level |= value
+        else:
+            level &= ~value
+        self.__set_register(base, GPIO_INPUT_OFFSET, level)
+        if channel is not None and self.gpio_trace is not None:
+            if offset == GPIO_SET_OFFSET:
+                self.gpio_trace.append((channel.number, channel.time_us,
+                                        value, 0))
+            else:
+                self.gpio_trace.append((channel.number, channel.time_us,
+                                        0, value))
+
+    def __write(self, bus_address, value, channel):
+        memory, offset = self.__find(bus_address)
+        struct.pack_into("I", memory, offset, value)
+        if memory is self._peripherals.get(PERI_BASE + GPIO_REGISTER_BASE):
+            if offset in (GPIO_SET_OFFSET, GPIO_CLEAR_OFFSET):
+                self.__gpio(offset, value, channel)
+
+    def __pwm_words_per_us(self):
+        # DMA requests from PWM FIFO, each request transfers one word
+        pwm = PERI_BASE + PWM_BASE
+        clock = PERI_BASE + CM_BASE
+        if (self.__register(pwm, PWM_CTL) & PWM_CTL_PWEN1 == 0
+                or self.__register(pwm, PWM_DMAC) & PWM_DMAC_ENAB == 0):
+            return None
+        control = self.__register(clock, CM_PWM_CNTL)
+        divider = (self.__register(clock, CM_PWM_DIV) >> 12) & 0xfff
+        pwm_range = self.__register(pwm, PWM_RNG1)
+        source = CM_SOURCES_MHZ.get(control & 0xf)
+        if (control & CM_CNTL_ENABLE == 0 or source is None or divider == 0
+                or pwm_range == 0):
+            return None
+        # FIFO is filled with 4 words per PWM period
+        return 4.0 * source / divider / pwm_range
+
+    def __execute(self, channel):
+        # run control block, return its duration in us
+        info, source, destination, length, stride, next_cb = \
+            struct.unpack_from("6I", *self.__find(channel.control_block))
+        dma = PERI_BASE + DMA_BASE
+        address = channel.number * DMA_CHANNEL_SIZE
+        self.__set_register(dma, address + DMA_NEXTCONBK, next_cb)
+        if info & DMA_TI_TDMODE:
+            rows = (length >> 16) & 0x3fff
+            row_length = length & 0xffff
+            source_stride = _signed16(stride)
+            destination_stride = _signed16(stride >> 16)
+        else:
+            rows = 1
+            row_length = length
+            source_stride = 0
+            destination_stride = 0
+        words = rows * (row_length // 4)
+        if (info & DMA_TI_DEST_DREQ and info & DMA_TI_PER_MAP_MASK
+                == DMA_TI_PER_MAP(DMA_TI_PER_MAP_PWM)):
+            # PWM paced transfer, data goes to FIFO which is drained by PWM
+            # with constant rate, so overhead of other blocks is absorbed
+            # while FIFO isn't empty
+            rate = self.__pwm_words_per_us()
+            if rate is None:
+                return float("inf")  # DMA waits for DREQ forever
+            self._fifo_time_us = (max(self._fifo_time_us, channel.time_us)
+                                  + words / rate)
+            return max(0.0, self._fifo_time_us - PWM_FIFO_WORDS / rate
+                       - channel.time_us)
+        if not info & DMA_DEST_IGNORE:
+            for _ in range(0, rows):
+                for _ in range(0, row_length // 4):
+                    if info & DMA_SRC_IGNORE:
+                        value = 0
+                    else:
+                        value = self.__read(source)
+                    self.__write(destination, value, channel)
+                    if info & DMA_TI_SRC_INC:
+                        source += 4
+                    if info & DMA_TI_DEST_INC:
+                        destination += 4
+                source += source_stride
+                destination += destination_stride
+        waits = (info & DMA_TI_WAITS_MASK) >> 21
+        return CONTROL_BLOCK_TIME_US + words * waits / DMA_CLOCK_MHZ
+
+    def __load(self, channel, control_block):
+        dma = PERI_BASE + DMA_BASE
+        address = channel.number * DMA_CHANNEL_SIZE
+        self.__set_register(dma, address + DMA_CONBLK_AD, control_block)
+        channel.control_block = control_block
+        if control_block == 0:
+            channel.active = False
+            channel.paused_us = None
+            cs = self.__register(dma, address + DMA_CS)
+            cs = (cs & ~DMA_CS_ACTIVE) | DMA_CS_END
+            self.__set_register(dma, address + DMA_CS, cs)
+            return
+        channel.end_time_us = channel.time_us + self.__execute(channel)
+
+    def __advance(self, channel, now_us):
+        dma = PERI_BASE + DMA_BASE
+        address = channel.number * DMA_CHANNEL_SIZE
+        visited = dict()
+        for _ in range(0, MAX_BLOCKS_PER_ADVANCE):
+            if not channel.active or channel.end_time_us > now_us:
+                break
+            channel.time_us = channel.end_time_us
+            control_block = self.__register(dma, address + DMA_NEXTCONBK)
+            if control_block in visited:
+                # skip full iterations of loop
+                period = channel.time_us - visited[control_block]
+                channel.time_us += ((now_us - channel.time_us) // period
+                                    * period)
+                visited.clear()
+            visited[control_block] = channel.time_us
+            self.__load(channel, control_block)
+
+    def advance(self):
+        """ Run all active DMA channels up to the current simulated time.
+        """
+        with self._lock:
+            now_us = self.now_us()
+            for channel in self._channels:
+                self.__advance(channel, now_us)
+
+    def write_register(self, phys_address, value):
+        """ Handle CPU write to peripheral registers.
+        :param phys_address: physical address of register.
+        :param value: written value.
+        """
+        with self._lock:
+            self.advance()
+            dma = PERI_BASE + DMA_BASE
+            if dma <= phys_address < dma + DMA_CHANNELS * DMA_CHANNEL_SIZE:
+                channel = self._channels[(phys_address - dma)
+                                         // DMA_CHANNEL_SIZE]
+                if (phys_address - dma) % DMA_CHANNEL_SIZE == DMA_CS:
+                    self.__dma_cs(channel, value)
+                    return
+            memory, offset = self.__find_peripheral(phys_address)
+            struct.pack_into("I", memory, offset, value)
+            base = PERI_BASE + GPIO_REGISTER_BASE
+            if phys_address - base in (GPIO_SET_OFFSET, GPIO_CLEAR_OFFSET):
+                self.__gpio(phys_address - base, value, None)
+
+    def __dma_cs(self, channel, value):
+        dma = PERI_BASE + DMA_BASE
+        address = channel.number * DMA_CHANNEL_SIZE
+        value &= ~DMA_CS_PAUSED
+        if value & (DMA_CS_ABORT | DMA_CS_RESET):
+            channel.active = False
+            channel.paused_us = None
+            self.__set_register(dma, address + DMA_CONBLK_AD, 0)
+            value &= ~DMA_CS_ACTIVE
+        elif (value & DMA_CS_ACTIVE and not channel.active
+                and channel.paused_us is not None):
+            # paused channel continues the same control block
+            channel.active = True
+            channel.end_time_us = self.now_us() + channel.paused_us
+            channel.paused_us = None
+        elif value & DMA_CS_ACTIVE and not channel.active:
+            channel.active = True
+            channel.time_us = self.now_us()
+            self.__load(channel, self.__register(dma, address
+                                                 + DMA_CONBLK_AD))
+            if not channel.active:
+                value &= ~DMA_CS_ACTIVE
+        elif not value & DMA_CS_ACTIVE:
+            if channel.active:
+                channel.paused_us = max(0.0, channel.end_time_us
+                                        - self.now_us())
+                value |= DMA_CS_PAUSED
+            channel.active = False
+        # END flag is cleared by writing 1
+        cs = self.__register(dma, address + DMA_CS)
+        if value & DMA_CS_END:
+            cs &= ~DMA_CS_END
+        value = (value & ~DMA_CS_END) | (cs & DMA_CS_END)
+        self.__set_register(dma, address + DMA_CS, value)
+
+
+_speed = os.environ.get(SIMULATOR_ENV, "instant")
+engine = DMAEngine(INSTANT_SPEED if _speed == "instant" else float(_speed))
+
+
+class PhysicalMemory(object):
+    def __init__(self, phys_address, size=PAGE_SIZE):
+        """ Create object which maps simulated physical memory.
+        :param phys_address: based address of physical memory
+        """
+        self._size = size
+        phys_address -= phys_address % PAGE_SIZE
+        self._phys_address = phys_address
+        self._memmap = engine.peripheral(phys_address, size)
+
+    def write_int(self, address, int_value):
+        engine.write_register(self._phys_address + address, int_value)
+
+    def write(self, address, fmt, data):
+        struct.pack_into(fmt, self._memmap, address, *data)
+
+    def read_int(self, address):
+        engine.advance()
+        return ctypes.c_uint32.from_buffer(self._memmap, address).value
+
+    def get_buffer(self):
+        """ Get writable object with buffer interface for the whole memory,
+            it can be used to create memoryview or NumPy array over memory.
+        """
+        return self._memmap
+
+    def get_size(self):
+        return self._size
+
+
+class CMAPhysicalMemory(PhysicalMemory):
+    def __init__(self, size):
+        """ Allocate simulated continuous memory which is accessible by DMA.
+        :param size: number of bytes to allocate
+        """
+        size = (size + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+        self._size = size
+        self._bus_memory, self._memmap = engine.allocate(size)
+        self._phys_address = self.get_phys_address()
+
+    def free(self):
+        """Release and free allocated memory
+        """
+        engine.free(self._bus_memory)
+
+    def write_int(self, address, int_value):
+        ctypes.c_uint32.from_buffer(self._memmap, address).value = int_value
+
+    def read_int(self, address):
+        return ctypes.c_uint32.from_buffer(self._memmap, address).value
+
+    def get_bus_address(self):
+        return self._bus_memory
+
+    def get_phys_address(self):
+        return self._bus_memory & ~0xc0000000
+
+
+class DMAProto(_DMAProto):
+    def __init__(self, memory_size, dma_channel):
+        """ This class provides basic access to simulated DMA and creates
+            buffer for control blocks.
+        """
+        self._DMA_CHANNEL_ADDRESS = 0x100 * dma_channel
+        # allocate buffer for control blocks
+        self._phys_memory = CMAPhysicalMemory(memory_size)
+        # prepare dma registers memory map
+        self._dma = PhysicalMemory(PERI_BASE + DMA_BASE)
+
+
+# for benchmarking purpose
+def main():
+    import sys
+    import cProfile
+    from cnc.hal_raspberry import hal
+    from cnc.pulses import PulseGeneratorLinear
+    from cnc.coordinates import Coordinates
+    engine.set_speed(INSTANT_SPEED)
+    generators = list(PulseGeneratorLinear(Coordinates(x, -x / 2.0, 1, 0),
+                                           1000)
+                      for x in (5, 10, 20))
+    if "--profile" in sys.argv:
+        cProfile.runctx("for g in generators: hal.move(g)", globals(),
+                        {"hal": hal, "generators": generators},
+                        sort="cumulative")
+        return
+    for g in generators:
+        st = time.time()
+        hal.move(g)
+        hal.join()
+        print("{} pulses uploaded in {}s".format(
+              sum(len(c[1]) for c in g.chunks()), round(time.time() - st, 3)))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ from cnc.config import *
     It checks PulseGenerator with some tests.
 """
 
+# position of motors, movements are done instantly
+__position = Coordinates(0.0, 0.0, 0.0, 0.0)
+
 
 def init():
     """ Initialize GPIO pins and machine itself.
@@ -80,95 +83,87 @@ def calibrate(x, y, z):
     return True
 
 
-# noinspection PyUnusedLocal
 def move(generator):
     """ Move head to specified position.
     :param generator: PulseGenerator object.
     """
+    global __position
     delta = generator.delta()
     ix = iy = iz = ie = 0
     lx, ly, lz, le = None, None, None, None
-    dx, dy, dz, de = 0, 0, 0, 0
     mx, my, mz, me = 0, 0, 0, 0
     cx, cy, cz, ce = 0, 0, 0, 0
     direction_x, direction_y, direction_z, direction_e = 1, 1, 1, 1
     st = time.time()
     direction_found = False
-    for direction, tx, ty, tz, te in generator:
-        if direction:
-            direction_found = True
-            direction_x, direction_y, direction_z, direction_e = tx, ty, tz, te
-            if STEPPER_INVERTED_X:
-                direction_x = -direction_x
-            if STEPPER_INVERTED_Y:
-                direction_y = -direction_y
-            if STEPPER_INVERTED_Z:
-                direction_z = -direction_z
-            if STEPPER_INVERTED_E:
-                direction_e = -direction_e
-            if isinstance(generator, PulseGeneratorLinear):
-                assert ((direction_x < 0 and delta.x < 0)
-                        or (direction_x > 0 and delta.x > 0) or delta.x == 0)
-                assert ((direction_y < 0 and delta.y < 0)
-                        or (direction_y > 0 and delta.y > 0) or delta.y == 0)
-                assert ((direction_z < 0 and delta.z < 0)
-                        or (direction_z > 0 and delta.z > 0) or delta.z == 0)
-                assert ((direction_e < 0 and delta.e < 0)
-                        or (direction_e > 0 and delta.e > 0) or delta.e == 0)
-            continue
-        if tx is not None:
-            if tx > mx:
-                mx = tx
-            tx = int(round(tx * 1000000))
-            ix += direction_x
-            cx += 1
-            if lx is not None:
-                dx = tx - lx
-                assert dx > 0, "negative or zero time delta detected for x"
-            lx = tx
-        else:
-            dx = None
-        if ty is not None:
-            if ty > my:
-                my = ty
-            ty = int(round(ty * 1000000))
-            iy += direction_y
-            cy += 1
-            if ly is not None:
-                dy = ty - ly
-                assert dy > 0, "negative or zero time delta detected for y"
-            ly = ty
-        else:
-            dy = None
-        if tz is not None:
-            if tz > mz:
-                mz = tz
-            tz = int(round(tz * 1000000))
-            iz += direction_z
-            cz += 1
-            if lz is not None:
-                dz = tz - lz
-                assert dz > 0, "negative or zero time delta detected for z"
-            lz = tz
-        else:
-            dz = None
-        if te is not None:
-            if te > me:
-                me = te
-            te = int(round(te * 1000000))
-            ie += direction_e
-            ce += 1
-            if le is not None:
-                de = te - le
-                assert de > 0, "negative or zero time delta detected for e"
-            le = te
-        else:
-            de = None
-        # very verbose, uncomment on demand
-        # logging.debug("Iteration {} is {} {} {} {}".
-        #               format(max(ix, iy, iz, ie), tx, ty, tz, te))
-        f = list(x for x in (tx, ty, tz, te) if x is not None)
-        assert f.count(f[0]) == len(f), "fast forwarded pulse detected"
+    for directions, ticks, masks in generator.chunks():
+        directions = dict(directions)
+        masks = masks.tolist()
+        for i, k in enumerate(ticks.tolist() + [None]):
+            if i in directions:
+                direction_found = True
+                direction_x, direction_y, direction_z, direction_e = \
+                    directions[i]
+                if STEPPER_INVERTED_X:
+                    direction_x = -direction_x
+                if STEPPER_INVERTED_Y:
+                    direction_y = -direction_y
+                if STEPPER_INVERTED_Z:
+                    direction_z = -direction_z
+                if STEPPER_INVERTED_E:
+                    direction_e = -direction_e
+                if isinstance(generator, PulseGeneratorLinear):
+                    assert ((direction_x < 0 and delta.x < 0)
+                            or (direction_x > 0 and delta.x > 0)
+                            or delta.x == 0)
+                    assert ((direction_y < 0 and delta.y < 0)
+                            or (direction_y > 0 and delta.y > 0)
+                            or delta.y == 0)
+                    assert ((direction_z < 0 and delta.z < 0)
+                            or (direction_z > 0 and delta.z > 0)
+                            or delta.z == 0)
+                    assert ((direction_e < 0 and delta.e < 0)
+                            or (direction_e > 0 and delta.e > 0)
+                            or delta.e == 0)
+            if k is None:
+                break
+            mask = masks[i]
+            assert mask != 0, "pulse without axises detected"
+            if mask & AXIS_MASK_X:
+                mx = max(mx, k)
+                ix += direction_x
+                cx += 1
+                if lx is not None:
+                    assert k - lx > 0, \
+                        "negative or zero time delta detected for x"
+                lx = k
+            if mask & AXIS_MASK_Y:
+                my = max(my, k)
+                iy += direction_y
+                cy += 1
+                if ly is not None:
+                    assert k - ly > 0, \
+                        "negative or zero time delta detected for y"
+                ly = k
+            if mask & AXIS_MASK_Z:
+                mz = max(mz, k)
+                iz += direction_z
+                cz += 1
+                if lz is not None:
+                    assert k - lz > 0, \
+                        "negative or zero time delta detected for z"
+                lz = k
+            if mask & AXIS_MASK_E:
+                me = max(me, k)
+                ie += direction_e
+                ce += 1
+                if le is not None:
+                    assert k - le > 0, \
+                        "negative or zero time delta detected for e"
+                le = k
+            # very verbose, uncomment on demand
+            # logging.debug("Iteration {} is {} {}".
+            #               format(max(ix, iy, iz, ie), k, mask))
     pt = time.time()
     assert direction_found, "direction not found"
     assert round(ix / STEPPER_PULSES_PER_MM_X, 10) == delta.x,\
@@ -179,25 +174,55 @@ def move(generator):
         "z wrong number of pulses"
     assert round(ie / STEPPER_PULSES_PER_MM_E, 10) == delta.e, \
         "e wrong number of pulses"
-    assert max(mx, my, mz, me) <= generator.total_time_s(), \
+    assert max(mx, my, mz, me) <= round(generator.total_time_s()
+                                        * TICKS_IN_SECONDS), \
         "interpolation time or pulses wrong"
+    __position += Coordinates(ix / STEPPER_PULSES_PER_MM_X,
+                              iy / STEPPER_PULSES_PER_MM_Y,
+                              iz / STEPPER_PULSES_PER_MM_Z,
+                              ie / STEPPER_PULSES_PER_MM_E)
     logging.debug("Moved {}, {}, {}, {} iterations".format(ix, iy, iz, ie))
     logging.info("prepared in " + str(round(pt - st, 2)) + "s, estimated "
                  + str(round(generator.total_time_s(), 2)) + "s")
 
 
+def hold():
+    """ Feed hold, movements are done instantly, so there is nothing to stop.
+    """
+    logging.info("hal hold()")
+
+
+def resume():
+    """ Resume movements after hold().
+    """
+    logging.info("hal resume()")
+
+
 def join():
     """ Wait till motors work.
     """
     logging.info("hal join()")
 
 
+def get_position():
+    """ Get position of motors.
+    :return: Coordinates object with position in millimeters.
+    """
+    return __position
+
+
 def deinit():
     """ De-initialise.
     """
     logging.info("hal deinit()")
 
 
+def emergency_stop():
+    """ Stop everything immediately.
+    """
+    logging.info("hal emergency stop")
+
+
 def watchdog_feed():
     """ Feed hardware watchdog.
     """
@@ -22,6 +22,7 @@ class Heater(threading.Thread):
                                heater power in percent(0..100).
         """
         self._current_power = 0
+        self._current_temperature = None
         threading.Thread.__init__(self)
         self._pid = Pid(target_temp, pid_coefficients)
         self._measure = measure_method
@@ -39,6 +40,12 @@ class Heater(threading.Thread):
         """
         return self._pid.target_value()
 
+    def current_temperature(self):
+        """ Return the latest measured temperature, it doesn't access sensor.
+        :return: temperature in Celsius or None if it isn't measured yet.
+        """
+        return self._current_temperature
+
     def is_fixed(self):
         """ Check if target value is reached and PID maintains this value.
         :return: boolean value
@@ -66,6 +73,7 @@ class Heater(threading.Thread):
                         break
                 continue
             last_error = None
+            self._current_temperature = current_temperature
             self._current_power = self._pid.update(current_temperature) * 100
             self._control(self._current_power)
             self._mutex.release()
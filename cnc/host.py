@@ -0,0 +1,235 @@
+""" Host protocol for serial links, like the one which 3D printers firmwares
+    use. Lines can be framed as 'N<number> <gcode>*<checksum>', checksum is
+    XOR of all bytes before '*'. Broken or lost lines are requested again
+    with 'Resend: <number>'. Each line is acknowledged with 'ok' as soon as
+    it is put into command queue, so host can send lines ahead while
+    machine runs previous ones and waits only when queue is full. Answers of
+    commands and errors of machine are sent as separated lines.
+    Realtime commands are run right away, ahead of command queue: single
+    characters '?', '!', '~' anywhere in stream, like GRBL does, except
+    comments and framed lines, and M105, M112 lines.
+"""
+
+import os
+import tty
+import errno
+import termios
+import threading
+
+try:  # python3 compatibility
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+
+from cnc.config import *
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachineException
+
+DIGITS = frozenset('0123456789')
+# single characters which are realtime commands
+REALTIME_CHARACTERS = frozenset(bytearray(b'?!~'))
+NEWLINE_CHARACTERS = frozenset(bytearray(b'\r\n'))
+
+
+def checksum(text):
+    """ Calculate checksum of line.
+    :param text: line before '*'.
+    :return: integer value, XOR of all bytes.
+    """
+    result = 0
+    for c in bytearray(text.encode('utf-8')):
+        result ^= c
+    return result
+
+
+class HostProtocol(object):
+    def __init__(self):
+        """ Framing and line numbers state, there is no I/O here.
+        """
+        self.last_line = 0
+
+    def __resend(self, message):
+        return None, ["Error:{}, Last Line: {}".format(message,
+                                                       self.last_line),
+                      "Resend: {}".format(self.last_line + 1)]
+
+    def receive(self, line):
+        """ Process line from host.
+        :param line: string with line.
+        :return: tuple (gcode, answers), gcode is GCode object which should
+                 be run or None, answers is list of lines which should be
+                 sent to host before 'ok'.
+        """
+        line = line.strip()
+        number = None
+        star = line.rfind('*')
+        if star >= 0:
+            try:
+                expected = int(line[star + 1:])
+            except ValueError:
+                return self.__resend("bad checksum")
+            if checksum(line[:star]) != expected:
+                return self.__resend("checksum mismatch")
+            line = line[:star]
+        if line[:1] in ('N', 'n'):
+            i = 1
+            while i < len(line) and line[i] in DIGITS:
+                i += 1
+            if i == 1 or star < 0:
+                return self.__resend("bad line number or no checksum")
+            number = int(line[1:i])
+            line = line[i:]
+        error = None
+        try:
+            gcode = GCode.parse_line(line)
+        except GCodeException as e:
+            gcode, error = None, e
+        if gcode is not None and gcode.command() == 'M110':
+            # set current line number
+            self.last_line = int(gcode.get('N', number or 0))
+            return None, []
+        if number is not None:
+            if number != self.last_line + 1:
+                return self.__resend("Line Number is not Last Line Number+1")
+            self.last_line = number
+        if error is not None:
+            return None, ["Error:" + str(error)]
+        return gcode, []
+
+
+def open_serial(path, baud_rate=SERIAL_BAUD_RATE):
+    """ Open serial port in raw mode.
+    :param path: path to serial device.
+    :param baud_rate: speed of port.
+    :return: file descriptor.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY)
+    tty.setraw(fd)
+    speed = getattr(termios, 'B{}'.format(baud_rate))
+    attributes = termios.tcgetattr(fd)
+    attributes[4] = attributes[5] = speed
+    termios.tcsetattr(fd, termios.TCSANOW, attributes)
+    return fd
+
+
+def open_pty():
+    """ Create pseudo terminal, host software can connect to it as to serial
+        port.
+    :return: tuple (master fd, slave fd, slave path), slave fd should be kept
+             open, otherwise master is closed when host disconnects.
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+
+class SerialHost(object):
+    QUEUE_SIZE = SERIAL_QUEUE_SIZE
+
+    def __init__(self, machine, fd):
+        """ Serve host on file descriptor. Reader runs in the calling thread
+            and commands run in machine thread.
+        :param machine: GMachine object.
+        :param fd: file descriptor of serial port or pty.
+        """
+        self._machine = machine
+        self._fd = fd
+        self._protocol = HostProtocol()
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        """ Send line to host, it can be called from any thread.
+        :param text: line without end of line.
+        """
+        data = (text + '\n').encode('utf-8')
+        with self._lock:
+            while data:
+                data = data[os.write(self._fd, data):]
+
+    def _run_commands(self):
+        while True:
+            gcode = self._queue.get()
+            if gcode is None:
+                break
+            try:
+                res = self._machine.do_command(gcode)
+            except (GCodeException, GMachineException) as e:
+                self.write("Error:" + str(e))
+                continue
+            if res is not None:
+                self.write(res)
+
+    def _realtime(self, command):
+        try:
+            res = self._machine.do_realtime(command)
+        except (GCodeException, GMachineException) as e:
+            self.write("Error:" + str(e))
+            return
+        if res is not None:
+            self.write(res)
+
+    def _lines(self):
+        # read lines until host disconnects, realtime characters are run
+        # right away unless they are inside a comment or a framed line,
+        # framed lines are kept unchanged to match their checksum
+        data = bytearray()
+        framed = False
+        comment = None  # character which closes current comment
+        while True:
+            try:
+                chunk = os.read(self._fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EIO:  # pty is closed
+                    break
+                raise
+            if not chunk:
+                break
+            for c in bytearray(chunk):
+                if c in NEWLINE_CHARACTERS:
+                    if data:
+                        yield bytes(data).decode('utf-8', 'replace')
+                    data = bytearray()
+                    framed = False
+                    comment = None
+                    continue
+                if framed:
+                    pass
+                elif comment is not None:
+                    if c == comment:
+                        comment = None
+                elif c in REALTIME_CHARACTERS:
+                    self._realtime(chr(c))
+                    continue
+                elif c in (ord('N'), ord('n')) and not data.strip():
+                    framed = True
+                elif c == ord(';'):
+                    comment = ord('\n')
+                elif c == ord('('):
+                    comment = ord(')')
+                data.append(c)
+
+    def run(self):
+        """ Serve host until it disconnects.
+        """
+        self._queue = queue.Queue(self.QUEUE_SIZE)
+        worker = threading.Thread(target=self._run_commands)
+        worker.daemon = True
+        worker.start()
+        try:
+            for line in self._lines():
+                gcode, answers = self._protocol.receive(line)
+                for answer in answers:
+                    self.write(answer)
+                if gcode is not None and gcode.command() \
+                        in self._machine.REALTIME_COMMANDS:
+                    self._realtime(gcode.command())
+                elif gcode is not None:
+                    # acknowledge when there is space in queue
+                    self._queue.put(gcode)
+                self.write("ok")
+        finally:
+            self._queue.put(None)
+            worker.join()
+            self._machine.flush()
@@ -0,0 +1,246 @@
+""" Compiled jobs. Job is compiled from gcode file in advance, i.e. gcode is
+    parsed, planned and movements are rendered to DMA control blocks for
+    Raspberry Pi hal. Hal calls like spindle or fan control, and commands
+    which depend on run time, like heating or dwell, are stored as events
+    between control blocks, so they are executed in the same order as in
+    gcode file. Running of compiled job doesn't need any calculations, control
+    blocks are copied from mmapped file into DMA buffer.
+
+    File format, all values are little endian:
+        header: 4 bytes MAGIC, uint32 version, uint32 number of ticks in
+                microsecond which control blocks are timed with.
+        records: 4 bytes record type, uint32 payload length, payload which
+                 is padded with zeros to 4 bytes.
+    Record types:
+        RECORD_CONTROL_BLOCKS: relocatable DMA control blocks, see
+                               rpgpio.DMAGPIORecorder.
+        RECORD_HAL_CALL: JSON list with hal function name and its arguments.
+        RECORD_GCODE: gcode line which should be executed by GMachine.
+"""
+
+import os
+import mmap
+import json
+import struct
+
+from cnc import hal
+from cnc.config import STEPPER_TICKS_PER_US
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachine, GMachineException
+
+MAGIC = b"PCJB"
+VERSION = 2
+RECORD_CONTROL_BLOCKS = b"CBLK"
+RECORD_HAL_CALL = b"CALL"
+RECORD_GCODE = b"GCOD"
+RECORD_HEADER_FORMAT = "<4sI"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+HEADER_FORMAT = "<4sII"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# commands which are executed while job runs since they depend on run time
+RUN_TIME_COMMANDS = ('G4', 'M104', 'M105', 'M109', 'M140', 'M190')
+# hal functions which are recorded as events
+RECORDED_HAL_CALLS = ('spindle_control', 'fan_control', 'disable_steppers',
+                      'calibrate', 'join')
+# compiling never uses real hardware, see rpgpio_private.SIMULATOR_ENV
+SIMULATOR_ENV = "PYCNC_RPGPIO_SIMULATOR"
+
+
+class JobException(Exception):
+    """ Exceptions while compiling or reading job file.
+    """
+    pass
+
+
+class JobWriter(object):
+    def __init__(self, f, ticks_per_us):
+        """ Write compiled job to file.
+        :param f: file object opened in binary mode.
+        :param ticks_per_us: number of ticks in microsecond which control
+                             blocks are timed with.
+        """
+        self._file = f
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION,
+                                     ticks_per_us))
+
+    def _write_record(self, record_type, payload):
+        self._file.write(struct.pack(RECORD_HEADER_FORMAT, record_type,
+                                     len(payload)))
+        self._file.write(payload)
+        self._file.write(b"\0" * (-len(payload) % 4))
+
+    def add_control_blocks(self, data):
+        """ Add relocatable control blocks.
+        :param data: bytes with control blocks.
+        """
+        self._write_record(RECORD_CONTROL_BLOCKS, data)
+
+    def add_hal_call(self, name, *args):
+        """ Add hal function call.
+        :param name: hal function name.
+        :param args: function arguments, should be serializable to JSON.
+        """
+        payload = json.dumps([name] + list(args))
+        self._write_record(RECORD_HAL_CALL, payload.encode('utf-8'))
+
+    def add_gcode(self, line):
+        """ Add gcode line which is executed while job runs.
+        :param line: gcode line.
+        """
+        self._write_record(RECORD_GCODE, line.encode('utf-8'))
+
+
+def read_header(memory):
+    """ Read header of compiled job.
+    :param memory: bytes-like object with the whole job file, usually mmap.
+    :return: number of ticks in microsecond which control blocks are timed
+             with.
+    """
+    if len(memory) < HEADER_SIZE:
+        raise JobException("not a compiled job")
+    magic, version, ticks_per_us = struct.unpack_from(HEADER_FORMAT,
+                                                      memory, 0)
+    if magic != MAGIC:
+        raise JobException("not a compiled job")
+    if version != VERSION:
+        raise JobException("unsupported job version {}".format(version))
+    return ticks_per_us
+
+
+def read_records(memory):
+    """ Read records from compiled job.
+    :param memory: bytes-like object with the whole job file, usually mmap.
+    :return: generator of tuples (record type, payload). Control blocks
+             payload is a memoryview if it is possible, so it is not copied,
+             other payloads are bytes.
+    """
+    read_header(memory)
+    size = len(memory)
+    try:
+        view = memoryview(memory)
+    except TypeError:
+        view = memory
+    offset = HEADER_SIZE
+    while offset < size:
+        if offset + RECORD_HEADER_SIZE > size:
+            raise JobException("job file is truncated")
+        record_type, length = struct.unpack_from(RECORD_HEADER_FORMAT,
+                                                 memory, offset)
+        offset += RECORD_HEADER_SIZE
+        if offset + length > size:
+            raise JobException("job file is truncated")
+        if record_type == RECORD_CONTROL_BLOCKS:
+            yield record_type, view[offset:offset + length]
+        else:
+            yield record_type, memory[offset:offset + length]
+        offset += length + (-length % 4)
+
+
+def _raspberry_hal():
+    # import Raspberry Pi hal, with simulated hardware if there is no real
+    # one, it is needed only to render control blocks
+    simulator = SIMULATOR_ENV not in os.environ
+    if simulator:
+        os.environ[SIMULATOR_ENV] = "instant"
+    try:
+        from cnc.hal_raspberry import rpgpio
+        from cnc.hal_raspberry import hal as raspberry_hal
+    finally:
+        if simulator:
+            del os.environ[SIMULATOR_ENV]
+    return rpgpio, raspberry_hal
+
+
+def compile_job(gcode_file, job_file):
+    """ Compile gcode to job.
+    :param gcode_file: file object with gcode lines.
+    :param job_file: file object opened in binary mode for writing job.
+    :return: number of gcode lines.
+    """
+    rpgpio, raspberry_hal = _raspberry_hal()
+    ticks_per_us = raspberry_hal.dma.ticks_per_us()
+    writer = JobWriter(job_file, ticks_per_us)
+    recorder = rpgpio.DMAGPIORecorder(ticks_per_us)
+
+    def move(generator):
+        dma = raspberry_hal.dma
+        raspberry_hal.dma = recorder
+        try:
+            raspberry_hal.move(generator)
+        finally:
+            raspberry_hal.dma = dma
+        for chunk in recorder.pop_chunks():
+            writer.add_control_blocks(chunk)
+
+    def record(name):
+        def call(*args):
+            writer.add_hal_call(name, *args)
+            return True
+        return call
+
+    def nothing(*args):
+        pass
+
+    patched = dict((name, record(name)) for name in RECORDED_HAL_CALLS)
+    patched.update(move=move, init=nothing, deinit=nothing,
+                   watchdog_feed=nothing)
+    saved = dict((name, getattr(hal, name)) for name in patched)
+    for name in patched:
+        setattr(hal, name, patched[name])
+    count = 0
+    try:
+        # movements are recorded in the same thread, so hal calls and
+        # control blocks are kept in order
+        machine = GMachine(motion_queue_size=0)
+        for count, line in enumerate(gcode_file, 1):
+            line = line.strip()
+            try:
+                gcode = GCode.parse_line(line)
+                if gcode is not None and gcode.command() in RUN_TIME_COMMANDS:
+                    machine.flush()
+                    writer.add_gcode(line)
+                else:
+                    machine.do_command(gcode)
+            except (GCodeException, GMachineException) as e:
+                raise JobException("line {}: {}".format(count, e))
+        machine.flush()
+    finally:
+        for name in saved:
+            setattr(hal, name, saved[name])
+    return count
+
+
+def run_job(job_file, machine):
+    """ Run compiled job.
+    :param job_file: file object opened in binary mode with compiled job.
+    :param machine: GMachine object which executes gcode events.
+    """
+    if not hasattr(hal, 'move_control_blocks'):
+        raise JobException("compiled jobs can run with Raspberry Pi hal only")
+    memory = mmap.mmap(job_file.fileno(), 0, access=mmap.ACCESS_READ)
+    records = read_records(memory)
+    payload = None
+    try:
+        # control blocks play at wrong speed with other timing
+        ticks_per_us = read_header(memory)
+        if ticks_per_us != STEPPER_TICKS_PER_US:
+            raise JobException("job is compiled for {} ticks in microsecond,"
+                               " but machine uses {}"
+                               .format(ticks_per_us, STEPPER_TICKS_PER_US))
+        for record_type, payload in records:
+            if record_type == RECORD_CONTROL_BLOCKS:
+                hal.move_control_blocks(payload)
+            elif record_type == RECORD_HAL_CALL:
+                call = json.loads(payload.decode('utf-8'))
+                getattr(hal, call[0])(*call[1:])
+            elif record_type == RECORD_GCODE:
+                line = payload.decode('utf-8')
+                machine.do_command(GCode.parse_line(line))
+            else:
+                raise JobException("unknown record type")
+        hal.join()
+    finally:
+        # views of mmap should be released before closing
+        records.close()
+        payload = None
+        memory.close()
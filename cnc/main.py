@@ -8,6 +8,11 @@ import atexit
 import cnc.logging_config as logging_config
 from cnc.gcode import GCode, GCodeException
 from cnc.gmachine import GMachine, GMachineException
+from cnc.job import compile_job, run_job, JobException
+from cnc.runner import FileRunner
+from cnc.preparse import preparse_file
+from cnc.estimator import Estimator
+from cnc.config import *
 
 try:  # python3 compatibility
     type(raw_input)
@@ -29,8 +34,11 @@ machine = GMachine()
 
 def do_line(line):
     try:
-        g = GCode.parse_line(line)
-        res = machine.do_command(g)
+        command = machine.realtime_command(line)
+        if command is not None:
+            res = machine.do_realtime(command)
+        else:
+            res = machine.do_command(GCode.parse_line(line))
     except (GCodeException, GMachineException) as e:
         print('ERROR ' + str(e))
         return False
@@ -41,17 +49,122 @@ def do_line(line):
     return True
 
 
+def do_compile(args):
+    # pycnc compile job.gcode [-o job.pcj]
+    if len(args) == 3 and args[1] == '-o':
+        output = args[2]
+    elif len(args) == 1:
+        output = os.path.splitext(args[0])[0] + '.pcj'
+    else:
+        print('Usage: pycnc compile job.gcode -o job.pcj')
+        return False
+    try:
+        with open(args[0], 'r') as f, open(output, 'wb') as o:
+            count = compile_job(f, o)
+    except JobException as e:
+        print('ERROR ' + str(e))
+        return False
+    print('{} lines compiled to {}'.format(count, output))
+    return True
+
+
+def do_estimate(args, parallel):
+    # pycnc estimate job.gcode
+    if len(args) != 1:
+        print('Usage: pycnc estimate job.gcode')
+        return False
+    try:
+        if parallel:
+            rows = preparse_file(args[0]).to_array()
+        else:
+            with open(args[0], 'r') as f:
+                rows = GCode.parse_lines(f)
+        estimation = Estimator().estimate(rows)
+    except (GCodeException, GMachineException, ImportError) as e:
+        print('ERROR ' + str(e))
+        return False
+    print(estimation.report())
+    return True
+
+
+def do_serve(args):
+    # pycnc serve [[host:]port ...] [unix_socket_path ...]
+    if sys.version_info[0] < 3:
+        print('ERROR server requires Python 3')
+        return False
+    from cnc.server import serve
+    tcp = []
+    unix = []
+    for arg in args:
+        host, _, port = arg.rpartition(':')
+        if port.isdigit():
+            tcp.append((host or SERVER_TCP_HOST, int(port)))
+        else:
+            unix.append(arg)
+    if not args:
+        tcp.append((SERVER_TCP_HOST, SERVER_TCP_PORT))
+        if SERVER_UNIX_SOCKET:
+            unix.append(SERVER_UNIX_SOCKET)
+    serve(machine, tcp, unix)
+    return True
+
+
+def do_serial(args):
+    # pycnc serial [device], pseudo terminal is created if there is no device
+    from cnc.host import SerialHost, open_serial, open_pty
+    if len(args) > 1:
+        print('Usage: pycnc serial [/dev/ttyAMA0]')
+        return False
+    if args:
+        fd = open_serial(args[0])
+    else:
+        fd, slave, path = open_pty()
+        print('Connect host to {}'.format(path))
+    while True:
+        SerialHost(machine, fd).run()
+        if args:
+            break
+    return True
+
+
 def main():
     logging_config.debug_disable()
+    args = sys.argv[1:]
+    quiet = '-q' in args
+    if quiet:
+        args.remove('-q')
+    parallel = '-p' in args
+    if parallel:
+        args.remove('-p')
     try:
-        if len(sys.argv) > 1:
-            # Read file with gcode
-            with open(sys.argv[1], 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    print('> ' + line)
-                    if not do_line(line):
-                        break
+        if len(args) > 0 and args[0] == 'compile':
+            do_compile(args[1:])
+        elif len(args) > 0 and args[0] == 'estimate':
+            do_estimate(args[1:], parallel)
+        elif len(args) > 0 and args[0] == 'serve':
+            do_serve(args[1:])
+        elif len(args) > 0 and args[0] == 'serial':
+            do_serial(args[1:])
+        elif len(args) > 0 and args[0].endswith('.pcj'):
+            # Run compiled job
+            try:
+                with open(args[0], 'rb') as f:
+                    run_job(f, machine)
+            except (GCodeException, GMachineException, JobException) as e:
+                print('ERROR ' + str(e))
+        elif len(args) > 0:
+            # Read file with gcode, lines are parsed in background
+            runner = FileRunner(machine, quiet)
+            if parallel:
+                # parse the whole file in advance using all cores
+                try:
+                    runner.run_parsed(preparse_file(args[0]))
+                except GCodeException as e:
+                    print('ERROR ' + str(e))
+            else:
+                with open(args[0], 'r') as f:
+                    runner.run(f)
+            print(runner.report())
         else:
             # Main loop for interactive shell
             # Use stdin/stdout, additional interfaces like
@@ -62,6 +175,7 @@ def main():
                 if line == 'quit' or line == 'exit':
                     break
                 do_line(line)
+                machine.flush()
     except KeyboardInterrupt:
         pass
     print("\r\nExiting...")
@@ -0,0 +1,125 @@
+import threading
+import logging
+
+try:  # python3 compatibility
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+
+from cnc import hal
+from cnc.config import *
+
+
+class MotionQueue(object):
+    """ Bounded queue of planned movements. Movements are sent to hal by
+        motion worker thread, so the caller doesn't wait while pulses are
+        calculated and uploaded and can process the next command. Caller
+        waits only if queue is full or join() is called.
+    """
+    def __init__(self, size=MOTION_QUEUE_SIZE):
+        """ Create object, worker thread is started with the first movement.
+        :param size: maximum number of movements in queue, zero means
+                     movements are sent to hal right in the caller thread.
+        """
+        self._size = size
+        self._queue = None
+        self._worker = None
+        self._error = None
+        self._running = threading.Event()
+        self._running.set()
+        self._aborted = False
+
+    def __raise(self):
+        # error of worker is raised once in the caller thread
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            generator = self._queue.get()
+            try:
+                if generator is None:
+                    break
+                # movements after failed one are dropped
+                self._running.wait()
+                if self._error is None and not self._aborted:
+                    hal.move(generator)
+            except Exception as e:
+                logging.error("Movement failed: {}".format(e))
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def put(self, generator):
+        """ Add movement to queue, block while queue is full.
+        :param generator: PulseGenerator object.
+        """
+        self.__raise()
+        if self._aborted:
+            return
+        if self._size == 0:
+            self._running.wait()
+            hal.move(generator)
+            return
+        if self._worker is None:
+            self._queue = queue.Queue(self._size)
+            self._worker = threading.Thread(target=self._run)
+            self._worker.daemon = True
+            self._worker.start()
+        self._queue.put(generator)
+
+    def join(self):
+        """ Wait till all movements are sent to hal. Motors still could be
+            working, use hal.join() to wait for them. Error of movement
+            which has failed in worker is raised here.
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self.__raise()
+
+    def hold(self):
+        """ Don't send movements to hal till resume() is called. Movement
+            which is being sent is finished. It can be called from any
+            thread.
+        """
+        self._running.clear()
+
+    def resume(self):
+        """ Continue sending movements to hal. It can be called from any
+            thread.
+        """
+        self._running.set()
+
+    def is_held(self):
+        """ Check if hold() is active.
+        :return: boolean value.
+        """
+        return not self._running.is_set()
+
+    def abort(self):
+        """ Drop all movements, new movements are dropped too. It can be
+            called from any thread.
+        """
+        # worker drops the rest of queue without sending it to hal
+        self._aborted = True
+        self._running.set()
+
+    def depth(self):
+        """ Number of movements which are waiting in queue.
+        :return: integer value.
+        """
+        if self._queue is None:
+            return 0
+        return self._queue.qsize()
+
+    def stop(self):
+        """ Send all movements to hal and stop worker thread.
+        """
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+            self._queue = None
+        self.__raise()
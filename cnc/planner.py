@@ -0,0 +1,152 @@
+from __future__ import division
+import logging
+
+from cnc import hal
+from cnc.pulses import *
+from cnc.config import *
+
+
+class PlannerMove(object):
+    """ Linear movement which is waiting in planner buffer.
+    """
+    def __init__(self, delta, velocity, acceleration=None):
+        """ Create object.
+        :param delta: movement delta in mm.
+        :param velocity: desired velocity in mm per min.
+        :param acceleration: desired acceleration along the path in mm per
+                             sec^2, None means axises limits only.
+        """
+        self.delta = delta
+        self.velocity = velocity
+        self.length = delta.length()
+        self.unit = delta / self.length
+        # velocity and acceleration along the path, each axis limits
+        # acceleration and velocity adjustment limits all axises.
+        proportion = abs(self.unit)
+        self.acceleration = path_acceleration(proportion, acceleration)
+        nominal = velocity / SECONDS_IN_MINUTE
+        if PulseGenerator.AUTO_VELOCITY_ADJUSTMENT:
+            for max_velocity, p in ((MAX_VELOCITY_MM_PER_MIN_X, proportion.x),
+                                    (MAX_VELOCITY_MM_PER_MIN_Y, proportion.y),
+                                    (MAX_VELOCITY_MM_PER_MIN_Z, proportion.z),
+                                    (MAX_VELOCITY_MM_PER_MIN_E, proportion.e)):
+                if p > 0:
+                    nominal = min(nominal,
+                                  max_velocity / SECONDS_IN_MINUTE / p)
+        self.nominal_velocity = nominal
+        self.max_entry_velocity = 0.0
+        self.entry_velocity = 0.0
+        self.exit_velocity = 0.0
+
+    def reachable_velocity(self, velocity):
+        """ Velocity which can be reached from specified velocity on this
+            movement length, V^2 = V0^2 + 2 * a * S, where a is the average
+            acceleration, S-curve makes it lower then the peak one.
+        :param velocity: initial velocity in mm per sec.
+        :return: velocity in mm per sec.
+        """
+        return math.sqrt(velocity * velocity
+                         + 2.0 * self.acceleration * self.length
+                         / (1.0 + PulseGenerator.S_CURVE_JERK_RATIO))
+
+
+class Planner(object):
+    """ Look-ahead planner for linear movements. It keeps a few movements in
+        buffer and calculates velocity on junctions between them, so machine
+        doesn't stop between short segments. Velocity on junction is limited
+        with junction deviation approach: corner is treated as an arc which
+        deviates from the corner for PLANNER_JUNCTION_DEVIATION_MM and this arc
+        is passed with maximum acceleration as a centripetal one.
+        All movements in buffer are planned to finish with full stop, so
+        buffer can be flushed at any moment.
+    """
+    LOOKAHEAD_MOVES = PLANNER_LOOKAHEAD_MOVES
+    JUNCTION_DEVIATION_MM = PLANNER_JUNCTION_DEVIATION_MM
+
+    def __init__(self, move=None):
+        """ Initialization.
+        :param move: function which runs pulse generator, hal.move() by
+                     default.
+        """
+        self._move = move
+        self._moves = []
+        # velocity for the first movement in buffer, it is already fixed since
+        # previous movement has been sent to hal with this exit velocity.
+        self._entry_velocity = 0.0
+
+    def __junction_velocity(self, previous, move):
+        cos_theta = -(previous.unit.x * move.unit.x
+                      + previous.unit.y * move.unit.y
+                      + previous.unit.z * move.unit.z
+                      + previous.unit.e * move.unit.e)
+        if cos_theta > 0.999999:  # movement in reverse direction
+            return 0.0
+        if cos_theta < -0.999999:  # the same direction
+            return min(previous.nominal_velocity, move.nominal_velocity)
+        sin_theta_d2 = math.sqrt(0.5 * (1.0 - cos_theta))
+        acceleration = min(previous.acceleration, move.acceleration)
+        velocity = math.sqrt(acceleration * self.JUNCTION_DEVIATION_MM
+                             * sin_theta_d2 / (1.0 - sin_theta_d2))
+        return min(velocity, previous.nominal_velocity,
+                   move.nominal_velocity)
+
+    def __recalculate(self):
+        # backward pass, the last movement stops completely
+        exit_velocity = 0.0
+        for move in reversed(self._moves):
+            move.exit_velocity = exit_velocity
+            exit_velocity = min(move.max_entry_velocity,
+                                move.reachable_velocity(exit_velocity))
+            move.entry_velocity = exit_velocity
+        # forward pass, beginning of buffer is fixed
+        entry_velocity = self._entry_velocity
+        for move in self._moves:
+            move.entry_velocity = entry_velocity
+            entry_velocity = min(move.exit_velocity,
+                                 move.reachable_velocity(entry_velocity))
+            move.exit_velocity = entry_velocity
+
+    def __pop(self):
+        move = self._moves.pop(0)
+        logging.info("Planned {} with velocities {} -> {}".format(
+                     move.delta, move.entry_velocity, move.exit_velocity))
+        gen = PulseGeneratorLinear(move.delta, move.velocity,
+                                   move.entry_velocity * SECONDS_IN_MINUTE,
+                                   move.exit_velocity * SECONDS_IN_MINUTE,
+                                   move.acceleration)
+        if self._move is None:
+            hal.move(gen)
+        else:
+            self._move(gen)
+        self._entry_velocity = move.exit_velocity
+
+    def add(self, delta, velocity, acceleration=None):
+        """ Add linear movement to planner. Movement can be sent to hal
+            immediately or later, when buffer is full or flushed.
+        :param delta: movement delta in mm, should not be zero.
+        :param velocity: desired velocity in mm per min.
+        :param acceleration: desired acceleration along the path in mm per
+                             sec^2, None means axises limits only.
+        """
+        move = PlannerMove(delta, velocity, acceleration)
+        if self._moves:
+            move.max_entry_velocity = self.__junction_velocity(self._moves[-1],
+                                                               move)
+        self._moves.append(move)
+        self.__recalculate()
+        while len(self._moves) > self.LOOKAHEAD_MOVES:
+            self.__pop()
+
+    def flush(self):
+        """ Send all buffered movements to hal. The last movement finishes
+            with full stop.
+        """
+        while self._moves:
+            self.__pop()
+        self._entry_velocity = 0.0
+
+    def is_empty(self):
+        """ Check if there are no movements in buffer.
+        :return: boolean value.
+        """
+        return len(self._moves) == 0
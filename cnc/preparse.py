@@ -0,0 +1,146 @@
+""" Parallel pre-parsing of big gcode files. File is split into byte ranges
+    on lines boundaries and each range is parsed in separated process. Parsed
+    lines are kept in compact arrays: presence bitmask for each line and
+    values of present letters in slots order.
+"""
+
+import os
+import array
+import multiprocessing
+
+from cnc.gcode import GCode, GCodeException, LETTERS, slots_to_array
+
+# files which are smaller are parsed in the current process
+MIN_RANGE_SIZE = 1024 * 1024
+
+
+class ParsedGCode(object):
+    def __init__(self):
+        """ Compact storage for parsed gcode lines.
+        """
+        # bitmask for each line, zero for lines without gcode
+        self.masks = array.array('L')
+        # values of present letters, line by line in slots order
+        self.values = array.array('d')
+
+    def extend(self, other):
+        """ Append lines from other object.
+        :param other: ParsedGCode object.
+        """
+        self.masks.extend(other.masks)
+        self.values.extend(other.values)
+
+    def append(self, gcode):
+        """ Append line.
+        :param gcode: GCode object or None for line without gcode.
+        """
+        if gcode is None:
+            self.masks.append(0)
+            return
+        self.masks.append(gcode.mask)
+        self.values.extend(v for v in gcode.values if v is not None)
+
+    def to_array(self):
+        """ Convert to NumPy structured array, see GCode.parse_lines().
+        :return: NumPy structured array.
+        """
+        return slots_to_array(self.masks, self.values)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __iter__(self):
+        """ Iterate over lines.
+        :return: generator of GCode objects, None for lines without gcode.
+        """
+        position = 0
+        for mask in self.masks:
+            if mask == 0:
+                yield None
+                continue
+            values = [None] * len(LETTERS)
+            slot = 0
+            m = mask
+            while m:
+                if m & 1:
+                    values[slot] = self.values[position]
+                    position += 1
+                m >>= 1
+                slot += 1
+            yield GCode.from_slots(values, mask)
+
+
+def split_file(path, parts):
+    """ Split file into byte ranges, each range ends with the end of line.
+    :param path: path to file.
+    :param parts: desired number of ranges.
+    :return: list of tuples (begin, end).
+    """
+    size = os.path.getsize(path)
+    borders = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            position = max(size * i // parts, borders[-1])
+            f.seek(position)
+            f.readline()  # move to the beginning of the next line
+            position = min(f.tell(), size)
+            if position > borders[-1]:
+                borders.append(position)
+    if borders[-1] != size or size == 0:
+        borders.append(size)
+    return list(zip(borders[:-1], borders[1:]))
+
+
+def parse_range(args):
+    """ Parse lines in range of file.
+    :param args: tuple (path, begin, end).
+    :return: tuple (number of lines, ParsedGCode object, error), error is
+             None or tuple (line number in range, message), lines after
+             error are not parsed.
+    """
+    path, begin, end = args
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    lines = data.decode('utf-8', 'replace').split('\n')
+    if lines[-1] == '':
+        del lines[-1]  # range ends with the end of line
+    parsed = ParsedGCode()
+    for number, line in enumerate(lines, 1):
+        try:
+            parsed.append(GCode.parse_line(line))
+        except GCodeException as e:
+            return len(lines), parsed, (number, str(e))
+    return len(lines), parsed, None
+
+
+def preparse_file(path, processes=None):
+    """ Parse the whole file using all processor cores.
+    :param path: path to gcode file.
+    :param processes: number of processes, number of cores by default.
+    :return: ParsedGCode object with all lines of file.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes,
+                           os.path.getsize(path) // MIN_RANGE_SIZE))
+    ranges = list((path, b, e) for b, e in split_file(path, processes))
+    if processes == 1:
+        results = list(map(parse_range, ranges))
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(parse_range, ranges)
+        finally:
+            pool.close()
+            pool.join()
+    parsed = ParsedGCode()
+    lines = 0
+    for count, part, error in results:
+        if error is not None:
+            number, message = error
+            raise GCodeException("line {}: {}".format(lines + number,
+                                                      message))
+        parsed.extend(part)
+        lines += count
+    return parsed
@@ -1,11 +1,173 @@
 from __future__ import division
 import logging
+import array
 
 from cnc.config import *
 from cnc.coordinates import *
 from cnc.enums import *
 
+# NumPy is optional, it is used to calculate all pulses of movement at once.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 SECONDS_IN_MINUTE = 60.0
+US_IN_SECONDS = 1000000
+# Integer time of pulses which are returned by PulseGenerator.chunks() is in
+# ticks, see STEPPER_TICKS_PER_US.
+TICKS_IN_SECONDS = US_IN_SECONDS * STEPPER_TICKS_PER_US
+
+# Type code for arrays with time in ticks, Python 2 doesn't support 64 bit
+# 'q' type.
+try:
+    array.array('q')
+    _TICKS_TYPECODE = 'q'
+except ValueError:
+    _TICKS_TYPECODE = 'l'
+
+# Bits of pulses masks which are returned by PulseGenerator.batch().
+AXIS_MASK_X = 1
+AXIS_MASK_Y = 2
+AXIS_MASK_Z = 4
+AXIS_MASK_E = 8
+
+
+def path_acceleration(proportion, acceleration_mm_per_s2=None):
+    """ Find acceleration along the path for which no axis exceeds its own
+        limit, i.e. the tightest projection of axises limits on the path.
+    :param proportion: share of each axis in the path, absolute values of
+                       unit vector of movement.
+    :param acceleration_mm_per_s2: desired acceleration along the path or
+                                   None if only axises limits are applied.
+    :return: acceleration in mm per sec^2.
+    """
+    result = acceleration_mm_per_s2
+    for limit, p in ((MAX_ACCELERATION_MM_PER_S2_X, proportion.x),
+                     (MAX_ACCELERATION_MM_PER_S2_Y, proportion.y),
+                     (MAX_ACCELERATION_MM_PER_S2_Z, proportion.z),
+                     (MAX_ACCELERATION_MM_PER_S2_E, proportion.e)):
+        if p > 0 and (result is None or limit / p < result):
+            result = limit / p
+    return result
+
+
+def _s_curve(x, r):
+    """ Shape of acceleration or braking phase with 7 segments profile:
+        acceleration grows linearly for share r of phase time, then it is
+        constant and then falls linearly for the same time. Shape is
+        symmetric, so distance of phase is the same as for constant
+        acceleration, which is the average one, the peak is higher by
+        1 / (1 - r).
+    :param x: time from the beginning of phase as share of phase time.
+    :param r: share of time in which acceleration changes, 0 < r <= 0.5.
+    :return: Tuple of distance and velocity change, both are shares of
+             velocity change multiplied by phase time and of velocity change.
+    """
+    a = 1.0 / (1.0 - r)
+    y = min(x, 1.0 - x)
+    if y < r:
+        velocity = a * y * y / (2.0 * r)
+        distance = a * y * y * y / (6.0 * r)
+    else:
+        velocity = a * (y - r / 2.0)
+        distance = a * (r * r / 3.0 + y * y - r * y) / 2.0
+    # the second half is symmetric to the first one
+    if x > 0.5:
+        return x - 0.5 + distance, 1.0 - velocity
+    return distance, velocity
+
+
+def _s_curve_array(x, r):
+    """ Vectorized version of _s_curve() for NumPy array.
+    """
+    a = 1.0 / (1.0 - r)
+    y = numpy.minimum(x, 1.0 - x)
+    head = y < r
+    velocity = numpy.where(head, a * y * y / (2.0 * r), a * (y - r / 2.0))
+    distance = numpy.where(head, a * y * y * y / (6.0 * r),
+                           a * (r * r / 3.0 + y * y - r * y) / 2.0)
+    second = x > 0.5
+    return (numpy.where(second, x - 0.5 + distance, distance),
+            numpy.where(second, 1.0 - velocity, velocity))
+
+
+def _s_curve_time(pt, duration, start, end, r):
+    """ Inverse of _s_curve() in closed form, find time when S-curve phase
+        reaches pseudo time.
+    :param pt: pseudo time from the beginning of phase.
+    :param duration: phase time.
+    :param start: velocity ratio at the beginning of phase.
+    :param end: velocity ratio at the end of phase.
+    :param r: share of phase time in which acceleration changes.
+    :return: time from the beginning of phase.
+    """
+    total = (start + end) * duration / 2.0
+    if end < start:
+        # braking is acceleration in reversed time
+        return duration - _s_curve_time(total - pt, duration, end, start, r)
+    if pt <= 0.0 or duration <= 0.0:
+        return 0.0
+    if pt >= total:
+        return duration
+    if end == start:
+        return pt / start
+    ramp = r * duration
+    a = (end - start) / (duration - ramp)  # peak acceleration
+    k = a / (6.0 * ramp)
+    if pt <= start * ramp + k * ramp ** 3:
+        # acceleration grows, k * t^3 + start * t = pt, Cardano's formula
+        # is written without subtraction of close values
+        p = start / k / 3.0
+        q = pt / k / 2.0
+        u = (q + math.sqrt(q * q + p ** 3)) ** (1.0 / 3.0)
+        v = p / u
+        return 2.0 * q / (u * u + u * v + v * v)
+    d = total - pt
+    if d <= end * ramp - k * ramp ** 3:
+        # acceleration falls, end * w - k * w^3 = d, where w is time till
+        # the end of phase, trigonometric solution
+        c = math.sqrt(end / k / 3.0)
+        z = min(1.5 * d / end / c, 1.0)
+        return duration - 2.0 * c * math.sin(math.asin(z) / 3.0)
+    # constant acceleration, velocity is start + a * (t - ramp / 2)
+    rest = pt - start * ramp / 2.0 - a * ramp * ramp / 24.0
+    return ramp / 2.0 + 2.0 * rest / (start + math.sqrt(start * start
+                                                        + 2.0 * a * rest))
+
+
+def _s_curve_time_array(pt, duration, start, end, r):
+    """ Vectorized version of _s_curve_time() for NumPy array.
+    """
+    total = (start + end) * duration / 2.0
+    if end < start:
+        return duration - _s_curve_time_array(total - pt, duration, end,
+                                              start, r)
+    if duration <= 0.0:
+        return numpy.zeros(len(pt))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        if end == start:
+            t = pt / start
+        else:
+            ramp = r * duration
+            a = (end - start) / (duration - ramp)
+            k = a / (6.0 * ramp)
+            p = start / k / 3.0
+            q = pt / k / 2.0
+            u = (q + numpy.sqrt(q * q + p ** 3)) ** (1.0 / 3.0)
+            v = p / u
+            growing = 2.0 * q / (u * u + u * v + v * v)
+            d = total - pt
+            c = math.sqrt(end / k / 3.0)
+            z = numpy.minimum(1.5 * d / end / c, 1.0)
+            falling = duration - 2.0 * c * numpy.sin(numpy.arcsin(z) / 3.0)
+            rest = pt - start * ramp / 2.0 - a * ramp * ramp / 24.0
+            constant = ramp / 2.0 + 2.0 * rest / (
+                start + numpy.sqrt(start * start + 2.0 * a * rest))
+            t = numpy.where(pt <= start * ramp + k * ramp ** 3, growing,
+                            numpy.where(d <= end * ramp - k * ramp ** 3,
+                                        falling, constant))
+    return numpy.where(pt <= 0.0, 0.0, numpy.where(pt >= total, duration, t))
 
 
 class PulseGenerator(object):
@@ -25,18 +187,37 @@ class PulseGenerator(object):
             Ta(Tu) = a * Tu^2 / Vmax / 2
         Now we need just to calculate how much time will accelerate and
         brake will take and recalculate time for them. Linear part will be as
-        is. Since maximum velocity and acceleration is always the same, there
-        is the ACCELERATION_FACTOR_PER_SEC variable.
+        is. Acceleration 'a' is the acceleration of the fastest axis, it is
+        found with path_acceleration(), so no axis exceeds its own limit.
+        Movement can also start and finish with non-zero velocity(V0 and V1),
+        which is used by planner to join movements without full stop. In this
+        case trapezoid is shifted by virtual time which is needed to reach
+        such velocity from zero:
+            U0 = V0 / a, U1 = V1 / a
+            Ta(Tu) = sqrt(U0^2 + 2 * Vmax * Tu / a) - U0
+        With S_CURVE_JERK_RATIO acceleration grows and falls linearly at the
+        beginning and at the end of acceleration and braking, so they take
+        longer by this share of their time, and peak acceleration stays at
+        the limit. Time and distance of such phase are the same as with
+        constant acceleration a / (1 + S_CURVE_JERK_RATIO), so movement is
+        calculated with this average acceleration, and velocity inside
+        phases changes along symmetric S-curve, see _s_curve(). Pseudo time
+        of phase is found from time and time from pseudo time in closed
+        form.
         In the same way circular or other interpolation can be implemented
         based this class.
     """
     AUTO_VELOCITY_ADJUSTMENT = AUTO_VELOCITY_ADJUSTMENT
+    S_CURVE_JERK_RATIO = S_CURVE_JERK_RATIO
+    CHUNK_SIZE = 4096
 
-    def __init__(self, delta):
+    def __init__(self, delta, acceleration_mm_per_s2=None):
         """ Create object. Do not create directly this object, inherit this
             class and implement interpolation function and related methods.
             All child have to call this method ( super().__init__() ).
             :param delta: overall movement delta in mm, uses for debug purpose.
+            :param acceleration_mm_per_s2: desired acceleration along the
+                                           path, None means axises limits.
         """
         self._iteration_x = 0
         self._iteration_y = 0
@@ -46,7 +227,25 @@ class PulseGenerator(object):
         self._acceleration_time_s = 0.0
         self._linear_time_s = 0.0
         self._2Vmax_per_a = 0.0
+        self._entry_time_s = 0.0
+        self._exit_time_s = 0.0
+        self._entry_velocity_mm_per_sec = 0.0
+        self._exit_velocity_mm_per_sec = 0.0
+        self._phases = None
+        self._ramp_share = 0.0
         self._delta = delta
+        self._path_acceleration = acceleration_mm_per_s2
+        self._acceleration = None
+
+    def _set_acceleration(self, proportion):
+        """ Calculate average acceleration of the fastest axis, child
+            classes call it before calculating movement parameters.
+        :param proportion: share of each axis in the path.
+        """
+        self._acceleration = (path_acceleration(proportion,
+                                                self._path_acceleration)
+                              * proportion.find_max()
+                              / (1.0 + self.S_CURVE_JERK_RATIO))
 
     def _adjust_velocity(self, velocity_mm_sec):
         """ Automatically decrease velocity to all axises proportionally if
@@ -105,6 +304,21 @@ class PulseGenerator(object):
         """
         raise NotImplemented
 
+    def _interpolation_arrays(self):
+        """ Vectorized version of interpolation function, it calculates all
+            pulses for each axis at once with NumPy. Reimplement it in child
+            classes, otherwise batch() falls back to iterator.
+        :return: Four tuples, one for each axis X, Y, Z, E, with three values:
+                    - NumPy array of pseudo times for each pulse, the same
+                      values _interpolation_function() returns one by one.
+                    - NumPy array of directions for each pulse or single
+                      value if direction is constant.
+                    - direction which _interpolation_function() returns
+                      when movement for axis is finished.
+                 Or None if not implemented.
+        """
+        return None
+
     def __iter__(self):
         """ Get iterator.
         :return: iterable object.
@@ -113,7 +327,40 @@ class PulseGenerator(object):
          max_axis_velocity_mm_per_sec) = self._get_movement_parameters()
         # helper variable
         self._2Vmax_per_a = (2.0 * max_axis_velocity_mm_per_sec.find_max()
-                             / STEPPER_MAX_ACCELERATION_MM_PER_S2)
+                             / self._acceleration)
+        self._entry_time_s = (self._entry_velocity_mm_per_sec
+                              / self._acceleration)
+        self._exit_time_s = (self._exit_velocity_mm_per_sec
+                             / self._acceleration)
+        # Ramp constants, they are the same for all pulses of movement, so
+        # only phases of acceleration and braking need square root.
+        # Pseudo acceleration time Tpseudo = ((U0 + Ta)^2 - U0^2) / 2Vmax_per_a
+        self._peak_time_s = self._entry_time_s + self._acceleration_time_s
+        self._entry_time2_s = self._entry_time_s ** 2
+        self._peak_time2_s = self._peak_time_s ** 2
+        self._exit_time2_s = self._exit_time_s ** 2
+        if self._2Vmax_per_a > 0.0:
+            self._pseudo_acceleration_s = ((self._peak_time2_s
+                                            - self._entry_time2_s)
+                                           / self._2Vmax_per_a)
+        else:  # no movement, all pulses are at the beginning
+            self._pseudo_acceleration_s = float('inf')
+        # S-curve phases, tuples of time, velocity ratios at the beginning
+        # and at the end, and pseudo time of phase
+        self._phases = None
+        if self.S_CURVE_JERK_RATIO > 0.0 and self._2Vmax_per_a > 0.0:
+            # share of phase time in which acceleration changes
+            self._ramp_share = (self.S_CURVE_JERK_RATIO
+                                / (1.0 + self.S_CURVE_JERK_RATIO))
+            peak_time_s = self._peak_time_s
+            exit_time_s = min(self._exit_time_s, peak_time_s)
+            self._phases = tuple(
+                (end - start if end > start else start - end,
+                 2.0 * start / self._2Vmax_per_a,
+                 2.0 * end / self._2Vmax_per_a,
+                 abs(end ** 2 - start ** 2) / self._2Vmax_per_a)
+                for start, end in ((self._entry_time_s, peak_time_s),
+                                   (peak_time_s, exit_time_s)))
         self._iteration_x = 0
         self._iteration_y = 0
         self._iteration_z = 0
@@ -128,16 +375,16 @@ class PulseGenerator(object):
         :param pt_s: pseudo time of uniform movement.
         :return: time for each axis or None if movement for axis is finished.
         """
+        if self._phases is not None:
+            return self.__s_curve_time(pt_s)
         # acceleration
-        # S = Tpseudo * Vmax = a * t^2 / 2
-        t = math.sqrt(pt_s * self._2Vmax_per_a)
-        if t <= self._acceleration_time_s:
-            return t
+        # S = Tpseudo * Vmax = V0 * t + a * t^2 / 2
+        if pt_s <= self._pseudo_acceleration_s:
+            return math.sqrt(self._entry_time2_s + pt_s * self._2Vmax_per_a) \
+                - self._entry_time_s
 
         # linear
-        # pseudo acceleration time Tpseudo = t^2 / ACCELERATION_FACTOR_PER_SEC
-        t = self._acceleration_time_s + pt_s - (self._acceleration_time_s ** 2
-                                                / self._2Vmax_per_a)
+        t = self._acceleration_time_s + pt_s - self._pseudo_acceleration_s
         # pseudo breaking time
         bt = t - self._acceleration_time_s - self._linear_time_s
         if bt <= 0:
@@ -145,14 +392,382 @@ class PulseGenerator(object):
 
         # braking
         # Vmax * Tpseudo = Vlinear * t - a * t^2 / 2
-        # V on start braking is Vlinear = Taccel * a = Tbreaking * a
-        # Vmax * Tpseudo = Tbreaking * a * t - a * t^2 / 2
-        d = self._acceleration_time_s ** 2 - self._2Vmax_per_a * bt
-        if d > 0:
+        # V on start braking is Vlinear = (U0 + Taccel) * a, braking finishes
+        # on V1 = U1 * a, i.e. not earlier then U1 before full stop.
+        d = self._peak_time2_s - self._2Vmax_per_a * bt
+        if d > self._exit_time2_s:
             d = math.sqrt(d)
         else:
-            d = 0
-        return 2.0 * self._acceleration_time_s + self._linear_time_s - d
+            d = self._exit_time_s
+        return (self._acceleration_time_s + self._linear_time_s
+                + (self._peak_time_s - d))
+
+    def _to_accelerated_time_array(self, pt_s):
+        """ Vectorized version of _to_accelerated_time(), which calculates
+            exactly the same values for NumPy array.
+        :param pt_s: NumPy array with sorted pseudo times of uniform
+                     movement.
+        :return: NumPy array with times.
+        """
+        if self._phases is not None:
+            return self.__s_curve_time_array(pt_s)
+        # pseudo times are sorted, so each phase is a slice of array
+        t = numpy.empty(len(pt_s))
+        n = int(numpy.searchsorted(pt_s, self._pseudo_acceleration_s,
+                                   'right'))
+        # acceleration
+        t[:n] = numpy.sqrt(self._entry_time2_s
+                           + pt_s[:n] * self._2Vmax_per_a) \
+            - self._entry_time_s
+        # linear
+        lt = self._acceleration_time_s + pt_s[n:] - self._pseudo_acceleration_s
+        bt = lt - self._acceleration_time_s - self._linear_time_s
+        # braking
+        b = int(numpy.searchsorted(bt, 0.0, 'right'))
+        d = self._peak_time2_s - self._2Vmax_per_a * bt[b:]
+        d = numpy.where(d > self._exit_time2_s,
+                        numpy.sqrt(numpy.maximum(d, self._exit_time2_s)),
+                        self._exit_time_s)
+        lt[b:] = (self._acceleration_time_s + self._linear_time_s
+                  + (self._peak_time_s - d))
+        t[n:] = lt
+        return t
+
+    def _to_pseudo_time(self, t_s):
+        """ Inverse of _to_accelerated_time(), translate time of accelerated
+            movement to pseudo time of uniform movement.
+        :param t_s: time of accelerated movement.
+        :return: Tuple of pseudo time and velocity at this moment as ratio to
+                 the maximum velocity, i.e. derivative of pseudo time.
+        """
+        t_s = max(t_s, 0.0)
+        if self._phases is not None:
+            return self.__s_curve_pseudo_time(t_s)
+        if t_s <= self._acceleration_time_s:
+            # Tpseudo = (t^2 + 2 * U0 * t) / 2Vmax_per_a
+            return ((t_s ** 2 + 2.0 * self._entry_time_s * t_s)
+                    / self._2Vmax_per_a,
+                    2.0 * (self._entry_time_s + t_s) / self._2Vmax_per_a)
+        peak_time_s = self._entry_time_s + self._acceleration_time_s
+        pseudo_acceleration_s = ((peak_time_s ** 2 - self._entry_time_s ** 2)
+                                 / self._2Vmax_per_a)
+        lt = t_s - self._acceleration_time_s
+        if lt <= self._linear_time_s:
+            return pseudo_acceleration_s + lt, 1.0
+        # braking, movement can't go further then full stop or exit velocity
+        d = max(peak_time_s - (lt - self._linear_time_s), self._exit_time_s)
+        return (pseudo_acceleration_s + self._linear_time_s
+                + (peak_time_s ** 2 - d ** 2) / self._2Vmax_per_a,
+                2.0 * d / self._2Vmax_per_a)
+
+    def _to_pseudo_time_array(self, t_s):
+        """ Vectorized version of _to_pseudo_time().
+        :param t_s: NumPy array with times of accelerated movement.
+        :return: Tuple of two NumPy arrays with pseudo times and velocity
+                 ratios.
+        """
+        t_s = numpy.maximum(t_s, 0.0)
+        if self._phases is not None:
+            return self.__s_curve_pseudo_time_array(t_s)
+        peak_time_s = self._entry_time_s + self._acceleration_time_s
+        pseudo_acceleration_s = ((peak_time_s ** 2 - self._entry_time_s ** 2)
+                                 / self._2Vmax_per_a)
+        lt = t_s - self._acceleration_time_s
+        d = numpy.maximum(peak_time_s - (lt - self._linear_time_s),
+                          self._exit_time_s)
+        accelerating = t_s <= self._acceleration_time_s
+        linear = ~accelerating & (lt <= self._linear_time_s)
+        pt = numpy.where(accelerating,
+                         (t_s ** 2 + 2.0 * self._entry_time_s * t_s)
+                         / self._2Vmax_per_a,
+                         numpy.where(linear, pseudo_acceleration_s + lt,
+                                     pseudo_acceleration_s
+                                     + self._linear_time_s
+                                     + (peak_time_s ** 2 - d ** 2)
+                                     / self._2Vmax_per_a))
+        ratio = numpy.where(accelerating,
+                            2.0 * (self._entry_time_s + t_s)
+                            / self._2Vmax_per_a,
+                            numpy.where(linear, 1.0,
+                                        2.0 * d / self._2Vmax_per_a))
+        return pt, ratio
+
+    def __phase(self, t_s, phase):
+        # pseudo time and velocity ratio inside S-curve phase
+        duration, start, end, _ = phase
+        x = t_s / duration if duration > 0.0 else 1.0
+        distance, velocity = _s_curve(x, self._ramp_share)
+        return (start * t_s + (end - start) * duration * distance,
+                start + (end - start) * velocity)
+
+    def __phase_time(self, pt_s, phase):
+        duration, start, end, _ = phase
+        return _s_curve_time(pt_s, duration, start, end, self._ramp_share)
+
+    def __phase_array(self, t_s, phase):
+        duration, start, end, _ = phase
+        if duration > 0.0:
+            x = t_s / duration
+        else:
+            x = numpy.ones(len(t_s))
+        distance, velocity = _s_curve_array(x, self._ramp_share)
+        return (start * t_s + (end - start) * duration * distance,
+                start + (end - start) * velocity)
+
+    def __phase_time_array(self, pt_s, phase):
+        duration, start, end, _ = phase
+        return _s_curve_time_array(pt_s, duration, start, end,
+                                   self._ramp_share)
+
+    def __s_curve_time(self, pt_s):
+        # the same as _to_accelerated_time() with S-curve phases
+        acceleration, braking = self._phases
+        if pt_s <= acceleration[3]:
+            return self.__phase_time(pt_s, acceleration)
+        t = self._acceleration_time_s + pt_s - acceleration[3]
+        bt = t - self._acceleration_time_s - self._linear_time_s
+        if bt <= 0:
+            return t
+        return (self._acceleration_time_s + self._linear_time_s
+                + self.__phase_time(min(bt, braking[3]), braking))
+
+    def __s_curve_time_array(self, pt_s):
+        acceleration, braking = self._phases
+        t = numpy.empty(len(pt_s))
+        accelerating = pt_s <= acceleration[3]
+        t[accelerating] = self.__phase_time_array(pt_s[accelerating],
+                                                  acceleration)
+        rest = numpy.flatnonzero(~accelerating)
+        lt = self._acceleration_time_s + pt_s[rest] - acceleration[3]
+        bt = lt - self._acceleration_time_s - self._linear_time_s
+        braking_items = bt > 0
+        lt[braking_items] = (self._acceleration_time_s + self._linear_time_s
+                             + self.__phase_time_array(
+                                 numpy.minimum(bt[braking_items],
+                                               braking[3]), braking))
+        t[rest] = lt
+        return t
+
+    def __s_curve_pseudo_time(self, t_s):
+        # the same as _to_pseudo_time() with S-curve phases
+        acceleration, braking = self._phases
+        if t_s <= self._acceleration_time_s:
+            return self.__phase(t_s, acceleration)
+        lt = t_s - self._acceleration_time_s
+        if lt <= self._linear_time_s:
+            return acceleration[3] + lt, 1.0
+        pt, ratio = self.__phase(min(lt - self._linear_time_s, braking[0]),
+                                 braking)
+        return acceleration[3] + self._linear_time_s + pt, ratio
+
+    def __s_curve_pseudo_time_array(self, t_s):
+        acceleration, braking = self._phases
+        lt = t_s - self._acceleration_time_s
+        accelerating = t_s <= self._acceleration_time_s
+        linear = ~accelerating & (lt <= self._linear_time_s)
+        apt, ar = self.__phase_array(numpy.minimum(t_s, acceleration[0]),
+                                     acceleration)
+        bpt, br = self.__phase_array(
+            numpy.clip(lt - self._linear_time_s, 0.0, braking[0]), braking)
+        pt = numpy.where(accelerating, apt,
+                         numpy.where(linear, acceleration[3] + lt,
+                                     acceleration[3] + self._linear_time_s
+                                     + bpt))
+        ratio = numpy.where(accelerating, ar, numpy.where(linear, 1.0, br))
+        return pt, ratio
+
+    def __batch_from_iterator(self):
+        directions = []
+        times = []
+        masks = []
+        for direction, tx, ty, tz, te in self:
+            if direction:
+                directions.append((len(times), (tx, ty, tz, te)))
+                continue
+            mask = 0
+            for t, bit in ((tx, AXIS_MASK_X), (ty, AXIS_MASK_Y),
+                           (tz, AXIS_MASK_Z), (te, AXIS_MASK_E)):
+                if t is not None:
+                    mask |= bit
+                    m = t
+            times.append(m)
+            masks.append(mask)
+        return directions, times, masks
+
+    def batch(self):
+        """ Calculate all pulses for movement at once. Result is the same
+            as iterator provides, but with NumPy it is calculated in a
+            vectorized way: pseudo times for each axis, then coincident
+            pulses are merged and then times are translated into accelerated
+            movement for the whole array. Without NumPy or interpolation
+            arrays, iterator is used to fill result.
+        :return: Tuple of three values:
+                    - list of directions changes, each item is tuple of pulse
+                      index, before which direction should be changed, and
+                      tuple with direction for each axis in the same format as
+                      iterator returns them. Index can be equal to the number
+                      of pulses, which means change after the last pulse.
+                    - sequence with time of each pulse in seconds.
+                    - sequence with mask of axises, which should make pulse
+                      at this time, see AXIS_MASK_* constants.
+        """
+        self.__iter__()
+        arrays = None
+        if numpy is not None:
+            arrays = self._interpolation_arrays()
+        if arrays is None:
+            return self.__batch_from_iterator()
+        return self.__batch_from_arrays(arrays)
+
+    def __batch_from_arrays(self, arrays):
+        # merge pulses of all axises, pulses with the same time are merged,
+        # except repeated pulses of one axis with the same time.
+        pseudo_times = []
+        bits = []
+        ranks = []
+        for (pt, _, _), bit in zip(arrays, (AXIS_MASK_X, AXIS_MASK_Y,
+                                            AXIS_MASK_Z, AXIS_MASK_E)):
+            pseudo_times.append(pt)
+            bits.append(numpy.full(len(pt), bit, dtype=numpy.uint8))
+            rank = numpy.zeros(len(pt), dtype=numpy.int64)
+            if len(pt) > 1:
+                repeated = numpy.flatnonzero(pt[1:] == pt[:-1]) + 1
+                if len(repeated) > 0:
+                    # number of the same values before each item
+                    starts = numpy.ones(len(pt), dtype=bool)
+                    starts[repeated] = False
+                    first = numpy.maximum.accumulate(
+                        numpy.where(starts, numpy.arange(len(pt)), 0))
+                    rank = numpy.arange(len(pt)) - first
+            ranks.append(rank)
+        pseudo_times = numpy.concatenate(pseudo_times)
+        bits = numpy.concatenate(bits)
+        ranks = numpy.concatenate(ranks)
+        order = numpy.lexsort((ranks, pseudo_times))
+        pseudo_times = pseudo_times[order]
+        bits = bits[order]
+        ranks = ranks[order]
+        if len(pseudo_times) > 0:
+            new = numpy.ones(len(pseudo_times), dtype=bool)
+            new[1:] = ((pseudo_times[1:] != pseudo_times[:-1])
+                       | (ranks[1:] != ranks[:-1]))
+            starts = numpy.flatnonzero(new)
+            masks = numpy.bitwise_or.reduceat(bits, starts)
+            times = self._to_accelerated_time_array(pseudo_times[starts])
+        else:
+            masks = numpy.zeros(0, dtype=numpy.uint8)
+            times = numpy.zeros(0)
+        # Direction of each axis before each pulse is direction of the next
+        # pulse of this axis, or final direction if axis has finished.
+        states = []
+        for (pt, d, final), bit in zip(arrays, (AXIS_MASK_X, AXIS_MASK_Y,
+                                                AXIS_MASK_Z, AXIS_MASK_E)):
+            d = numpy.append(numpy.broadcast_to(numpy.asarray(d, dtype=float),
+                                                (len(pt),)), final)
+            done = numpy.zeros(len(masks) + 1, dtype=numpy.int64)
+            numpy.cumsum((masks & bit) != 0, out=done[1:])
+            states.append(d[done])
+        states = numpy.stack(states, axis=1)
+        for i, inverted in enumerate((STEPPER_INVERTED_X, STEPPER_INVERTED_Y,
+                                      STEPPER_INVERTED_Z, STEPPER_INVERTED_E)):
+            if inverted:
+                states[:, i] = -states[:, i]
+        changed = numpy.ones(len(states), dtype=bool)
+        changed[1:] = numpy.any(states[1:] != states[:-1], axis=1)
+        directions = list((int(i), tuple(states[i].tolist()))
+                          for i in numpy.flatnonzero(changed))
+        return directions, times, masks
+
+    def batch_pulses(self):
+        """ Iterate pulses in the same format as iterator does, but calculate
+            them with batch() at once.
+        :return: generator object.
+        """
+        directions, times, masks = self.batch()
+        if numpy is not None and isinstance(times, numpy.ndarray):
+            times = times.tolist()
+            masks = masks.tolist()
+        directions = iter(directions)
+        index, direction = next(directions, (None, None))
+        for i, (t, mask) in enumerate(zip(times, masks)):
+            while index == i:
+                yield (True,) + direction
+                index, direction = next(directions, (None, None))
+            yield (False,
+                   t if mask & AXIS_MASK_X else None,
+                   t if mask & AXIS_MASK_Y else None,
+                   t if mask & AXIS_MASK_Z else None,
+                   t if mask & AXIS_MASK_E else None)
+        if index is not None:
+            yield (True,) + direction
+
+    def __chunks_from_iterator(self, size):
+        directions = []
+        ticks = array.array(_TICKS_TYPECODE)
+        masks = array.array('B')
+        for direction, tx, ty, tz, te in self:
+            if direction:
+                directions.append((len(ticks), (tx, ty, tz, te)))
+                continue
+            mask = 0
+            for t, bit in ((tx, AXIS_MASK_X), (ty, AXIS_MASK_Y),
+                           (tz, AXIS_MASK_Z), (te, AXIS_MASK_E)):
+                if t is not None:
+                    mask |= bit
+                    m = t
+            if len(ticks) >= size:
+                yield directions, ticks, masks
+                directions = []
+                ticks = array.array(_TICKS_TYPECODE)
+                masks = array.array('B')
+            ticks.append(int(round(m * TICKS_IN_SECONDS)))
+            masks.append(mask)
+        if len(ticks) > 0 or len(directions) > 0:
+            yield directions, ticks, masks
+
+    def chunks(self, size=None):
+        """ Iterate pulses by chunks with fixed size. This is an alternative
+            to iterator which doesn't create tuple for each pulse. With NumPy
+            the whole movement is calculated with batch() and then split,
+            otherwise chunks are filled from iterator on the fly.
+        :param size: maximum number of pulses in chunk, CHUNK_SIZE if None.
+        :return: generator object which yields tuples of three values:
+                    - list of directions changes, each item is tuple of index
+                      in this chunk, before which direction should be changed,
+                      and tuple with direction for each axis in the same format
+                      as iterator returns them. Index can be equal to the
+                      chunk length, which means change after the last pulse
+                      of chunk.
+                    - array with integer time of each pulse in ticks, see
+                      TICKS_IN_SECONDS.
+                    - array with mask of axises, which should make pulse at
+                      this time, see AXIS_MASK_* constants.
+                 Arrays are NumPy arrays if NumPy is installed, or standard
+                 'array' objects otherwise.
+        """
+        if size is None:
+            size = self.CHUNK_SIZE
+        self.__iter__()
+        arrays = None
+        if numpy is not None:
+            arrays = self._interpolation_arrays()
+        if arrays is None:
+            for chunk in self.__chunks_from_iterator(size):
+                yield chunk
+            return
+        directions, times, masks = self.__batch_from_arrays(arrays)
+        ticks = numpy.rint(times * TICKS_IN_SECONDS).astype(numpy.int64)
+        total = len(ticks)
+        start = 0
+        while True:
+            end = min(start + size, total)
+            # changes on the chunks border belong to the previous chunk
+            chunk_directions = list((i - start, d) for i, d in directions
+                                    if (start == 0 or start < i) and i <= end)
+            yield chunk_directions, ticks[start:end], masks[start:end]
+            start = end
+            if start >= total:
+                break
 
     def __next__(self):
         # for python3
@@ -231,7 +846,11 @@ class PulseGenerator(object):
         :return: time in seconds.
         """
         acceleration_time_s, linear_time_s, _ = self._get_movement_parameters()
-        return acceleration_time_s * 2.0 + linear_time_s
+        braking_time_s = (acceleration_time_s
+                          + (self._entry_velocity_mm_per_sec
+                             - self._exit_velocity_mm_per_sec)
+                          / self._acceleration)
+        return acceleration_time_s + linear_time_s + braking_time_s
 
     def delta(self):
         """ Get overall movement distance.
@@ -248,39 +867,71 @@ class PulseGenerator(object):
 
 
 class PulseGeneratorLinear(PulseGenerator):
-    def __init__(self, delta_mm, velocity_mm_per_min):
+    LINEAR_DDA = LINEAR_DDA
+    # fractional bits of fixed point time in DDA
+    DDA_FRACTION_BITS = 32
+
+    def __init__(self, delta_mm, velocity_mm_per_min,
+                 entry_velocity_mm_per_min=0.0, exit_velocity_mm_per_min=0.0,
+                 acceleration_mm_per_s2=None):
         """ Create pulse generator for linear interpolation.
         :param delta_mm: movement distance of each axis.
         :param velocity_mm_per_min: desired velocity.
+        :param entry_velocity_mm_per_min: velocity at the beginning of
+                                          movement, zero means movement starts
+                                          from full stop.
+        :param exit_velocity_mm_per_min: velocity at the end of movement, zero
+                                         means full stop at the end.
+        :param acceleration_mm_per_s2: desired acceleration along the path,
+                                       None means axises limits only.
         """
-        super(PulseGeneratorLinear, self).__init__(delta_mm)
+        super(PulseGeneratorLinear, self).__init__(delta_mm,
+                                                   acceleration_mm_per_s2)
         distance_mm = abs(delta_mm)  # type: Coordinates
         # velocity of each axis
         distance_total_mm = distance_mm.length()
+        self._set_acceleration(distance_mm / distance_total_mm)
+        a = self._acceleration
         self.max_velocity_mm_per_sec = self._adjust_velocity(distance_mm * (
             velocity_mm_per_min / SECONDS_IN_MINUTE / distance_total_mm))
+        # Acceleration is applied to the fastest axis, so all calculations
+        # below are made for this axis. Entry and exit velocities are
+        # specified for the whole path, project them on this axis.
+        distance_max_mm = distance_mm.find_max()
+        velocity_max = self.max_velocity_mm_per_sec.find_max()
+        k = distance_max_mm / distance_total_mm / SECONDS_IN_MINUTE
+        self._entry_velocity_mm_per_sec = min(entry_velocity_mm_per_min * k,
+                                              velocity_max)
+        self._exit_velocity_mm_per_sec = min(exit_velocity_mm_per_min * k,
+                                             velocity_max)
+        v0 = self._entry_velocity_mm_per_sec
+        v1 = self._exit_velocity_mm_per_sec
         # acceleration time
-        self.acceleration_time_s = (self.max_velocity_mm_per_sec.find_max()
-                                    / STEPPER_MAX_ACCELERATION_MM_PER_S2)
+        self.acceleration_time_s = (velocity_max - v0) / a
         # check if there is enough space to accelerate and brake, adjust time
-        # S = a * t^2 / 2
-        if STEPPER_MAX_ACCELERATION_MM_PER_S2 * self.acceleration_time_s ** 2 \
-                > distance_total_mm:
-            self.acceleration_time_s = \
-                math.sqrt(distance_total_mm
-                          / STEPPER_MAX_ACCELERATION_MM_PER_S2)
+        # S = (Vmax^2 - V0^2) / (2 * a) + (Vmax^2 - V1^2) / (2 * a)
+        if (2.0 * velocity_max ** 2 - v0 ** 2 - v1 ** 2) \
+                > 2.0 * a * distance_max_mm:
+            # find peak velocity which is reached in the middle
+            velocity_peak = math.sqrt(a * distance_max_mm
+                                      + (v0 ** 2 + v1 ** 2) / 2.0)
+            velocity_peak = max(velocity_peak, v0, v1)
+            self.acceleration_time_s = (velocity_peak - v0) / a
             self.linear_time_s = 0.0
-            # V = a * t -> V = 2 * S / t, take half of total distance for
-            # acceleration and braking
-            self.max_velocity_mm_per_sec = (distance_mm
-                                            / self.acceleration_time_s)
+            self.max_velocity_mm_per_sec = (self.max_velocity_mm_per_sec
+                                            * (velocity_peak / velocity_max))
         else:
             # calculate linear time
-            linear_distance_mm = distance_total_mm \
-                                 - self.acceleration_time_s ** 2 \
-                                 * STEPPER_MAX_ACCELERATION_MM_PER_S2
-            self.linear_time_s = (linear_distance_mm
-                                  / self.max_velocity_mm_per_sec.length())
+            linear_distance_mm = distance_max_mm \
+                                 - (2.0 * velocity_max ** 2 - v0 ** 2
+                                    - v1 ** 2) / (2.0 * a)
+            self.linear_time_s = linear_distance_mm / velocity_max
+        # Pulses are placed at the end of each step when movement is joined
+        # with neighbours, so there is no pause or double pulse between them.
+        if v0 > 0.0 or v1 > 0.0:
+            self._pulse_shift = 1
+        else:
+            self._pulse_shift = 0
         self._total_pulses_x = round(distance_mm.x * STEPPER_PULSES_PER_MM_X)
         self._total_pulses_y = round(distance_mm.y * STEPPER_PULSES_PER_MM_Y)
         self._total_pulses_z = round(distance_mm.z * STEPPER_PULSES_PER_MM_Z)
@@ -297,15 +948,14 @@ class PulseGeneratorLinear(PulseGenerator):
                 self.linear_time_s,
                 self.max_velocity_mm_per_sec)
 
-    @staticmethod
-    def __linear(i, pulses_per_mm, total_pulses, velocity_mm_per_sec):
+    def __linear(self, i, pulses_per_mm, total_pulses, velocity_mm_per_sec):
         """ Helper function for linear movement.
         """
         # check if need to calculate for this axis
         if total_pulses == 0.0 or i >= total_pulses:
             return None
         # Linear movement, S = V * t -> t = S / V
-        return i / pulses_per_mm / velocity_mm_per_sec
+        return (i + self._pulse_shift) / pulses_per_mm / velocity_mm_per_sec
 
     def _interpolation_function(self, ix, iy, iz, ie):
         """ Calculate interpolation values for linear movement, see super class
@@ -321,9 +971,135 @@ class PulseGeneratorLinear(PulseGenerator):
                             self.max_velocity_mm_per_sec.e)
         return self._direction, (t_x, t_y, t_z, t_e)
 
+    def _interpolation_arrays(self):
+        """ Calculate interpolation arrays for linear movement, see super class
+            for details.
+        """
+        arrays = []
+        for total_pulses, pulses_per_mm, velocity, direction in (
+                (self._total_pulses_x, STEPPER_PULSES_PER_MM_X,
+                 self.max_velocity_mm_per_sec.x, self._direction[0]),
+                (self._total_pulses_y, STEPPER_PULSES_PER_MM_Y,
+                 self.max_velocity_mm_per_sec.y, self._direction[1]),
+                (self._total_pulses_z, STEPPER_PULSES_PER_MM_Z,
+                 self.max_velocity_mm_per_sec.z, self._direction[2]),
+                (self._total_pulses_e, STEPPER_PULSES_PER_MM_E,
+                 self.max_velocity_mm_per_sec.e, self._direction[3])):
+            if total_pulses == 0.0:
+                pt = numpy.zeros(0)
+            else:
+                pt = ((numpy.arange(int(total_pulses)) + self._pulse_shift)
+                      / pulses_per_mm / velocity)
+            arrays.append((pt, direction, direction))
+        return arrays
+
+    def chunks(self, size=None):
+        """ Iterate pulses by chunks, see super class for details. With
+            LINEAR_DDA pulses are calculated with _dda_chunks().
+        """
+        if self.LINEAR_DDA:
+            return self._dda_chunks(size)
+        return super(PulseGeneratorLinear, self).chunks(size)
+
+    def __dda_pseudo_index(self, pseudo_time_s, step_s, shift, total):
+        # number of pulses of the main axis which pseudo time is not more
+        # then specified, the same comparison as _to_accelerated_time() does
+        if pseudo_time_s == float('inf'):
+            return total
+        k = min(max(int(pseudo_time_s / step_s) - shift, 0), total)
+        while k < total and (k + shift) * step_s <= pseudo_time_s:
+            k += 1
+        while k > 0 and (k - 1 + shift) * step_s > pseudo_time_s:
+            k -= 1
+        return k
+
+    def _dda_chunks(self, size=None):
+        """ Calculate pulses with integer DDA, result is in the same format
+            as chunks() returns. Pulses of the axis with the most pulses are
+            timed with acceleration curve, time of pulses in linear phase is
+            accumulated in fixed point ticks, so error of each pulse is not
+            more then one tick. Pulses of other axises are distributed with
+            Bresenham's algorithm, each of them is made together with pulse
+            of the main axis.
+        :param size: maximum number of pulses in chunk, CHUNK_SIZE if None.
+        :return: generator object, see chunks().
+        """
+        if size is None:
+            size = self.CHUNK_SIZE
+        self.__iter__()
+        direction = tuple(-d if inverted else d for d, inverted in zip(
+            self._direction, (STEPPER_INVERTED_X, STEPPER_INVERTED_Y,
+                              STEPPER_INVERTED_Z, STEPPER_INVERTED_E)))
+        axises = list(zip((int(self._total_pulses_x),
+                           int(self._total_pulses_y),
+                           int(self._total_pulses_z),
+                           int(self._total_pulses_e)),
+                          (AXIS_MASK_X, AXIS_MASK_Y, AXIS_MASK_Z, AXIS_MASK_E),
+                          (STEPPER_PULSES_PER_MM_X, STEPPER_PULSES_PER_MM_Y,
+                           STEPPER_PULSES_PER_MM_Z, STEPPER_PULSES_PER_MM_E),
+                          (self.max_velocity_mm_per_sec.x,
+                           self.max_velocity_mm_per_sec.y,
+                           self.max_velocity_mm_per_sec.z,
+                           self.max_velocity_mm_per_sec.e)))
+        total, bit, pulses_per_mm, velocity = max(axises,
+                                                  key=lambda a: a[0])
+        directions = [(0, direction)]
+        ticks = array.array(_TICKS_TYPECODE)
+        masks = array.array('B')
+        # Bresenham's error of each other axis, pulse is made when it
+        # reaches total
+        others = list((a[0], a[1]) for a in axises
+                      if a[0] > 0 and a[1] != bit)
+        errors = list(total // 2 for _ in others)
+        # pseudo time of main axis pulse is (k + shift) * step_s, linear
+        # phase is between k_linear and k_braking pulses
+        shift = self._pulse_shift
+        step_s = 1.0 / pulses_per_mm / velocity if total > 0 else 0.0
+        k_linear = self.__dda_pseudo_index(self._pseudo_acceleration_s,
+                                           step_s, shift, total)
+        k_braking = max(k_linear, self.__dda_pseudo_index(
+            self._pseudo_acceleration_s + self._linear_time_s, step_s,
+            shift, total))
+        fraction = self.DDA_FRACTION_BITS
+        half = 1 << (fraction - 1)
+        increment = int(round(step_s * TICKS_IN_SECONDS * (1 << fraction)))
+        fixed = int(round((self._acceleration_time_s
+                           + (k_linear + shift) * step_s
+                           - self._pseudo_acceleration_s)
+                          * TICKS_IN_SECONDS * (1 << fraction))) - increment
+        for k in range(0, total):
+            if k_linear <= k < k_braking:
+                fixed += increment
+                t = (fixed + half) >> fraction
+            else:
+                t = int(round(self._to_accelerated_time((k + shift) * step_s)
+                              * TICKS_IN_SECONDS))
+            mask = bit
+            for i in range(0, len(others)):
+                errors[i] += others[i][0]
+                if errors[i] >= total:
+                    errors[i] -= total
+                    mask |= others[i][1]
+            if len(ticks) >= size:
+                yield self.__dda_chunk(directions, ticks, masks)
+                directions = []
+                ticks = array.array(_TICKS_TYPECODE)
+                masks = array.array('B')
+            ticks.append(t)
+            masks.append(mask)
+        yield self.__dda_chunk(directions, ticks, masks)
+
+    @staticmethod
+    def __dda_chunk(directions, ticks, masks):
+        if numpy is None:
+            return directions, ticks, masks
+        return (directions, numpy.array(ticks, dtype=numpy.int64),
+                numpy.array(masks, dtype=numpy.uint8))
+
 
 class PulseGeneratorCircular(PulseGenerator):
-    def __init__(self, delta, radius, plane, direction, velocity):
+    def __init__(self, delta, radius, plane, direction, velocity,
+                 acceleration_mm_per_s2=None):
         """ Create pulse generator for circular interpolation.
             Position calculates based on formulas:
             R^2 = x^2 + y^2
@@ -344,8 +1120,11 @@ class PulseGeneratorCircular(PulseGenerator):
             :param plane: plane to interpolate.
             :param direction: clockwise or counterclockwise.
             :param velocity: velocity in mm per min.
+            :param acceleration_mm_per_s2: desired acceleration along the
+                                           path, None means axises limits.
         """
-        super(PulseGeneratorCircular, self).__init__(delta)
+        super(PulseGeneratorCircular, self).__init__(delta,
+                                                     acceleration_mm_per_s2)
         self._plane = plane
         self._direction = direction
         velocity = velocity / SECONDS_IN_MINUTE
@@ -538,15 +1317,19 @@ class PulseGeneratorCircular(PulseGenerator):
         self._e_velocity = self.max_velocity_mm_per_sec.e
         self._r_div_v = radius / circular_velocity
         self._e_dir = math.copysign(1, delta.e)
-        self.acceleration_time_s = (self.max_velocity_mm_per_sec.find_max()
-                                    / STEPPER_MAX_ACCELERATION_MM_PER_S2)
+        # both axises of plane can move with circular velocity, so the share
+        # of each of them in the path is taken as the whole circular share
+        velocity_total = math.sqrt(circular_velocity ** 2
+                                   + self._velocity_3rd ** 2
+                                   + self._e_velocity ** 2)
+        self._set_acceleration(self.max_velocity_mm_per_sec / velocity_total)
+        a = self._acceleration
+        self.acceleration_time_s = self.max_velocity_mm_per_sec.find_max() / a
         if full_length == 0:
             self.linear_time_s = 0.0
             self.max_velocity_mm_per_sec = Coordinates(0, 0, 0, 0)
-        elif STEPPER_MAX_ACCELERATION_MM_PER_S2 * self.acceleration_time_s \
-                ** 2 > full_length:
-            self.acceleration_time_s = \
-                math.sqrt(full_length / STEPPER_MAX_ACCELERATION_MM_PER_S2)
+        elif a * self.acceleration_time_s ** 2 > full_length:
+            self.acceleration_time_s = math.sqrt(full_length / a)
             self.linear_time_s = 0.0
             v = full_length / self.acceleration_time_s
             if self.max_velocity_mm_per_sec.x > 0.0:
@@ -559,10 +1342,8 @@ class PulseGeneratorCircular(PulseGenerator):
                 self.max_velocity_mm_per_sec.e = v
         else:
             linear_distance_mm = full_length - self.acceleration_time_s ** 2 \
-                                 * STEPPER_MAX_ACCELERATION_MM_PER_S2
-            self.linear_time_s = linear_distance_mm / math.sqrt(
-                circular_velocity ** 2 + self._velocity_3rd ** 2
-                + self._e_velocity ** 2)
+                                 * a
+            self.linear_time_s = linear_distance_mm / velocity_total
 
     @staticmethod
     def __angle(a, b):
@@ -669,3 +1450,229 @@ class PulseGeneratorCircular(PulseGenerator):
         te = self.__linear(ie, self._iterations_e, STEPPER_PULSES_PER_MM_E,
                            self._e_velocity)
         return (dx, dy, dz, self._e_dir), (tx, ty, tz, te)
+
+    @staticmethod
+    def __circular_helper_array(start, i, radius, side, direction):
+        # vectorized __circular_helper(), reflects position from circle
+        # borders and flips direction and side in the same order.
+        np = start + direction * i
+        direction = numpy.full(len(i), direction, dtype=numpy.int64)
+        side = numpy.full(len(i), side, dtype=bool)
+        for border, upper in ((radius, True), (-radius, False),
+                              (radius, True)):
+            if upper:
+                over = np > border
+            else:
+                over = np < border
+            np = numpy.where(over, np - 2 * (np - border), np)
+            direction = numpy.where(over, -direction, direction)
+            side = side ^ over
+        return np, direction, side
+
+    def __circular_find_time_array(self, a, b):
+        angle = numpy.arccos(b / numpy.sqrt(a * a + b * b))
+        angle = numpy.where(a < 0, 2 * math.pi - angle, angle)
+        if self._direction == CW:
+            delta_angle = angle - self._start_angle
+        else:
+            delta_angle = self._start_angle - angle
+        delta_angle = numpy.where(delta_angle <= 0,
+                                  delta_angle + 2 * math.pi, delta_angle)
+        return self._r_div_v * delta_angle
+
+    def __circular_array(self, iterations, start, radius_pulses, radius2,
+                         side, direction, pulses_per_mm, is_a):
+        i = numpy.arange(1, int(iterations) + 1, dtype=numpy.int64)
+        p, directions, sides = self.__circular_helper_array(
+            start, i, radius_pulses, side, direction)
+        p = p / pulses_per_mm
+        # another coordinate on the circle
+        q = numpy.sqrt(radius2 - p * p)
+        q = numpy.where(sides, -q, q)
+        if is_a:
+            pt = self.__circular_find_time_array(p, q)
+        else:
+            pt = self.__circular_find_time_array(q, p)
+        # first and last item can be slightly out of bound due float precision
+        if len(pt) > 0:
+            pt[-1] = self._r_div_v * self._delta_angle
+        return pt, directions, direction
+
+    @staticmethod
+    def __linear_array(total_i, pulses_per_mm, velocity, direction):
+        pt = numpy.arange(int(math.ceil(total_i))) / pulses_per_mm / velocity
+        return pt, direction, direction
+
+    def _interpolation_arrays(self):
+        """ Calculate interpolation arrays for circular movement, see super
+            class for details.
+        """
+        if self._plane == PLANE_XY:
+            apm, bpm = STEPPER_PULSES_PER_MM_X, STEPPER_PULSES_PER_MM_Y
+            tpm = STEPPER_PULSES_PER_MM_Z
+        elif self._plane == PLANE_YZ:
+            apm, bpm = STEPPER_PULSES_PER_MM_Y, STEPPER_PULSES_PER_MM_Z
+            tpm = STEPPER_PULSES_PER_MM_X
+        else:  # self._plane == PLANE_ZX:
+            apm, bpm = STEPPER_PULSES_PER_MM_Z, STEPPER_PULSES_PER_MM_X
+            tpm = STEPPER_PULSES_PER_MM_Y
+        a = self.__circular_array(self._iterations_a, self._start_a_pulses,
+                                  self._radius_a_pulses, self._radius_a2,
+                                  self._side_a, self._dir_a, apm, True)
+        b = self.__circular_array(self._iterations_b, self._start_b_pulses,
+                                  self._radius_b_pulses, self._radius_b2,
+                                  self._side_b, self._dir_b, bpm, False)
+        third = self.__linear_array(self._iterations_3rd, tpm,
+                                    self._velocity_3rd, self._third_dir)
+        e = self.__linear_array(self._iterations_e, STEPPER_PULSES_PER_MM_E,
+                                self._e_velocity, self._e_dir)
+        if self._plane == PLANE_XY:
+            return a, b, third, e
+        elif self._plane == PLANE_YZ:
+            return third, a, b, e
+        else:  # self._plane == PLANE_ZX:
+            return b, third, a, e
+
+
+class Retiming(object):
+    def __init__(self, generator, time_ticks, start_ticks, braking,
+                 ratio=None):
+        """ Change timing of pulses which were calculated by PulseGenerator,
+            it is used to brake in the middle of movement on feed hold and to
+            accelerate again on resume. Path stays the same, pulses are just
+            moved in time as machine brakes or accelerates with the maximum
+            acceleration from the specified moment. Velocity never exceeds
+            velocity of the original timing, i.e. when accelerating machine
+            reaches it, pulses keep their original intervals.
+        :param generator: PulseGenerator object which pulses were calculated.
+        :param time_ticks: moment of original timing to start from, usually
+                           time of the last pulse which was made, in ticks.
+        :param start_ticks: the same moment in new timing.
+        :param braking: True to brake till full stop, False to accelerate.
+        :param ratio: velocity at this moment as ratio to the maximum
+                      velocity of movement, None to keep velocity of
+                      original timing.
+        """
+        self._generator = generator
+        self._braking = braking
+        pt, r = generator._to_pseudo_time(time_ticks
+                                          / float(TICKS_IN_SECONDS))
+        self._pseudo_time_s = pt
+        self._ratio = r if ratio is None else min(ratio, r)
+        # the last pulse in original, kinematic and new timing
+        self._last_s = time_ticks / float(TICKS_IN_SECONDS)
+        self._last_kinematic_s = 0.0
+        self._last_new_s = start_ticks / float(TICKS_IN_SECONDS)
+        self._end_ratio = None
+        self.stopped = braking and self._ratio <= 0.0
+
+    def __kinematic(self, distance):
+        # time to pass distance, which is pseudo time multiplied by
+        # 4 / 2Vmax_per_a, with the maximum acceleration
+        # Tpseudo = R * t -+ t^2 / 2Vmax_per_a
+        half = self._generator._2Vmax_per_a / 2.0
+        if self._braking:
+            return (self._ratio - math.sqrt(self._ratio ** 2 - distance)) \
+                * half
+        return (math.sqrt(self._ratio ** 2 + distance) - self._ratio) * half
+
+    def retime(self, ticks):
+        """ Calculate new timing for pulses. Pulses are passed in order, by
+            chunks, each chunk continues the previous one.
+        :param ticks: array with time of pulses in original timing.
+        :return: array of the same type with time of pulses in new timing.
+                 When braking, it can be shorter then ticks, which
+                 means machine stops before the rest of pulses, see
+                 'stopped' attribute.
+        """
+        k = 4.0 / self._generator._2Vmax_per_a
+        r2 = self._ratio ** 2
+        if numpy is not None and isinstance(ticks, numpy.ndarray):
+            t = ticks / float(TICKS_IN_SECONDS)
+            if self.stopped:
+                t = t[:0]
+            pt, _ = self._generator._to_pseudo_time_array(t)
+            distance = (pt - self._pseudo_time_s) * k
+            half = self._generator._2Vmax_per_a / 2.0
+            if self._braking:
+                n = int(numpy.count_nonzero(distance < r2))
+                self.stopped = n < len(t)
+                t = t[:n]
+                kt = (self._ratio - numpy.sqrt(r2 - distance[:n])) * half
+            else:
+                kt = (numpy.sqrt(r2 + distance) - self._ratio) * half
+            if len(t) == 0:
+                return numpy.zeros(0, dtype=numpy.int64)
+            intervals = numpy.maximum(
+                numpy.diff(t, prepend=self._last_s),
+                numpy.diff(kt, prepend=self._last_kinematic_s))
+            new = self._last_new_s + numpy.cumsum(intervals)
+            self._last_s = t[-1]
+            self._last_kinematic_s = kt[-1]
+            self._last_new_s = new[-1]
+            return numpy.rint(new * TICKS_IN_SECONDS).astype(numpy.int64)
+        result = array.array(_TICKS_TYPECODE)
+        for tick in ticks:
+            if self.stopped:
+                break
+            t = tick / float(TICKS_IN_SECONDS)
+            distance = (self._generator._to_pseudo_time(t)[0]
+                        - self._pseudo_time_s) * k
+            if self._braking and distance >= r2:
+                self.stopped = True
+                break
+            kt = self.__kinematic(distance)
+            self._last_new_s += max(t - self._last_s,
+                                    kt - self._last_kinematic_s)
+            self._last_s = t
+            self._last_kinematic_s = kt
+            result.append(int(round(self._last_new_s * TICKS_IN_SECONDS)))
+        return result
+
+    def finish(self):
+        """ Calculate when movement ends in new timing, call it after all
+            pulses were retimed.
+        :return: time in ticks or None if machine stops before the end when
+                 braking.
+        """
+        if self.stopped:
+            return None
+        total_s = self._generator.total_time_s()
+        pt, ratio = self._generator._to_pseudo_time(total_s)
+        distance = ((pt - self._pseudo_time_s) * 4.0
+                    / self._generator._2Vmax_per_a)
+        if self._braking:
+            if distance >= self._ratio ** 2:
+                self.stopped = True
+                return None
+            self._end_ratio = min(ratio, math.sqrt(self._ratio ** 2
+                                                   - distance))
+        else:
+            self._end_ratio = min(ratio, math.sqrt(self._ratio ** 2
+                                                   + distance))
+        end_s = self._last_new_s + max(total_s - self._last_s,
+                                       self.__kinematic(distance)
+                                       - self._last_kinematic_s)
+        return int(round(end_s * TICKS_IN_SECONDS))
+
+    def following(self, generator):
+        """ Continue retiming in the next movement, which is joined with this
+            one without full stop, call it after finish().
+        :param generator: PulseGenerator object of the next movement, which
+                          pulses were calculated.
+        :return: Retiming object or None if it isn't needed, i.e. machine
+                 has stopped or has reached velocity of original timing.
+        """
+        if self.stopped or self._end_ratio is None:
+            return None
+        # velocity ratios are related to the fastest axis of each movement,
+        # so velocity on junction is converted with planned velocities
+        exit_ratio = (2.0 * self._generator._exit_time_s
+                      / self._generator._2Vmax_per_a)
+        if exit_ratio <= 0.0:
+            return None
+        if not self._braking and self._end_ratio >= exit_ratio:
+            return None
+        entry_ratio = 2.0 * generator._entry_time_s / generator._2Vmax_per_a
+        return Retiming(generator, 0, 0, self._braking,
+                        self._end_ratio * entry_ratio / exit_ratio)
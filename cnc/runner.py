@@ -0,0 +1,163 @@
+import sys
+import time
+import threading
+
+try:  # python3 compatibility
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    import Queue as queue
+
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachineException
+
+
+class FileRunner(object):
+    QUEUE_SIZE = 1000
+    OUTPUT_BATCH_SIZE = 100
+
+    def __init__(self, machine, quiet=False, output=None):
+        """ Run gcode file with two stages. Reader thread reads and parses
+            lines into bounded queue, machine stage executes parsed commands
+            from queue in the calling thread. So parsing and console output
+            don't delay movements.
+        :param machine: GMachine object.
+        :param quiet: if True, print only answers and errors, and print them
+                      in batches.
+        :param output: file object for output, stdout by default.
+        """
+        self._machine = machine
+        self._quiet = quiet
+        self._output = output or sys.stdout
+        self._queue = None
+        self._stop = threading.Event()
+        self._batch = []
+        self.lines = 0
+        self.parse_time_s = 0.0
+        self.execute_time_s = 0.0
+        self.wait_time_s = 0.0
+        self.max_queue_depth = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+
+    def _put(self, item):
+        # wait for free space in queue, but stop if machine stage has stopped
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, f):
+        # reader stage, items are (line number, line, GCode, error), time of
+        # reading and parsing is counted, waiting for free space is not
+        try:
+            st = time.time()
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                try:
+                    item = (number, line, GCode.parse_line(line), None)
+                except GCodeException as e:
+                    item = (number, line, None, e)
+                self.parse_time_s += time.time() - st
+                if not self._put(item) or item[3] is not None:
+                    return
+                st = time.time()
+        finally:
+            self._put(None)
+
+    def _read_parsed(self, parsed):
+        # reader stage for lines which were parsed in advance
+        try:
+            for number, gcode in enumerate(parsed, 1):
+                if not self._put((number, None, gcode, None)):
+                    return
+        finally:
+            self._put(None)
+
+    def _print(self, text):
+        if self._quiet:
+            self._batch.append(text)
+            if len(self._batch) >= self.OUTPUT_BATCH_SIZE:
+                self._flush_output()
+        else:
+            self._output.write(text + '\n')
+
+    def _flush_output(self):
+        if self._batch:
+            self._output.write('\n'.join(self._batch) + '\n')
+            self._batch = []
+
+    def run(self, f):
+        """ Run gcode file.
+        :param f: file object or any iterable with gcode lines.
+        :return: True if all lines were executed, False on error.
+        """
+        return self._run(self._read, f)
+
+    def run_parsed(self, parsed):
+        """ Run gcode lines which were parsed in advance.
+        :param parsed: iterable with GCode objects or None for empty lines,
+                       for example ParsedGCode object.
+        :return: True if all lines were executed, False on error.
+        """
+        return self._run(self._read_parsed, parsed)
+
+    def _run(self, read, source):
+        self._queue = queue.Queue(self.QUEUE_SIZE)
+        self._stop.clear()
+        reader = threading.Thread(target=read, args=(source,))
+        reader.daemon = True
+        reader.start()
+        success = True
+        try:
+            while True:
+                depth = self._queue.qsize()
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                self._depth_sum += depth
+                self._depth_samples += 1
+                wt = time.time()
+                item = self._queue.get()
+                st = time.time()
+                self.wait_time_s += st - wt
+                if item is None:
+                    self._machine.flush()
+                    self.execute_time_s += time.time() - st
+                    break
+                number, line, gcode, error = item
+                self.lines = number
+                if not self._quiet:
+                    if line is None:
+                        line = str(gcode) if gcode is not None else ''
+                    self._print('> ' + line)
+                try:
+                    if error is not None:
+                        raise error
+                    res = self._machine.do_command(gcode)
+                except (GCodeException, GMachineException) as e:
+                    self._print('ERROR line {}: {}'.format(number, e))
+                    success = False
+                    break
+                finally:
+                    self.execute_time_s += time.time() - st
+                if res is not None:
+                    self._print('OK ' + res)
+                elif not self._quiet:
+                    self._print('OK')
+        finally:
+            self._stop.set()
+            self._flush_output()
+            reader.join()
+        return success
+
+    def report(self):
+        """ Get statistics of the last run.
+        :return: string with statistics.
+        """
+        average = self._depth_sum / float(max(self._depth_samples, 1))
+        return ("{} lines, parse {:.3f}s, execute {:.3f}s, machine waited for "
+                "parser {:.3f}s, queue depth avg {:.1f} max {}"
+                .format(self.lines, self.parse_time_s, self.execute_time_s,
+                        self.wait_time_s, average, self.max_queue_depth))
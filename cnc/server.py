@@ -0,0 +1,160 @@
+""" Network server which accepts gcode on TCP and UNIX sockets. Each line is
+    answered with 'ok' or 'error', so clients can use answers for flow
+    control. Many clients can be connected at the same time, for example one
+    streams a job and others query status. Commands of all clients are run
+    one by one in a single machine thread, so the event loop is never blocked
+    by movements. Realtime commands, like '?' status or 'M112' emergency
+    stop, are answered right away, even if the same client has lines which
+    are waiting for machine thread. Python 3 is required.
+"""
+
+import os
+import asyncio
+import logging
+import concurrent.futures
+
+from cnc.config import *
+from cnc.gcode import GCode, GCodeException
+from cnc.gmachine import GMachineException
+
+
+class GCodeServer(object):
+    # number of lines which each client can send ahead
+    QUEUE_SIZE = 100
+
+    def __init__(self, machine):
+        """ Create server, call start_tcp() and start_unix() to listen.
+        :param machine: GMachine object, it is used from machine thread only.
+        """
+        self._machine = machine
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._servers = []
+        self.clients = 0
+
+    async def start_tcp(self, host, port):
+        """ Listen on TCP socket.
+        :param host: address to bind.
+        :param port: port number, zero for any free port.
+        :return: tuple (host, port) which is actually used.
+        """
+        server = await asyncio.start_server(self._client, host, port)
+        self._servers.append(server)
+        return server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        """ Listen on UNIX socket, stale socket file is removed.
+        :param path: path to socket file.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(self._client, path)
+        self._servers.append(server)
+
+    async def close(self):
+        """ Stop listening and wait for the current command.
+        """
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        self._executor.shutdown(wait=True)
+
+    def do_line(self, line):
+        """ Run gcode line on machine, it is called in machine thread.
+        :param line: string with gcode line.
+        :return: string with answer.
+        """
+        return self.__answer(lambda: self._machine.do_command(
+            GCode.parse_line(line)), line)
+
+    @staticmethod
+    def __answer(function, line):
+        try:
+            res = function()
+        except (GCodeException, GMachineException) as e:
+            return 'error ' + str(e)
+        except Exception as e:
+            logging.exception("Command '{}' failed".format(line))
+            return 'error ' + str(e)
+        if res is not None:
+            return 'ok ' + res
+        return 'ok'
+
+    async def execute(self, line):
+        """ Run gcode line in machine thread.
+        :param line: string with gcode line.
+        :return: string with answer.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, self.do_line, line)
+
+    @staticmethod
+    async def __write(writer, answer):
+        writer.write((answer + '\n').encode('utf-8'))
+        await writer.drain()
+
+    async def __run_lines(self, lines, writer):
+        # run lines of one client in order, answers are sent in the same
+        # order, answers are not sent anymore when client is disconnected
+        connected = True
+        while True:
+            line = await lines.get()
+            if line is None:
+                break
+            if not connected:
+                continue
+            answer = await self.execute(line)
+            try:
+                await self.__write(writer, answer)
+            except ConnectionError:
+                connected = False
+
+    async def _client(self, reader, writer):
+        self.clients += 1
+        lines = asyncio.Queue(self.QUEUE_SIZE)
+        runner = asyncio.ensure_future(self.__run_lines(lines, writer))
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode('utf-8', 'replace').strip()
+                command = self._machine.realtime_command(line)
+                if command is not None:
+                    # answered right away, ahead of waiting lines
+                    await self.__write(writer, self.__answer(
+                        lambda: self._machine.do_realtime(command), line))
+                else:
+                    await lines.put(line)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # client is gone, lines which are still waiting are dropped
+            while not lines.empty():
+                lines.get_nowait()
+            await lines.put(None)
+            await runner
+            self.clients -= 1
+            writer.close()
+
+
+def serve(machine, tcp=None, unix=None):
+    """ Run server until process is interrupted.
+    :param machine: GMachine object.
+    :param tcp: list of tuples (host, port) to listen.
+    :param unix: list of UNIX sockets paths to listen.
+    """
+    async def run():
+        server = GCodeServer(machine)
+        try:
+            for host, port in tcp or []:
+                address = await server.start_tcp(host, port)
+                print("Listening on {}:{}".format(*address))
+            for path in unix or []:
+                await server.start_unix(path)
+                print("Listening on {}".format(path))
+            while True:
+                await asyncio.sleep(3600)
+        finally:
+            await server.close()
+    asyncio.run(run())
@@ -0,0 +1,175 @@
+import os
+import unittest
+
+from cnc import hal
+from cnc import estimator
+from cnc.estimator import *
+from cnc.gmachine import GMachine
+from cnc.gcode import GCode
+from cnc.pulses import PulseGeneratorLinear
+
+
+@unittest.skipIf(estimator.numpy is None, "NumPy is not installed")
+class TestEstimator(unittest.TestCase):
+    def setUp(self):
+        self.e = Estimator(extruder_heating_c_per_s=2.0,
+                           bed_heating_c_per_s=1.0,
+                           ambient_temperature=20.0)
+
+    def tearDown(self):
+        pass
+
+    def __machine_time(self, lines):
+        # run lines on machine and sum time of generated movements
+        total = [0.0]
+        original = hal.move
+
+        def move(generator):
+            total[0] += generator.total_time_s()
+        hal.move = move
+        try:
+            m = GMachine()
+            for line in lines:
+                m.do_command(GCode.parse_line(line))
+            m.flush()
+            m.release()
+        finally:
+            hal.move = original
+        return total[0]
+
+    def test_single(self):
+        r = self.e.estimate_lines(["G1 X10 Y5 F1200"])
+        t = PulseGeneratorLinear(
+            Coordinates(10, 5, 0, 0), 1200,
+            acceleration_mm_per_s2=PRINT_ACCELERATION_MM_PER_S2
+        ).total_time_s()
+        self.assertAlmostEqual(r.total_time_s, t)
+        self.assertEqual(r.movements, 1)
+        self.assertEqual(list(r.commands_time_s.keys()), ["G1"])
+
+    def test_machine(self):
+        lines = ["G1 F3000", "G1 X10", "G1 X20 Y1", "G1 X20 Y30", "X21",
+                 "G0 Z5", "G91", "G1 X1 E1", "G1 X1 Y0.1 E1", "G20",
+                 "G1 X-0.5", "G21", "G90", "G92 X0", "G1 X2 Y5",
+                 "G2 X5 Y8 I3", "G3 X2 Y5 I-3", "M204 P500 T8000 R100",
+                 "G1 X10 Y20", "G1 E-2", "G0 X100 Z20", "M204 S700",
+                 "G1 X90 Y30", "G28"]
+        r = self.e.estimate_lines(lines)
+        self.assertAlmostEqual(r.total_time_s, self.__machine_time(lines),
+                               places=3)
+        self.assertEqual(set(r.commands_time_s.keys()),
+                         {"G0", "G1", "G2", "G3", "G28"})
+
+    def test_mixed(self):
+        # commands which don't wait for movements don't stop machine, and
+        # look-ahead is limited with planner window
+        lines = (["M104 S200", "M140 S60", "G1 F6000", "M106"]
+                 + ["G1 X{}".format(0.5 * i) for i in range(1, 41)]
+                 + ["M107", "G1 Y5", "G1 Y10 X25", "M114 R1", "G1 X30",
+                    "M114", "G1 X35", "M3 S100", "G1 Y20", "M5", "G1 Y25",
+                    "G4 P0", "G1 X40", "G2 X50 I5", "G1 X60", "M400",
+                    "G1 X70", "M104 S0", "M140 S0"])
+        r = self.e.estimate_lines(lines)
+        self.assertAlmostEqual(r.total_time_s, self.__machine_time(lines),
+                               places=3)
+
+    def test_s_curve(self):
+        # acceleration takes longer with S-curve, planner and estimation
+        # take it into account in the same way
+        lines = ["G1 F3000", "G1 X10", "G1 X20 Y1", "G1 X20 Y30", "G0 X100"]
+        trapezoid = self.e.estimate_lines(lines)
+        PulseGenerator.S_CURVE_JERK_RATIO = 0.5
+        try:
+            r = self.e.estimate_lines(lines)
+            self.assertAlmostEqual(r.total_time_s,
+                                   self.__machine_time(lines), places=3)
+        finally:
+            PulseGenerator.S_CURVE_JERK_RATIO = S_CURVE_JERK_RATIO
+        self.assertGreater(r.total_time_s, trapezoid.total_time_s)
+
+    def test_feed_only(self):
+        # line with just F changes velocity of the next movements
+        r = self.e.estimate_lines(["G1 X1 F100", "F1000", "G1 X11"])
+        self.assertAlmostEqual(r.total_time_s, self.__machine_time(
+            ["G1 X1 F100", "F1000", "G1 X11"]), places=3)
+        self.assertEqual(r.movements, 2)
+        self.assertEqual(self.e.estimate_lines(["F1000"]).total_time_s, 0.0)
+
+    def test_files(self):
+        # sample files which are shipped with repo
+        for name in ("rects.gcode", "circles.gcode"):
+            path = os.path.join(os.path.dirname(__file__), name)
+            with open(path) as f:
+                lines = f.readlines()
+            r = self.e.estimate_lines(lines)
+            self.assertGreater(r.total_time_s, 0.0)
+            self.assertAlmostEqual(r.total_time_s,
+                                   self.__machine_time(lines), places=2)
+
+    def test_acceleration(self):
+        slow = self.e.estimate_lines(["M204 P100", "G1 X10 F3000"])
+        fast = self.e.estimate_lines(["G1 X10 F3000"])
+        self.assertGreater(slow.total_time_s, fast.total_time_s)
+        # Z is limited with its own acceleration
+        travel = self.e.estimate_lines(["M204 T100000", "G0 Z10"])
+        limited = self.e.estimate_lines(["M204 T{}".format(
+            MAX_ACCELERATION_MM_PER_S2_Z), "G0 Z10"])
+        self.assertAlmostEqual(travel.total_time_s, limited.total_time_s)
+        self.assertRaises(GMachineException, self.e.estimate_lines,
+                          ["M204 P0"])
+
+    def test_dwell(self):
+        r = self.e.estimate_lines(["G4 P1.5", "G4 P0.5", "M105", "M3 S100"])
+        self.assertEqual(r.total_time_s, 2.0)
+        self.assertEqual(r.commands_time_s, {"G4": 2.0})
+        self.assertRaises(GMachineException, self.e.estimate_lines, ["G4"])
+
+    def test_heaters(self):
+        # wait from ambient temperature
+        r = self.e.estimate_lines(["M109 S200"])
+        self.assertAlmostEqual(r.commands_time_s["M109"], 90.0)
+        # bed is heated while extruder is heating
+        r = self.e.estimate_lines(["M140 S60", "M109 S200", "M190 S60"])
+        self.assertAlmostEqual(r.commands_time_s["M109"], 90.0)
+        self.assertEqual(r.commands_time_s["M190"], 0.0)
+        # cooling
+        r = self.e.estimate_lines(["M109 S200", "M109 S190"])
+        self.assertAlmostEqual(r.total_time_s,
+                               90.0 + 10.0 / ESTIMATOR_COOLING_C_PER_S)
+        # turning off doesn't wait
+        r = self.e.estimate_lines(["M109 S200", "M109 S0"])
+        self.assertAlmostEqual(r.total_time_s, 90.0)
+        self.assertRaises(GMachineException, self.e.estimate_lines,
+                          ["M109 S1000"])
+
+    def test_bounding_box(self):
+        r = self.e.estimate_lines(["G1 X10 Y10 F1000", "G1 X20 Z3",
+                                   "G2 X30 Y10 I5"])
+        lo, hi = r.bounding_box
+        self.assertEqual((lo.x, lo.y, lo.z), (0, 0, 0))
+        self.assertEqual((hi.x, hi.y, hi.z), (30, 15, 3))
+
+    def test_filament(self):
+        r = self.e.estimate_lines(["G1 X1 E5 F1000", "G1 X2 E3", "G1 X3 E8",
+                                   "G92 E0", "G1 X4 E2"])
+        self.assertAlmostEqual(r.filament_mm, 10.0)
+        self.assertIn("Filament: 10.0 mm", r.report())
+
+    def test_errors(self):
+        with self.assertRaises(GMachineException) as e:
+            self.e.estimate_lines(["G1 X1 F100", "G1 X-1"])
+        self.assertTrue(str(e.exception).startswith("line 2:"))
+        self.assertRaises(GMachineException, self.e.estimate_lines,
+                          ["G1 X1 F0"])
+        self.assertRaises(GMachineException, self.e.estimate_lines,
+                          ["M999"])
+
+    def test_report(self):
+        r = self.e.estimate_lines(["G4 P3725", "G1 X1 F100", ""])
+        report = r.report()
+        self.assertTrue(report.startswith("Total time: 1:02:"))
+        self.assertIn("Lines: 3, movements: 1", report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,6 +120,46 @@ class TestGCode(unittest.TestCase):
         self.assertRaises(GCodeException, GCode.parse_line, "G1M1")
         self.assertRaises(GCodeException, GCode.parse_line, "x 1 y 1 z 1 X 1")
 
+    def test_numbers(self):
+        # numbers are validated while parsing
+        self.assertRaises(GCodeException, GCode.parse_line, "X1.2.3")
+        self.assertRaises(GCodeException, GCode.parse_line, "X(comment")
+        self.assertRaises(GCodeException, GCode.parse_line, "G1 X.5 M")
+        gc = GCode.parse_line("X .5 Y+2")
+        self.assertEqual(gc.get('Y'), 2.0)
+
+    def test_slots(self):
+        gc = GCode.parse_line("G01X.5 y-2")
+        self.assertEqual(gc.command(), "G1")
+        self.assertEqual(gc.mask, (1 << SLOTS['G']) | (1 << SLOTS['X'])
+                         | (1 << SLOTS['Y']))
+        self.assertEqual(gc.values[SLOTS['X']], 0.5)
+        self.assertEqual(gc.values[SLOTS['Y']], -2.0)
+        self.assertEqual(gc.params, {"G": 1.0, "X": 0.5, "Y": -2.0})
+        self.assertEqual(GCode.parse_line("G92.1").command(), "G92.1")
+        self.assertIsNone(GCode.parse_line("%"))
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_parse_lines(self):
+        a = GCode.parse_lines(["G1 X1 Y-2 F100", "; comment", "m104 s200",
+                               "X5 I.5"])
+        self.assertEqual(len(a), 4)
+        self.assertEqual(list(a['command']),
+                         [command_code('G1'), 0, command_code('M104'), 0])
+        self.assertEqual(a['X'][0], 1.0)
+        self.assertEqual(a['Y'][0], -2.0)
+        self.assertEqual(a['F'][0], 100.0)
+        self.assertTrue(numpy.isnan(a['Z'][0]))
+        self.assertTrue(numpy.isnan(a['X'][1]))
+        self.assertEqual(a['S'][2], 200.0)
+        self.assertEqual(a['X'][3], 5.0)
+        self.assertEqual(a['I'][3], 0.5)
+        self.assertEqual(a['flags'][0], GCode.parse_line("G1X1Y-2F100").mask)
+        self.assertEqual(a['flags'][1], 0)
+        with self.assertRaises(GCodeException) as e:
+            GCode.parse_lines(["G1", "G1", "X1X1"])
+        self.assertTrue(str(e.exception).startswith("line 3:"))
+
     def test_comments(self):
         self.assertIsNone(GCode.parse_line("; some text"))
         self.assertIsNone(GCode.parse_line("    \t   \t ; some text"))
@@ -291,6 +291,87 @@ class TestGMachine(unittest.TestCase):
         self.assertRaises(GMachineException, m.do_command,
                           GCode.parse_line("M190"))
 
+    def test_m114(self):
+        m = GMachine()
+        m.do_command(GCode.parse_line("G1 X1 Y2 F1000"))
+        self.assertEqual(m.do_command(GCode.parse_line("M114")),
+                         "X:1.0 Y:2.0 Z:0.0 E:0.0")
+        # position of motors doesn't wait for movements in planner
+        m.do_command(GCode.parse_line("G1 X2"))
+        self.assertEqual(m.do_command(GCode.parse_line("M114 R1")),
+                         "X:1.0 Y:2.0 Z:0.0 E:0.0")
+        self.assertEqual(m.do_command(GCode.parse_line("M114")),
+                         "X:2.0 Y:2.0 Z:0.0 E:0.0")
+        self.assertEqual(m.current_position(), Coordinates(2, 2, 0, 0))
+
+    def test_m204(self):
+        m = GMachine()
+        self.assertEqual(m.do_command(GCode.parse_line("M204")),
+                         "P:{} R:{} T:{}".format(
+                             PRINT_ACCELERATION_MM_PER_S2,
+                             RETRACT_ACCELERATION_MM_PER_S2,
+                             TRAVEL_ACCELERATION_MM_PER_S2))
+        m.do_command(GCode.parse_line("M204 S500 R200"))
+        self.assertEqual(m.do_command(GCode.parse_line("M204")),
+                         "P:500.0 R:200.0 T:500.0")
+        m.do_command(GCode.parse_line("M204 P100 T1000"))
+        self.assertEqual(m.do_command(GCode.parse_line("M204")),
+                         "P:100.0 R:200.0 T:1000.0")
+        self.assertRaises(GMachineException,
+                          m.do_command, GCode.parse_line("M204 P0"))
+        # print, travel and retract movements use their accelerations
+        moves = []
+        m._planner.add = lambda delta, velocity, acceleration: \
+            moves.append(acceleration)
+        m.do_command(GCode.parse_line("G1 X1 E1"))
+        m.do_command(GCode.parse_line("G0 Y1"))
+        m.do_command(GCode.parse_line("G1 E0"))
+        self.assertEqual(moves, [100, 1000, 200])
+        del m._planner.add
+        m.do_command(GCode.parse_line("M2"))
+        self.assertEqual(m.do_command(GCode.parse_line("M204")),
+                         "P:{} R:{} T:{}".format(
+                             PRINT_ACCELERATION_MM_PER_S2,
+                             RETRACT_ACCELERATION_MM_PER_S2,
+                             TRAVEL_ACCELERATION_MM_PER_S2))
+
+    def test_register_command(self):
+        class Machine(GMachine):
+            pass
+
+        def m42(machine, gcode, velocity):
+            return "P:{} F:{}".format(gcode.get('P'), velocity)
+        Machine.register_command('M42', m42)
+        m = Machine()
+        self.assertEqual(m.do_command(GCode.parse_line("M42 P3 F100")),
+                         "P:3.0 F:100.0")
+        m.do_command(GCode.parse_line("G1 X1"))
+        self.assertEqual(m.position(), Coordinates(1, 0, 0, 0))
+        # base class is not changed
+        self.assertRaises(GMachineException, GMachine().do_command,
+                          GCode.parse_line("M42"))
+
+    def test_realtime(self):
+        m = GMachine()
+        self.assertEqual(m.realtime_command(" ? "), "?")
+        self.assertEqual(m.realtime_command("m105 ; temperature"), "M105")
+        self.assertIsNone(m.realtime_command("G1 X1"))
+        m.do_command(GCode.parse_line("G1 X1 Y2 F1000"))
+        m.flush()
+        self.assertEqual(m.do_realtime("?"),
+                         "<Idle|MPos:1.000,2.000,0.000,0.000|Q:0>")
+        self.assertTrue(m.do_realtime("M105").startswith("E:"))
+        m.do_realtime("!")
+        self.assertTrue(m.do_realtime("?").startswith("<Hold|"))
+        m.do_realtime("~")
+        self.assertTrue(m.do_realtime("?").startswith("<Idle|"))
+        self.assertRaises(GMachineException, m.do_realtime, "M114")
+        # machine doesn't work after emergency stop
+        m.do_realtime("M112")
+        self.assertTrue(m.do_realtime("?").startswith("<Alarm|"))
+        self.assertRaises(GMachineException, m.do_command,
+                          GCode.parse_line("G1 X2"))
+
 
 if __name__ == '__main__':
     unittest.main()
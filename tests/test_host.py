@@ -0,0 +1,138 @@
+import os
+import threading
+import unittest
+
+from cnc.host import *
+from cnc.gmachine import GMachine
+
+
+def frame(number, line):
+    line = "N{} {}".format(number, line)
+    return "{}*{}".format(line, checksum(line))
+
+
+class TestHostProtocol(unittest.TestCase):
+    def setUp(self):
+        self.p = HostProtocol()
+
+    def tearDown(self):
+        pass
+
+    def test_checksum(self):
+        self.assertEqual(checksum("N3 T0"), 57)
+        gcode, answers = self.p.receive(frame(1, "G1 X1"))
+        self.assertEqual(gcode.command(), "G1")
+        self.assertEqual(gcode.get('X'), 1.0)
+        self.assertEqual(answers, [])
+        self.assertEqual(self.p.last_line, 1)
+        # broken line is requested again
+        line = frame(2, "G1 X2").replace("X2", "X3")
+        self.assertEqual(self.p.receive(line),
+                         (None, ["Error:checksum mismatch, Last Line: 1",
+                                 "Resend: 2"]))
+        self.assertEqual(self.p.receive("N2 G1 X2")[1][1], "Resend: 2")
+        self.assertEqual(self.p.receive("N2 G1 X2*a")[1][1], "Resend: 2")
+        self.assertEqual(self.p.receive(frame(2, "G1 X2"))[1], [])
+
+    def test_line_numbers(self):
+        self.assertEqual(self.p.receive(frame(1, "G1 X1"))[1], [])
+        # lost line
+        self.assertEqual(self.p.receive(frame(3, "G1 X3"))[1][1],
+                         "Resend: 2")
+        self.assertEqual(self.p.last_line, 1)
+        self.assertEqual(self.p.receive(frame(2, "G1 X2"))[1], [])
+        # line numbers are reset
+        self.assertEqual(self.p.receive(frame(100, "M110")),
+                         (None, []))
+        self.assertEqual(self.p.last_line, 100)
+        self.p.receive("M110 N7")
+        self.assertEqual(self.p.last_line, 7)
+        self.assertEqual(self.p.receive(frame(8, "M114"))[0].command(),
+                         "M114")
+
+    def test_unframed(self):
+        self.assertEqual(self.p.receive("G1 X1")[0].command(), "G1")
+        self.assertEqual(self.p.receive("; comment"), (None, []))
+        self.assertEqual(self.p.last_line, 0)
+
+    def test_errors(self):
+        gcode, answers = self.p.receive(frame(1, "G1 X1X2"))
+        self.assertIsNone(gcode)
+        self.assertTrue(answers[0].startswith("Error:"))
+        # line is received correctly, so it isn't requested again
+        self.assertEqual(self.p.last_line, 1)
+
+
+class TestSerialHost(unittest.TestCase):
+    def setUp(self):
+        self.master, self.slave, _ = open_pty()
+        self.machine = GMachine()
+        self.host = SerialHost(self.machine, self.master)
+        self.thread = threading.Thread(target=self.host.run)
+        self.thread.daemon = True
+        self.thread.start()
+        self.received = b''
+
+    def tearDown(self):
+        os.close(self.slave)
+        self.thread.join(5)
+        os.close(self.master)
+
+    def __read_lines(self, count):
+        while self.received.count(b'\n') < count:
+            self.received += os.read(self.slave, 4096)
+        lines = self.received.split(b'\n')
+        self.received = b'\n'.join(lines[count:])
+        return list(line.decode('utf-8') for line in lines[:count])
+
+    def test_stream(self):
+        lines = ["G91", "G1 X1 F1000", "G1 X1", "G1 X1", "M114"]
+        data = ''.join(frame(i, line) + '\n'
+                       for i, line in enumerate(lines, 1))
+        # host sends lines ahead without waiting for answers
+        os.write(self.slave, data.encode('utf-8'))
+        answers = self.__read_lines(len(lines) + 1)
+        self.assertEqual(answers.count("ok"), len(lines))
+        self.assertIn("X:3.0 Y:0.0 Z:0.0 E:0.0", answers)
+        os.write(self.slave, (frame(7, "G1 X1") + '\n').encode('utf-8'))
+        self.assertEqual(self.__read_lines(3),
+                         ["Error:Line Number is not Last Line Number+1, "
+                          "Last Line: 5", "Resend: 6", "ok"])
+
+    def test_realtime(self):
+        # realtime character is taken from the middle of line
+        os.write(self.slave, b"G1 X1?")
+        self.assertTrue(self.__read_lines(1)[0].startswith("<"))
+        os.write(self.slave, b" F1000\n")
+        self.assertEqual(self.__read_lines(1), ["ok"])
+        os.write(self.slave, (frame(1, "M105") + '\n').encode('utf-8'))
+        answers = self.__read_lines(2)
+        self.assertTrue(answers[0].startswith("E:"))
+        self.assertEqual(answers[1], "ok")
+
+    def test_realtime_comment(self):
+        # realtime characters inside comments are kept
+        os.write(self.slave, b"G91 (stop!) ; hold!\n")
+        self.assertEqual(self.__read_lines(1), ["ok"])
+        os.write(self.slave, b"?")
+        self.assertTrue(self.__read_lines(1)[0].startswith("<Idle"))
+
+    def test_realtime_framed(self):
+        # framed line is passed unchanged, so checksum matches
+        os.write(self.slave, (frame(1, "G91 (stop!)") + '\n').encode('utf-8'))
+        self.assertEqual(self.__read_lines(1), ["ok"])
+        self.assertEqual(self.host._protocol.last_line, 1)
+        # lower case and leading whitespace are allowed too, '?' is kept in
+        # line, so it is received correctly and reported as bad gcode
+        line = "n2 G91 ?"
+        os.write(self.slave, "  {}*{}\n".format(
+            line, checksum(line)).encode('utf-8'))
+        self.assertEqual(self.__read_lines(2),
+                         ["Error:extra characters in line", "ok"])
+        self.assertEqual(self.host._protocol.last_line, 2)
+        os.write(self.slave, b"?")
+        self.assertTrue(self.__read_lines(1)[0].startswith("<Idle"))
+
+
+if __name__ == '__main__':
+    unittest.main()
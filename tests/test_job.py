@@ -0,0 +1,108 @@
+import io
+import os
+import tempfile
+import unittest
+
+from cnc.job import *
+from cnc.config import *
+# other tests should keep using virtual hal, so import it before simulator
+from cnc import hal
+os.environ["PYCNC_RPGPIO_SIMULATOR"] = "instant"
+try:
+    from cnc.hal_raspberry import rpgpio
+    from cnc.hal_raspberry import rpgpio_simulator
+    from cnc.hal_raspberry import hal as raspberry_hal
+finally:
+    del os.environ["PYCNC_RPGPIO_SIMULATOR"]
+
+GCODE = u"G21\nG90\nG1 X2 F1000\nM3 S1000\nG4 P0.01\nG1 X0 Y1\nM5\n"
+HAL_FUNCTIONS = ('init', 'spindle_control', 'fan_control', 'disable_steppers',
+                 'calibrate', 'move', 'move_control_blocks', 'join', 'deinit',
+                 'watchdog_feed')
+
+
+class TestJob(unittest.TestCase):
+    def setUp(self):
+        self.engine = rpgpio_simulator.engine
+        self.engine.set_speed(rpgpio_simulator.INSTANT_SPEED)
+        self.engine.gpio_trace = []
+
+    def tearDown(self):
+        raspberry_hal.join()
+        self.engine.gpio_trace = None
+
+    def __pulses(self, pins_mask):
+        return len(list(c for c, _, set_mask, _ in self.engine.gpio_trace
+                        if c == rpgpio.DMAGPIO._DMA_CHANNEL
+                        and set_mask & pins_mask))
+
+    def __compile(self):
+        job = io.BytesIO()
+        compile_job(io.StringIO(GCODE), job)
+        return job.getvalue()
+
+    def test_compile(self):
+        records = list(read_records(self.__compile()))
+        types = list(t for t, _ in records)
+        self.assertEqual(types[0], RECORD_CONTROL_BLOCKS)
+        self.assertEqual(types[-1], RECORD_HAL_CALL)
+        self.assertIn(RECORD_GCODE, types)
+        for t, payload in records:
+            if t == RECORD_CONTROL_BLOCKS:
+                self.assertEqual(len(payload) % 32, 0)
+            elif t == RECORD_GCODE:
+                self.assertEqual(payload, b"G4 P0.01")
+        # spindle is changed after movement is done
+        calls = list(json.loads(p.decode('utf-8')) for t, p in records
+                     if t == RECORD_HAL_CALL)
+        self.assertEqual(calls, [["join"], ["spindle_control", 10.0],
+                                 ["join"], ["spindle_control", 0.0]])
+        # nothing is rendered to real hal while compiling
+        self.assertEqual(self.__pulses(0xffffffff), 0)
+
+    def test_wrong_file(self):
+        self.assertRaises(JobException, list, read_records(b"GCODE"))
+        job = self.__compile()
+        self.assertRaises(JobException, list, read_records(job[:-1]))
+
+    def __run(self, job):
+        f = tempfile.NamedTemporaryFile(suffix='.pcj')
+        f.write(job)
+        f.flush()
+        saved = dict((name, getattr(hal, name, None))
+                     for name in HAL_FUNCTIONS)
+        for name in HAL_FUNCTIONS:
+            setattr(hal, name, getattr(raspberry_hal, name))
+        try:
+            machine = GMachine()
+            run_job(f, machine)
+        finally:
+            for name in HAL_FUNCTIONS:
+                if saved[name] is None:
+                    delattr(hal, name)
+                else:
+                    setattr(hal, name, saved[name])
+            f.close()
+
+    def test_run(self):
+        self.__run(self.__compile())
+        self.assertEqual(self.__pulses(raspberry_hal.STEP_PIN_MASK_X),
+                         2 * 2 * STEPPER_PULSES_PER_MM_X)
+        self.assertEqual(self.__pulses(raspberry_hal.STEP_PIN_MASK_Y),
+                         STEPPER_PULSES_PER_MM_Y)
+
+    def test_ticks(self):
+        # job which is compiled with other timing isn't run
+        self.assertEqual(read_header(self.__compile()), STEPPER_TICKS_PER_US)
+        job = io.BytesIO()
+        writer = JobWriter(job, STEPPER_TICKS_PER_US * 2)
+        writer.add_hal_call("spindle_control", 10.0)
+        self.assertRaises(JobException, self.__run, job.getvalue())
+
+    def test_virtual_hal(self):
+        with tempfile.TemporaryFile() as f:
+            self.assertRaises(JobException, run_job, f, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from cnc import hal
+from cnc.motion import *
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+
+
+class TestMotionQueue(unittest.TestCase):
+    def setUp(self):
+        self.moves = []
+        self.release = threading.Event()
+        self._move = hal.move
+
+        def move(generator):
+            self.release.wait(5)
+            if generator == "fail":
+                raise IOError("failed")
+            self.moves.append(generator)
+        hal.move = move
+
+    def tearDown(self):
+        self.release.set()
+        hal.move = self._move
+
+    def test_async(self):
+        q = MotionQueue(3)
+        for i in range(0, 3):
+            q.put(i)
+        # put() returns while movements are not done yet
+        self.assertEqual(self.moves, [])
+        self.release.set()
+        q.join()
+        self.assertEqual(self.moves, [0, 1, 2])
+        self.assertEqual(q.depth(), 0)
+        q.stop()
+
+    def test_sync(self):
+        self.release.set()
+        q = MotionQueue(0)
+        q.put(1)
+        self.assertEqual(self.moves, [1])
+        q.join()
+
+    def test_error(self):
+        self.release.set()
+        q = MotionQueue(3)
+        q.put(1)
+        q.put("fail")
+        q.put(2)
+        self.assertRaises(IOError, q.join)
+        # error is raised once, movements after it are dropped
+        q.put(3)
+        q.join()
+        self.assertEqual(self.moves, [1, 3])
+        q.stop()
+
+    def test_hold(self):
+        self.release.set()
+        q = MotionQueue(3)
+        q.hold()
+        self.assertTrue(q.is_held())
+        q.put(1)
+        q.put(2)
+        self.assertEqual(self.moves, [])
+        q.resume()
+        q.join()
+        self.assertEqual(self.moves, [1, 2])
+        # queued and new movements are dropped after abort
+        q.hold()
+        q.put(3)
+        q.abort()
+        q.put(4)
+        q.join()
+        self.assertEqual(self.moves, [1, 2])
+        q.stop()
+
+    def test_machine(self):
+        m = GMachine(motion_queue_size=10)
+        m.do_command(GCode.parse_line("G1 X1 F1000"))
+        m.do_command(GCode.parse_line("G2 X3 Y0 I1"))
+        self.assertEqual(self.moves, [])
+        self.release.set()
+        m.do_command(GCode.parse_line("M400"))
+        self.assertEqual(len(self.moves), 2)
+        self.assertEqual(m.do_command(GCode.parse_line("M114")),
+                         "X:3.0 Y:0.0 Z:0.0 E:0.0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+
+from cnc import hal
+from cnc.planner import *
+from cnc.config import *
+from cnc.coordinates import *
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self._generators = []
+        self._hal_move = hal.move
+        hal.move = self.__move
+
+    def tearDown(self):
+        hal.move = self._hal_move
+
+    def __move(self, generator):
+        # still check pulses with virtual hal
+        self._hal_move(generator)
+        self._generators.append(generator)
+
+    def test_flush(self):
+        # movements are buffered until flush
+        p = Planner()
+        p.add(Coordinates(1, 0, 0, 0), 1000)
+        p.add(Coordinates(1, 0, 0, 0), 1000)
+        self.assertEqual(len(self._generators), 0)
+        self.assertFalse(p.is_empty())
+        p.flush()
+        self.assertTrue(p.is_empty())
+        self.assertEqual(len(self._generators), 2)
+
+    def test_lookahead_size(self):
+        p = Planner()
+        p.LOOKAHEAD_MOVES = 2
+        for _ in range(0, 5):
+            p.add(Coordinates(1, 0, 0, 0), 1000)
+        self.assertEqual(len(self._generators), 3)
+        p.flush()
+        self.assertEqual(len(self._generators), 5)
+        p.LOOKAHEAD_MOVES = 0
+        p.add(Coordinates(1, 0, 0, 0), 1000)
+        self.assertEqual(len(self._generators), 6)
+
+    def test_junction_velocities(self):
+        p = Planner()
+        p.add(Coordinates(10, 0, 0, 0), 1000)
+        p.add(Coordinates(10, 0, 0, 0), 1000)  # the same direction
+        p.add(Coordinates(0, 10, 0, 0), 1000)  # corner
+        p.add(Coordinates(0, -10, 0, 0), 1000)  # reverse
+        p.flush()
+        g = self._generators
+        self.assertEqual(g[0]._entry_velocity_mm_per_sec, 0)
+        self.assertAlmostEqual(g[0]._exit_velocity_mm_per_sec,
+                               1000 / SECONDS_IN_MINUTE)
+        self.assertAlmostEqual(g[1]._entry_velocity_mm_per_sec,
+                               1000 / SECONDS_IN_MINUTE)
+        self.assertGreater(g[1]._exit_velocity_mm_per_sec, 0)
+        self.assertLess(g[1]._exit_velocity_mm_per_sec,
+                        1000 / SECONDS_IN_MINUTE)
+        self.assertEqual(g[2]._exit_velocity_mm_per_sec, 0)
+        self.assertEqual(g[3]._entry_velocity_mm_per_sec, 0)
+        self.assertEqual(g[3]._exit_velocity_mm_per_sec, 0)
+
+    def test_faster_than_stops(self):
+        # short segments should be passed faster than with full stops
+        p = Planner()
+        for _ in range(0, 10):
+            p.add(Coordinates(0.5, 0.5, 0, 0), 6000)
+        p.flush()
+        planned = sum(g.total_time_s() for g in self._generators)
+        single = PulseGeneratorLinear(Coordinates(0.5, 0.5, 0, 0), 6000)
+        self.assertLess(planned, 10 * single.total_time_s())
+        full = PulseGeneratorLinear(Coordinates(5, 5, 0, 0), 6000)
+        self.assertAlmostEqual(planned, full.total_time_s())
+
+    def test_accelerated_time(self):
+        # pulses should keep going without pauses or doubles on junctions
+        p = Planner()
+        for _ in range(0, 3):
+            p.add(Coordinates(1, 0, 0, 0), 1000)
+        p.flush()
+        times = []
+        offset = 0
+        for g in self._generators:
+            for direction, px, py, pz, pe in g:
+                if direction:
+                    continue
+                times.append(offset + px)
+            self.assertLessEqual(times[-1] - offset, g.total_time_s())
+            offset += g.total_time_s()
+        delays = list(b - a for a, b in zip(times[:-1], times[1:]))
+        self.assertEqual(len(times), 3 * STEPPER_PULSES_PER_MM_X)
+        for i in range(1, len(delays)):
+            self.assertGreater(delays[i], 0)
+        step = 60.0 / 1000 / STEPPER_PULSES_PER_MM_X
+        middle = len(delays) // 2
+        self.assertAlmostEqual(delays[middle], step)
+        self.assertAlmostEqual(delays[middle - len(delays) // 6], step)
+        self.assertAlmostEqual(delays[middle + len(delays) // 6], step)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cnc import gcode
+from cnc import preparse
+from cnc.preparse import *
+
+
+class TestPreparse(unittest.TestCase):
+    def setUp(self):
+        self._min_range_size = preparse.MIN_RANGE_SIZE
+        preparse.MIN_RANGE_SIZE = 16
+        self._dir = tempfile.mkdtemp()
+        self.path = os.path.join(self._dir, "test.gcode")
+
+    def tearDown(self):
+        preparse.MIN_RANGE_SIZE = self._min_range_size
+        shutil.rmtree(self._dir)
+
+    def __write(self, lines):
+        with open(self.path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def test_split(self):
+        self.__write(["G1 X{}".format(i) for i in range(0, 100)])
+        ranges = split_file(self.path, 7)
+        self.assertEqual(len(ranges), 7)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for begin, end in ranges:
+            self.assertEqual(data[end - 1:end], b'\n')
+        for a, b in zip(ranges[:-1], ranges[1:]):
+            self.assertEqual(a[1], b[0])
+
+    def test_order(self):
+        lines = ["G1 X{} Y-{} F1800".format(i, i) if i % 3 else "; comment"
+                 for i in range(0, 500)]
+        self.__write(lines)
+        parsed = preparse_file(self.path, 4)
+        self.assertEqual(len(parsed), len(lines))
+        for line, gcode in zip(lines, parsed):
+            expected = GCode.parse_line(line)
+            if expected is None:
+                self.assertIsNone(gcode)
+            else:
+                self.assertEqual(gcode.params, expected.params)
+                self.assertEqual(gcode.command(), "G1")
+
+    @unittest.skipIf(gcode.numpy is None, "NumPy is not installed")
+    def test_to_array(self):
+        lines = ["G1 X{} E{}".format(i, i * 0.1) if i % 3 else "M105"
+                 for i in range(0, 300)]
+        self.__write(lines)
+        a = preparse_file(self.path, 4).to_array()
+        expected = GCode.parse_lines(lines)
+        self.assertEqual(list(a['command']), list(expected['command']))
+        self.assertEqual(list(a['flags']), list(expected['flags']))
+        self.assertEqual(list(a['E'][1:3]), [0.1, 0.2])
+
+    def test_error_line(self):
+        lines = ["G1 X1"] * 300
+        lines[257] = "G1 X1X2"
+        self.__write(lines)
+        with self.assertRaises(GCodeException) as e:
+            preparse_file(self.path, 4)
+        self.assertTrue(str(e.exception).startswith("line 258:"))
+
+    def test_empty(self):
+        self.__write([])
+        self.assertEqual(len(preparse_file(self.path, 4)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
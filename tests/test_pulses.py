@@ -1,5 +1,6 @@
 import unittest
 
+import cnc.pulses
 from cnc.pulses import *
 from cnc.config import *
 from cnc.coordinates import *
@@ -265,6 +266,42 @@ class TestPulses(unittest.TestCase):
         self.assertGreater(at, lt)
         self.assertGreater(bt, lt)
 
+    def test_axis_acceleration(self):
+        # Each axis is limited with its own acceleration, desired acceleration
+        # along the path can be only lower.
+        self.assertEqual(path_acceleration(Coordinates(0, 0, 1, 0)),
+                         MAX_ACCELERATION_MM_PER_S2_Z)
+        self.assertEqual(path_acceleration(Coordinates(1, 0, 0, 0), 100), 100)
+        self.assertEqual(path_acceleration(Coordinates(0, 0, 1, 0), 1e6),
+                         MAX_ACCELERATION_MM_PER_S2_Z)
+        self.assertAlmostEqual(path_acceleration(Coordinates(0.6, 0, 0.8, 0)),
+                               MAX_ACCELERATION_MM_PER_S2_Z / 0.8)
+        x = PulseGeneratorLinear(Coordinates(10, 0, 0, 0), self.v)
+        z = PulseGeneratorLinear(Coordinates(0, 0, 10, 0), self.v)
+        v = self.v / 60.0
+        self.assertAlmostEqual(x.total_time_s(),
+                               10 / v + v / MAX_ACCELERATION_MM_PER_S2_X)
+        self.assertAlmostEqual(z.total_time_s(),
+                               10 / v + v / MAX_ACCELERATION_MM_PER_S2_Z)
+        slow = PulseGeneratorLinear(Coordinates(10, 0, 0, 0), self.v,
+                                    acceleration_mm_per_s2=100)
+        self.assertAlmostEqual(slow.total_time_s(), 10 / v + v / 100)
+        # arc is slower in plane with axis which has lower limit
+        limit = cnc.pulses.MAX_ACCELERATION_MM_PER_S2_Z
+        cnc.pulses.MAX_ACCELERATION_MM_PER_S2_Z = \
+            MAX_ACCELERATION_MM_PER_S2_X / 3.0
+        try:
+            c = PulseGeneratorCircular(Coordinates(0, 0, 0, 0),
+                                       Coordinates(0, 5, 0, 0), PLANE_YZ, CW,
+                                       self.v)
+            self.assertGreater(c.total_time_s(),
+                               PulseGeneratorCircular(
+                                   Coordinates(0, 0, 0, 0),
+                                   Coordinates(5, 0, 0, 0), PLANE_XY, CW,
+                                   self.v).total_time_s())
+        finally:
+            cnc.pulses.MAX_ACCELERATION_MM_PER_S2_Z = limit
+
     def test_directions(self):
         # Check if directions are set up correctly.
         m = Coordinates(1, -2, 3, -4)
@@ -309,6 +346,241 @@ class TestPulses(unittest.TestCase):
                                                PLANE_ZX, CCW)
         self.assertEqual(dir_changed, 4)
 
+    def __check_batch(self, g):
+        self.assertEqual(list(g), list(g.batch_pulses()))
+        directions, times, masks = g.batch()
+        self.assertEqual(len(times), len(masks))
+        self.assertEqual(directions[0][0], 0)
+
+    def __check_batch_approximately(self, g):
+        # arc angles and S-curve times are calculated with NumPy functions
+        # which can differ in the last digits, so times are compared
+        # approximately.
+        directions, times, masks = g.batch()
+        numpy = cnc.pulses.numpy
+        cnc.pulses.numpy = None
+        try:
+            directions_i, times_i, masks_i = g.batch()
+        finally:
+            cnc.pulses.numpy = numpy
+        self.assertEqual(directions, directions_i)
+        self.assertEqual(list(masks), list(masks_i))
+        self.assertEqual(len(times), len(times_i))
+        for t, t_i in zip(times, times_i):
+            self.assertAlmostEqual(t, t_i, places=12)
+
+    def test_batch(self):
+        # Check if batch calculation returns the same pulses as iterator does.
+        for delta, entry, exit in ((Coordinates(1, 0, 0, 0), 0, 0),
+                                   (Coordinates(2, 4, 0, 0), 0, 0),
+                                   (Coordinates(1, -2, 3, -4), 0, 0),
+                                   (Coordinates(0.01, 0, 0, 0), 0, 0),
+                                   (Coordinates(10, 3, 0, 1), 300, 100),
+                                   (Coordinates(-7, 3, 0.5, 1), 0, 400)):
+            g = PulseGeneratorLinear(delta, self.v, entry, exit)
+            self.__check_batch(g)
+            numpy = cnc.pulses.numpy
+            cnc.pulses.numpy = None
+            try:
+                self.__check_batch(g)
+            finally:
+                cnc.pulses.numpy = numpy
+
+    def test_batch_circular(self):
+        # Check if batch calculation for circles has the same pulses and
+        # directions changes as iterator.
+        for delta, radius, plane, direction in (
+                (Coordinates(0, 20, 0, 0), Coordinates(-10, 10, 0, 0),
+                 PLANE_XY, CW),
+                (Coordinates(-4, -4, 0, 0), Coordinates(-2, -2, 0, 0),
+                 PLANE_XY, CW),
+                (Coordinates(0, 8, 0, 7), Coordinates(1, 0, 1, 0),
+                 PLANE_ZX, CCW),
+                (Coordinates(5, 0, 0, 6), Coordinates(0, 1, -1, 0),
+                 PLANE_YZ, CW),
+                (Coordinates(-2, -2, 3, 2), Coordinates(-1, -1, 0, 0),
+                 PLANE_XY, CCW),
+                (Coordinates(0, 0, 0, 0), Coordinates(1.0, 1.0, 0, 0),
+                 PLANE_ZX, CCW),
+                (Coordinates(0, 0, 0, 0),
+                 Coordinates(-1.0 / STEPPER_PULSES_PER_MM_X, 0, 0, 0),
+                 PLANE_XY, CCW)):
+            g = PulseGeneratorCircular(delta, radius, plane, direction,
+                                       self.v)
+            self.__check_batch_approximately(g)
+
+    def test_s_curve(self):
+        # S-curve makes acceleration and braking longer, but starts smoothly,
+        # and pseudo time is translated in both directions exactly.
+        trapezoid = PulseGeneratorLinear(Coordinates(20, 5, 0, 0), self.v)
+        _, times, _ = trapezoid.batch()
+        PulseGenerator.S_CURVE_JERK_RATIO = 0.5
+        try:
+            g = PulseGeneratorLinear(Coordinates(20, 5, 0, 0), self.v)
+            self.__check_batch_approximately(g)
+            _, s_times, _ = g.batch()
+            self.assertEqual(len(s_times), len(times))
+            self.assertGreater(s_times[1], times[1])
+            self.assertAlmostEqual(g.total_time_s(),
+                                   trapezoid.total_time_s()
+                                   + 0.5 * trapezoid.acceleration_time_s)
+            self.assertLess(s_times[-1], g.total_time_s())
+            joined = PulseGeneratorLinear(Coordinates(10, 3, 0, 1), self.v,
+                                          300, 100)
+            self.__check_batch_approximately(joined)
+            for g in (g, joined):
+                total = g.total_time_s()
+                for i in range(0, 101):
+                    t = total * i / 100.0
+                    pt, _ = g._to_pseudo_time(t)
+                    self.assertAlmostEqual(g._to_accelerated_time(pt), t)
+            self.__check_batch_approximately(PulseGeneratorCircular(
+                Coordinates(0, 20, 0, 0), Coordinates(-10, 10, 0, 0),
+                PLANE_XY, CW, self.v))
+        finally:
+            PulseGenerator.S_CURVE_JERK_RATIO = S_CURVE_JERK_RATIO
+
+    def test_s_curve_acceleration(self):
+        # acceleration of each axis, which is found from pulses, doesn't
+        # exceed its limit with S-curve
+        limits = (MAX_ACCELERATION_MM_PER_S2_X, MAX_ACCELERATION_MM_PER_S2_Y,
+                  MAX_ACCELERATION_MM_PER_S2_Z, MAX_ACCELERATION_MM_PER_S2_E)
+        pulses_per_mm = (STEPPER_PULSES_PER_MM_X, STEPPER_PULSES_PER_MM_Y,
+                         STEPPER_PULSES_PER_MM_Z, STEPPER_PULSES_PER_MM_E)
+        masks = (AXIS_MASK_X, AXIS_MASK_Y, AXIS_MASK_Z, AXIS_MASK_E)
+        PulseGenerator.S_CURVE_JERK_RATIO = 0.5
+        try:
+            for delta, entry in ((Coordinates(20, 5, 0, 0), 0),
+                                 (Coordinates(10, 0, 3, 0), 0),
+                                 (Coordinates(20, 10, 0, 2), 1500)):
+                g = PulseGeneratorLinear(delta, 6000, entry, entry / 2)
+                _, times, pulses = g.batch()
+                peak = [0.0, 0.0, 0.0, 0.0]
+                for axis in range(0, 4):
+                    t = list(time for time, mask in zip(times, pulses)
+                             if mask & masks[axis])
+                    # velocity between pulses at the middle of them
+                    v = list((1.0 / pulses_per_mm[axis] / (t[i] - t[i - 1]),
+                              (t[i] + t[i - 1]) / 2.0)
+                             for i in range(1, len(t)))
+                    for i in range(1, len(v)):
+                        a = (v[i][0] - v[i - 1][0]) / (v[i][1] - v[i - 1][1])
+                        peak[axis] = max(peak[axis], abs(a))
+                    self.assertLessEqual(peak[axis], limits[axis] * 1.01)
+                self.assertGreater(max(peak), 0.95 * min(limits))
+        finally:
+            PulseGenerator.S_CURVE_JERK_RATIO = S_CURVE_JERK_RATIO
+
+    def __chunks(self, g, size):
+        pulses = []
+        directions = []
+        for chunk_directions, times_us, masks in g.chunks(size):
+            self.assertLessEqual(len(times_us), size)
+            self.assertEqual(len(times_us), len(masks))
+            for i, d in chunk_directions:
+                self.assertLessEqual(i, len(times_us))
+                directions.append((len(pulses) + i, d))
+            pulses.extend(zip(list(times_us), list(masks)))
+        return directions, pulses
+
+    def test_chunks(self):
+        # Check if chunks contain the same pulses and directions as batch
+        # calculation, with and without NumPy.
+        g = PulseGeneratorLinear(Coordinates(-2, 1, 0.5, -1), self.v)
+        directions, times, masks = g.batch()
+        expected = list((int(round(t * TICKS_IN_SECONDS)), m)
+                        for t, m in zip(times, masks))
+        numpy = cnc.pulses.numpy
+        try:
+            for np in (numpy, None):
+                cnc.pulses.numpy = np
+                for size in (1, 3, 1000, PulseGenerator.CHUNK_SIZE):
+                    d, p = self.__chunks(g, size)
+                    self.assertEqual(d, directions)
+                    self.assertEqual(p, expected)
+        finally:
+            cnc.pulses.numpy = numpy
+
+    def test_dda(self):
+        # Pulses of the main axis are at the same time within one tick,
+        # other axises make the same number of pulses together with it, with
+        # and without NumPy.
+        numpy = cnc.pulses.numpy
+        try:
+            for np in (numpy, None):
+                cnc.pulses.numpy = np
+                for delta, entry, exit in (
+                        (Coordinates(10, -3, 0.5, 1), 0, 0),
+                        (Coordinates(-7, 3, 0.5, 1), 0, 400),
+                        (Coordinates(1, -2, 3, -4), 300, 100),
+                        (Coordinates(0.01, 0, 0, 0), 0, 0)):
+                    g = PulseGeneratorLinear(delta, self.v, entry, exit)
+                    _, expected = self.__chunks(g, 1000000)
+                    directions, pulses = self.__chunks(g, 100)
+                    self.assertEqual(directions,
+                                     self.__chunks(g, 1000000)[0])
+                    totals = (g._total_pulses_x, g._total_pulses_y,
+                              g._total_pulses_z, g._total_pulses_e)
+                    main = (AXIS_MASK_X, AXIS_MASK_Y, AXIS_MASK_Z,
+                            AXIS_MASK_E)[totals.index(max(totals))]
+                    g.LINEAR_DDA = True
+                    self.assertEqual(self.__chunks(g, 100)[0], directions)
+                    _, dda = self.__chunks(g, 100)
+                    self.assertEqual(dda, self.__chunks(g, 7)[1])
+                    self.assertEqual(len(dda), max(totals))
+                    for bit, total in zip((AXIS_MASK_X, AXIS_MASK_Y,
+                                           AXIS_MASK_Z, AXIS_MASK_E),
+                                          totals):
+                        self.assertEqual(sum(1 for _, m in dda if m & bit),
+                                         total)
+                    times = list(t for t, m in expected if m & main)
+                    for (t, m), e in zip(dda, times):
+                        self.assertEqual(m & main, main)
+                        self.assertLessEqual(abs(t - e), 1)
+                    hal_virtual.move(g)
+        finally:
+            cnc.pulses.numpy = numpy
+
+    def test_retiming(self):
+        # Brake in the middle of movement and accelerate again from stop,
+        # with and without NumPy.
+        v = 1000.0
+        g = PulseGeneratorLinear(Coordinates(20, 0, 0, 0), v)
+        _, times, _ = g.batch()
+        times = list(int(round(t * TICKS_IN_SECONDS)) for t in times)
+        middle = len(times) // 2
+        step = 60.0 / v / STEPPER_PULSES_PER_MM_X * TICKS_IN_SECONDS
+        # braking distance with the maximum acceleration
+        distance = ((v / 60.0) ** 2 / 2.0 / MAX_ACCELERATION_MM_PER_S2_X
+                    * STEPPER_PULSES_PER_MM_X)
+        numpy = cnc.pulses.numpy
+        try:
+            for np in (numpy, None):
+                cnc.pulses.numpy = np
+                rest = times[middle + 1:]
+                if np is not None:
+                    rest = np.array(rest)
+                r = Retiming(g, times[middle], 0, True)
+                braking = list(r.retime(rest))
+                self.assertTrue(r.stopped)
+                self.assertIsNone(r.finish())
+                self.assertAlmostEqual(len(braking), distance, delta=1)
+                braking.insert(0, 0)
+                d = list(braking[i] - braking[i - 1]
+                         for i in range(1, len(braking)))
+                self.assertEqual(d, sorted(d))
+                self.assertAlmostEqual(d[0], step, delta=step * 0.2)
+                r = Retiming(g, times[middle], 0, False, 0.0)
+                accelerating = list(r.retime(rest))
+                self.assertFalse(r.stopped)
+                self.assertEqual(len(accelerating), len(rest))
+                self.assertGreater(accelerating[0], step * 2)
+                self.assertEqual(accelerating[-1] - accelerating[-2],
+                                 rest[-1] - rest[-2])
+                self.assertGreater(r.finish(), accelerating[-1])
+        finally:
+            cnc.pulses.numpy = numpy
+
 
 if __name__ == '__main__':
     unittest.main()
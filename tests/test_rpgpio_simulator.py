@@ -0,0 +1,290 @@
+import os
+import time
+import threading
+import unittest
+
+from cnc.pulses import *
+from cnc.config import *
+from cnc.coordinates import *
+# other tests should keep using virtual hal, so import it before simulator
+import cnc.hal
+os.environ["PYCNC_RPGPIO_SIMULATOR"] = "instant"
+try:
+    from cnc.hal_raspberry import rpgpio
+    from cnc.hal_raspberry import rpgpio_simulator
+    from cnc.hal_raspberry import hal
+finally:
+    del os.environ["PYCNC_RPGPIO_SIMULATOR"]
+
+
+class TestRPGPIOSimulator(unittest.TestCase):
+    def setUp(self):
+        self.engine = rpgpio_simulator.engine
+        self.engine.set_speed(rpgpio_simulator.INSTANT_SPEED)
+        self.engine.gpio_trace = []
+        self._dma = hal.dma
+        hal.init()
+
+    def tearDown(self):
+        # time could be stopped by test
+        self.engine.set_speed(rpgpio_simulator.INSTANT_SPEED)
+        hal.resume()
+        hal.join()
+        hal.dma = self._dma
+        self.engine.gpio_trace = None
+
+    def __trace(self, pins_mask):
+        # times of DMAGPIO pulses on pins
+        return list(t for c, t, set_mask, _ in self.engine.gpio_trace
+                    if c == rpgpio.DMAGPIO._DMA_CHANNEL
+                    and set_mask & pins_mask)
+
+    def test_pulses(self):
+        dma = rpgpio.DMAGPIO()
+        dma.add_pulses([10, 0, 50], [1, 2, 4], 5)
+        dma.add_delay(20)
+        dma.add_pulse(8, 1)
+        dma.run()
+        while dma.is_active():
+            pass
+        t = list(self.__trace(15))
+        self.assertEqual(len(t), 4)
+        # delays are paced with PWM FIFO, so only the last ones are exact,
+        # they are in ticks
+        self.assertAlmostEqual(t[3] - t[2], (5 + 20) / 4.0, delta=0.25)
+        self.assertTrue(t[0] < t[1] < t[2] < t[3])
+        self.assertEqual(hal.gpio.read(3), 0)  # pulse has finished
+        # resolution is set with PWM range
+        dma = rpgpio.DMAGPIO(10)
+        dma.add_delay(100)
+        dma.add_pulse(1, 2)
+        dma.add_delay(13)
+        dma.add_pulse(2, 2)
+        dma.run()
+        while dma.is_active():
+            pass
+        t = list(self.__trace(3))[-2:]
+        self.assertAlmostEqual(t[1] - t[0], 1.5, delta=0.1)
+        self.assertRaises(ValueError, rpgpio.DMAGPIO, 3)
+
+    def test_append(self):
+        # blocks which are added while DMA runs are linked to the running
+        # sequence, even if DMA has loaded its last block already, channel
+        # is paused meanwhile, but it's still active, and it runs each block
+        # once. Time is stopped, so DMA stays at the first block.
+        self.engine.set_speed(0)
+        dma = rpgpio.DMAGPIO()
+        dma.add_delay(4000)
+        dma.run_stream()
+        registers = dma._dma
+        active = []
+
+        class Registers(object):
+            # check channel state after each write to DMA registers
+            def read_int(self, address):
+                return registers.read_int(address)
+
+            def write_int(self, address, value):
+                registers.write_int(address, value)
+                active.append(dma.is_active())
+
+        dma._dma = Registers()
+        for _ in range(0, 50):
+            dma.add_pulses([2000], [1], 8)
+        dma._dma = registers
+        self.assertTrue(len(active) > 0)
+        self.assertTrue(all(active))
+        self.engine.set_speed(rpgpio_simulator.INSTANT_SPEED)
+        while dma.is_active():
+            pass
+        t = self.__trace(1)
+        self.assertEqual(len(t), 50)
+        for i in range(1, len(t)):
+            self.assertAlmostEqual(t[i] - t[i - 1], 502.0, delta=0.25)
+
+    def test_overwritten_tail(self):
+        # blocks which take the place of the finished sequence, including its
+        # last block, aren't linked to it
+        rpgpio.DMAGPIO._DMA_MEMORY_SIZE = 64 * 1024
+        try:
+            dma = rpgpio.DMAGPIO()
+        finally:
+            rpgpio.DMAGPIO._DMA_MEMORY_SIZE = self._dma._DMA_MEMORY_SIZE
+        for _ in range(0, 2):
+            dma.add_pulses([4] * 400, [1] * 400, 4)
+            dma.run_stream()
+        while dma.is_active():
+            pass
+        self.assertEqual(len(self.__trace(1)), 800)
+
+    def test_wrap_around(self):
+        # blocks aren't written over the blocks which DMA hasn't run yet when
+        # buffer wraps around
+        self.engine.set_speed(1.0)
+        rpgpio.DMAGPIO._DMA_MEMORY_SIZE = 64 * 1024
+        try:
+            dma = rpgpio.DMAGPIO()
+        finally:
+            rpgpio.DMAGPIO._DMA_MEMORY_SIZE = self._dma._DMA_MEMORY_SIZE
+        dma.add_pulses([40] * 300, [1] * 300, 4)
+        dma.run_stream()
+        for _ in range(0, 4):
+            dma.add_pulses([40] * 200, [1] * 200, 4)
+        # DMA could have run all blocks before the last ones were added
+        dma.run_stream()
+        while dma.is_active():
+            pass
+        self.assertEqual(len(self.__trace(1)), 1100)
+
+    def test_move(self):
+        # pulses from hal are the same as from generator
+        g = PulseGeneratorLinear(Coordinates(5, 0, 0, 0), 1000)
+        hal.move(g)
+        hal.join()
+        t = self.__trace(hal.STEP_PIN_MASK_X)
+        expected = []
+        for _, ticks, _ in g.chunks():
+            expected.extend(float(k) / STEPPER_TICKS_PER_US for k in ticks)
+        self.assertEqual(len(t), len(expected))
+        # intervals are not rounded to microseconds
+        self.assertNotEqual(expected, list(round(e) for e in expected))
+        for i in range(2, len(t)):
+            self.assertAlmostEqual(t[i] - t[i - 1],
+                                   expected[i] - expected[i - 1],
+                                   delta=0.5 / STEPPER_TICKS_PER_US)
+
+    def test_ring_buffer(self):
+        # movement which is bigger then buffer
+        rpgpio.DMAGPIO._DMA_MEMORY_SIZE = 1024 * 1024
+        try:
+            hal.dma = rpgpio.DMAGPIO()
+        finally:
+            rpgpio.DMAGPIO._DMA_MEMORY_SIZE = self._dma._DMA_MEMORY_SIZE
+        g = PulseGeneratorLinear(Coordinates(100, 0, 0, 0), 6000)
+        hal.move(g)
+        hal.move(g)
+        hal.join()
+        self.assertLess(hal.dma.current_address(), 1024 * 1024)
+        self.assertEqual(len(self.__trace(hal.STEP_PIN_MASK_X)),
+                         2 * 100 * STEPPER_PULSES_PER_MM_X)
+
+    def test_continuous(self):
+        # the next movement starts right after the previous one
+        self.engine.set_speed(1.0)
+        g = PulseGeneratorLinear(Coordinates(0.5, 0, 0, 0), 1000,
+                                 exit_velocity_mm_per_min=1000)
+        hal.move(g)
+        self.assertTrue(hal.dma.is_active())
+        n = PulseGeneratorLinear(Coordinates(0.5, 0, 0, 0), 1000,
+                                 entry_velocity_mm_per_min=1000)
+        hal.move(n)
+        hal.join()
+        t = self.__trace(hal.STEP_PIN_MASK_X)
+        self.assertEqual(len(t), STEPPER_PULSES_PER_MM_X)
+        step = 60.0 / 1000 / STEPPER_PULSES_PER_MM_X * US_IN_SECONDS
+        middle = len(t) // 2
+        self.assertAlmostEqual(t[middle] - t[middle - 1], step, delta=1)
+
+    def test_hold(self):
+        # machine brakes in the middle of movement and continues from the
+        # same point after resume
+        self.engine.set_speed(1.0)
+        g = PulseGeneratorLinear(Coordinates(20, 0, 0, 0), 1000)
+        hal.move(g)
+        time.sleep(0.4)
+        hal.hold()
+        time.sleep(0.2)
+        self.assertFalse(hal.dma.is_active())
+        t = self.__trace(hal.STEP_PIN_MASK_X)
+        self.assertLess(len(t), 20 * STEPPER_PULSES_PER_MM_X)
+        step = 60.0 / 1000 / STEPPER_PULSES_PER_MM_X * US_IN_SECONDS
+        self.assertAlmostEqual(t[-10] - t[-11], step, delta=1)
+        d = list(t[i] - t[i - 1] for i in range(len(t) - 4, len(t)))
+        self.assertEqual(d, sorted(d))
+        self.assertGreater(d[-1], step * 1.5)
+        stopped = len(t)
+        hal.resume()
+        hal.join()
+        t = self.__trace(hal.STEP_PIN_MASK_X)
+        self.assertEqual(len(t), 20 * STEPPER_PULSES_PER_MM_X)
+        # accelerates again
+        self.assertGreater(t[stopped + 1] - t[stopped], step * 1.5)
+        self.assertAlmostEqual(t[stopped + 100] - t[stopped + 99], step,
+                               delta=1)
+
+    def test_hold_full_buffer(self):
+        # feed hold and position don't wait till movement which is blocked
+        # by full DMA buffer is uploaded
+        self.engine.set_speed(1.0)
+        rpgpio.DMAGPIO._DMA_MEMORY_SIZE = 64 * 1024
+        try:
+            hal.dma = rpgpio.DMAGPIO(STEPPER_TICKS_PER_US)
+        finally:
+            rpgpio.DMAGPIO._DMA_MEMORY_SIZE = self._dma._DMA_MEMORY_SIZE
+        g = PulseGeneratorLinear(Coordinates(20, 0, 0, 0), 1000)
+        g.CHUNK_SIZE = 200
+        thread = threading.Thread(target=hal.move, args=(g,))
+        thread.start()
+        time.sleep(0.3)
+        self.assertTrue(thread.is_alive())
+        st = time.time()
+        hal.get_position()
+        hal.hold()
+        self.assertLess(time.time() - st, 0.1)
+        time.sleep(0.2)
+        self.assertFalse(hal.dma.is_active())
+        self.assertLess(len(self.__trace(hal.STEP_PIN_MASK_X)),
+                        20 * STEPPER_PULSES_PER_MM_X)
+        hal.resume()
+        thread.join()
+        hal.join()
+        self.assertEqual(len(self.__trace(hal.STEP_PIN_MASK_X)),
+                         20 * STEPPER_PULSES_PER_MM_X)
+
+    def test_resume_braking(self):
+        # resume waits till braking is finished without blocking position
+        self.engine.set_speed(1.0)
+        g = PulseGeneratorLinear(Coordinates(20, 0, 0, 0), 1000)
+        hal.move(g)
+        time.sleep(0.4)
+        hal.hold()
+        self.engine.set_speed(0)
+        self.assertTrue(hal.dma.is_active())
+        thread = threading.Thread(target=hal.resume)
+        thread.start()
+        time.sleep(0.1)
+        self.assertTrue(thread.is_alive())
+        st = time.time()
+        hal.get_position()
+        self.assertLess(time.time() - st, 0.1)
+        self.engine.set_speed(1.0)
+        thread.join()
+        hal.join()
+        self.assertEqual(len(self.__trace(hal.STEP_PIN_MASK_X)),
+                         20 * STEPPER_PULSES_PER_MM_X)
+
+    def test_position(self):
+        # position is counted in the middle of movement
+        self.engine.set_speed(1.0)
+        start = hal.get_position()
+        g = PulseGeneratorLinear(Coordinates(10, -5, 0, 0), 1000)
+        hal.move(g)
+        time.sleep(0.2)
+        p = hal.get_position() - start
+        self.assertTrue(0 < p.x < 10)
+        self.assertAlmostEqual(p.y, -p.x / 2, delta=0.011)
+        time.sleep(0.1)
+        self.assertGreater((hal.get_position() - start).x, p.x)
+        hal.hold()
+        time.sleep(0.2)
+        p = hal.get_position() - start
+        t = self.__trace(hal.STEP_PIN_MASK_X)
+        self.assertEqual(p.x, float(len(t)) / STEPPER_PULSES_PER_MM_X)
+        hal.resume()
+        hal.join()
+        self.assertEqual(hal.get_position() - start,
+                         Coordinates(10, -5, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import io
+import unittest
+
+from cnc.runner import *
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+
+
+class TestFileRunner(unittest.TestCase):
+    def setUp(self):
+        self.machine = GMachine()
+        self.output = io.StringIO()
+
+    def tearDown(self):
+        pass
+
+    def test_run(self):
+        r = FileRunner(self.machine, output=self.output)
+        self.assertTrue(r.run([u"G1X1F1000\n", u"M114\n", u"G1X2"]))
+        self.assertEqual(self.output.getvalue().splitlines(),
+                         ["> G1X1F1000", "OK", "> M114",
+                          "OK X:1.0 Y:0.0 Z:0.0 E:0.0", "> G1X2", "OK"])
+        self.assertEqual(r.lines, 3)
+        self.assertEqual(self.machine.position().x, 2)
+        self.assertIn("3 lines", r.report())
+
+    def test_quiet(self):
+        r = FileRunner(self.machine, quiet=True, output=self.output)
+        r.OUTPUT_BATCH_SIZE = 2
+        self.assertTrue(r.run(["G91"] + ["G1X1F1000", "M114"] * 3))
+        self.assertEqual(self.output.getvalue().splitlines(),
+                         ["OK X:1.0 Y:0.0 Z:0.0 E:0.0",
+                          "OK X:2.0 Y:0.0 Z:0.0 E:0.0",
+                          "OK X:3.0 Y:0.0 Z:0.0 E:0.0"])
+
+    def test_errors(self):
+        # parse error stops at the right line
+        r = FileRunner(self.machine, quiet=True, output=self.output)
+        self.assertFalse(r.run(["G1X1F1000", "G1X2", "G1X+-1", "G1X3"]))
+        self.assertEqual(self.output.getvalue().splitlines()[0][:12],
+                         "ERROR line 3")
+        self.assertEqual(self.machine.position().x, 2)
+        # machine error
+        r = FileRunner(self.machine, quiet=True, output=self.output)
+        self.assertFalse(r.run(["G4"]))
+
+    def test_parsed(self):
+        parsed = list(GCode.parse_line(line)
+                      for line in ["G1X1F1000", "", "M114"])
+        r = FileRunner(self.machine, output=self.output)
+        self.assertTrue(r.run_parsed(parsed))
+        self.assertEqual(self.output.getvalue().splitlines(),
+                         ["> G1 F1000 X1", "OK", "> ", "OK", "> M114",
+                          "OK X:1.0 Y:0.0 Z:0.0 E:0.0"])
+
+    def test_bounded_queue(self):
+        r = FileRunner(self.machine, quiet=True, output=self.output)
+        r.QUEUE_SIZE = 3
+        self.assertTrue(r.run(["G91", "G1X0.01F1000"] + ["G1X0.01"] * 100))
+        self.assertLessEqual(r.max_queue_depth, 3)
+        self.assertEqual(r.lines, 102)
+
+
+if __name__ == '__main__':
+    unittest.main()
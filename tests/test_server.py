@@ -0,0 +1,132 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cnc import hal
+from cnc.gmachine import GMachine
+
+if sys.version_info[0] >= 3:
+    import asyncio
+    from cnc.server import *
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Python 3 is required")
+class TestGCodeServer(unittest.TestCase):
+    def setUp(self):
+        self.machine = GMachine()
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    @staticmethod
+    async def __send(reader, writer, line):
+        writer.write((line + '\n').encode('utf-8'))
+        return (await reader.readline()).decode('utf-8').strip()
+
+    def test_tcp(self):
+        async def run():
+            server = GCodeServer(self.machine)
+            host, port = await server.start_tcp('127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection(host, port)
+            answers = []
+            for line in ("G91", "G1 X1 F1000", "G1 X1", "M114", "X+-1",
+                         "M999", ""):
+                answers.append(await self.__send(reader, writer, line))
+            writer.close()
+            await server.close()
+            return answers
+        answers = asyncio.run(run())
+        self.assertEqual(answers[:4], ["ok", "ok", "ok",
+                                       "ok X:2.0 Y:0.0 Z:0.0 E:0.0"])
+        self.assertTrue(answers[4].startswith("error "))
+        self.assertEqual(answers[5:], ["error unknown command", "ok"])
+
+    def test_clients(self):
+        # one client streams, another one queries position
+        path = os.path.join(self._dir, "pycnc.sock")
+
+        async def stream(count):
+            reader, writer = await asyncio.open_unix_connection(path)
+            await self.__send(reader, writer, "G91")
+            for _ in range(0, count):
+                answer = await self.__send(reader, writer, "G1 X0.1 F1000")
+                self.assertEqual(answer, "ok")
+            writer.close()
+
+        async def query():
+            reader, writer = await asyncio.open_unix_connection(path)
+            answer = await self.__send(reader, writer, "M114")
+            writer.close()
+            return answer
+
+        async def run():
+            server = GCodeServer(self.machine)
+            await server.start_unix(path)
+            results = await asyncio.gather(stream(50), query(), query())
+            await server.close()
+            return results
+        results = asyncio.run(run())
+        self.assertTrue(results[1].startswith("ok X:"))
+        self.assertTrue(results[2].startswith("ok X:"))
+        self.assertAlmostEqual(self.machine.position().x, 5.0)
+
+    def test_realtime(self):
+        # status is answered while the same client waits for movements
+        release = threading.Event()
+        original = hal.move
+        hal.move = lambda generator: release.wait(5)
+
+        async def run():
+            server = GCodeServer(self.machine)
+            host, port = await server.start_tcp('127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(b"G1 X1 F1000\nM400\n?\n")
+            answers = [(await reader.readline()).decode('utf-8').strip()]
+            release.set()
+            for _ in range(0, 2):
+                answers.append(
+                    (await reader.readline()).decode('utf-8').strip())
+            writer.close()
+            await server.close()
+            return answers
+        try:
+            answers = asyncio.run(run())
+        finally:
+            release.set()
+            hal.move = original
+        self.assertTrue(answers[0].startswith("ok <"))
+        self.assertEqual(answers[1:], ["ok", "ok"])
+
+    def test_disconnect(self):
+        # lines which are waiting are dropped when client disconnects
+        release = threading.Event()
+        original = hal.move
+        hal.move = lambda generator: release.wait(5)
+
+        async def run():
+            server = GCodeServer(self.machine)
+            host, port = await server.start_tcp('127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection(host, port)
+            await self.__send(reader, writer, "G91")
+            await self.__send(reader, writer, "G1 X1 F1000")
+            writer.write(b"M400\n" + b"G1 X1\n" * 5)
+            writer.close()
+            await asyncio.sleep(0.1)
+            release.set()
+            while server.clients > 0:
+                await asyncio.sleep(0.01)
+            await server.close()
+        try:
+            asyncio.run(run())
+        finally:
+            release.set()
+            hal.move = original
+        self.assertAlmostEqual(self.machine.position().x, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
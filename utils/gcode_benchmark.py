@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import os
+import re
+import sys
+import time
+
+cnc_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(cnc_dir)
+from cnc.gcode import GCode, GCodeException
+
+"""
+This executable module measures gcode parsing speed of tokenizer and of the
+previous regex based implementation. Lines are read from file which is
+passed as argument, or sample lines are used.
+"""
+
+# previous regex based implementation for comparison
+g_pattern = re.compile('([A-Z])([-+]?[0-9.]+)')
+clean_pattern = re.compile(r'\s+|\(.*?\)|;.*')
+
+
+def parse_regex(line):
+    line = re.sub(clean_pattern, '', line.upper())
+    if len(line) == 0 or line[0] == '%':
+        return None
+    m = g_pattern.findall(line)
+    if not m:
+        raise GCodeException('gcode not found')
+    if len(''.join(["%s%s" % i for i in m])) != len(line):
+        raise GCodeException('extra characters in line')
+    params = dict(m)
+    if len(params) != len(m):
+        raise GCodeException('duplicated gcode entries')
+    return dict((k, float(v)) for k, v in params.items())
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r') as f:
+            lines = f.readlines()
+    else:
+        lines = ["G1 X12.345 Y-67.89 E0.1234 F1800 ; move", "G0 X1 Y2 Z3",
+                 "M104 S200", "(comment) G1 X1.5", "G2 X10 Y10 I5 J0",
+                 "; comment"] * 20000
+    for name, parse in (("regex", parse_regex),
+                        ("tokenizer", GCode.parse_line)):
+        st = time.time()
+        for line in lines:
+            parse(line)
+        print("{}: {} lines per second".format(
+              name, int(len(lines) / (time.time() - st))))
+
+
+if __name__ == '__main__':
+    main()
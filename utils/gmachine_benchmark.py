@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+
+cnc_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(cnc_dir)
+from cnc import hal
+from cnc import logging_config
+from cnc.gcode import GCode
+from cnc.gmachine import GMachine
+
+"""
+This executable module measures how many commands per second GMachine
+processes, hal doesn't do anything, so only commands processing is measured.
+Number of commands can be passed as argument.
+"""
+
+
+def main():
+    for name in ('move', 'join', 'fan_control', 'spindle_control'):
+        setattr(hal, name, lambda *args: None)
+    logging_config.debug_disable()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    streams = (("M-heavy", ["M105", "M114", "M106 S255", "M107", "M82",
+                            "G90", "G21"]),
+               ("G1-heavy", ["G1 X0.5 Y0.5 F3000", "G1 X1 Y0.25",
+                             "G1 X0.25 Y1 E0.1", "X1 Y1"]))
+    for name, lines in streams:
+        gcodes = [GCode.parse_line(line) for line in lines]
+        gcodes = (gcodes * (count // len(gcodes) + 1))[:count]
+        m = GMachine()
+        st = time.time()
+        for gcode in gcodes:
+            m.do_command(gcode)
+        m.flush()
+        print("{}: {} commands per second".format(
+              name, int(count / (time.time() - st))))
+
+
+if __name__ == '__main__':
+    main()
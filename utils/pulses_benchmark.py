@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+import os
+import sys
+import math
+import time
+import collections
+
+cnc_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(cnc_dir)
+from cnc.config import *
+from cnc.coordinates import Coordinates
+from cnc.pulses import PulseGeneratorLinear, US_IN_SECONDS, numpy
+
+"""
+This executable module measures how fast time of pulses on acceleration and
+braking ramps is calculated by PulseGenerator, by the previous
+implementation which takes square root for each pulse and by interpolation
+in ramp tables.
+"""
+
+
+# previous implementation, square root is taken for each pulse
+def sqrt_per_pulse(g, pt_s):
+    t = math.sqrt(g._entry_time_s ** 2 + pt_s * g._2Vmax_per_a) \
+        - g._entry_time_s
+    if t <= g._acceleration_time_s:
+        return t
+    peak_time_s = g._entry_time_s + g._acceleration_time_s
+    t = g._acceleration_time_s + pt_s - ((peak_time_s ** 2
+                                          - g._entry_time_s ** 2)
+                                         / g._2Vmax_per_a)
+    bt = t - g._acceleration_time_s - g._linear_time_s
+    if bt <= 0:
+        return t
+    d = peak_time_s ** 2 - g._2Vmax_per_a * bt
+    if d > g._exit_time_s ** 2:
+        d = math.sqrt(d)
+    else:
+        d = g._exit_time_s
+    return g._acceleration_time_s + g._linear_time_s + (peak_time_s - d)
+
+
+def sqrt_per_pulse_array(g, pt_s):
+    t = numpy.sqrt(g._entry_time_s ** 2 + pt_s * g._2Vmax_per_a) \
+        - g._entry_time_s
+    rest = numpy.flatnonzero(t > g._acceleration_time_s)
+    peak_time_s = g._entry_time_s + g._acceleration_time_s
+    lt = g._acceleration_time_s + pt_s[rest] - ((peak_time_s ** 2
+                                                 - g._entry_time_s ** 2)
+                                                / g._2Vmax_per_a)
+    bt = lt - g._acceleration_time_s - g._linear_time_s
+    d = peak_time_s ** 2 - g._2Vmax_per_a * bt
+    exit2 = g._exit_time_s ** 2
+    d = numpy.where(d > exit2, numpy.sqrt(numpy.maximum(d, exit2)),
+                    g._exit_time_s)
+    t[rest] = numpy.where(bt <= 0, lt, (g._acceleration_time_s
+                                        + g._linear_time_s
+                                        + (peak_time_s - d)))
+    return t
+
+
+# ramp tables for quantized (Vmax, a), the least recently used table is
+# dropped, time of pulses on ramp is interpolated
+tables = collections.OrderedDict()
+
+
+def ramp_table(g, size=1024, count=16):
+    key = (round(g._2Vmax_per_a, 6), round(g._entry_time_s, 6),
+           round(g._acceleration_time_s, 6))
+    table = tables.pop(key, None)
+    if table is None:
+        step = g._pseudo_acceleration_s / (size - 1)
+        table = (step, [g._to_accelerated_time(i * step)
+                        for i in range(0, size)])
+        if len(tables) >= count:
+            tables.popitem(last=False)
+    tables[key] = table
+    return table
+
+
+def table_times(g, pt):
+    step, values = ramp_table(g)
+    result = []
+    for pt_s in pt:
+        if pt_s > g._pseudo_acceleration_s:
+            result.append(g._to_accelerated_time(pt_s))
+            continue
+        x = pt_s / step
+        i = min(int(x), len(values) - 2)
+        result.append(values[i] + (values[i + 1] - values[i]) * (x - i))
+    return result
+
+
+def table_times_array(g, pt):
+    step, values = ramp_table(g)
+    n = int(numpy.searchsorted(pt, g._pseudo_acceleration_s, 'right'))
+    t = numpy.interp(pt[:n], numpy.arange(len(values)) * step, values)
+    return numpy.concatenate((t, g._to_accelerated_time_array(pt[n:])))
+
+
+def measure(name, pulses, function):
+    st = time.time()
+    n = 0
+    while time.time() - st < 0.5:
+        function()
+        n += 1
+    print("  {}: {} pulses per second".format(
+          name, int(pulses * n / (time.time() - st))))
+
+
+def main():
+    for name, delta in (("short", Coordinates(0.5, 0.3, 0, 0.02)),
+                        ("long", Coordinates(100, 50, 0, 3))):
+        g = PulseGeneratorLinear(delta, MAX_VELOCITY_MM_PER_MIN_Y)
+        _, times, _ = g.batch()
+        pt = list(g._to_pseudo_time(t)[0] for t in times)
+        print("{} movement, {} pulses:".format(name, len(pt)))
+        measure("square root for each pulse", len(pt),
+                lambda: list(sqrt_per_pulse(g, p) for p in pt))
+        measure("ramp table", len(pt), lambda: table_times(g, pt))
+        measure("phases", len(pt),
+                lambda: list(g._to_accelerated_time(p) for p in pt))
+        print("  ramp table error: {} us".format(
+              max(abs(t - g._to_accelerated_time(p))
+                  for t, p in zip(table_times(g, pt), pt)) * US_IN_SECONDS))
+        if numpy is None:
+            continue
+        pt = numpy.array(pt)
+        measure("NumPy, square root for each pulse", len(pt),
+                lambda: sqrt_per_pulse_array(g, pt))
+        measure("NumPy, ramp table", len(pt),
+                lambda: table_times_array(g, pt))
+        measure("NumPy, phases", len(pt),
+                lambda: g._to_accelerated_time_array(pt))
+
+
+if __name__ == '__main__':
+    main()